@@ -0,0 +1,165 @@
+"""
+Avaliação de todas as carteiras numa moeda (USD, BRL, ...).
+
+    python -m api.jobs.avaliacao --moeda USD --saida valores.ndjson
+    python -m api.jobs.avaliacao --moeda BRL --bloco 5000 --resumo exposicao.json
+
+Lê SALDO_CARTEIRA (mais as fatias) por cursor do lado do servidor, em ordem
+de carteira, numa única transação: os saldos são um snapshot consistente,
+e as cotações vêm de um único snapshot da tabela de cotações. A cada bloco
+de carteiras os saldos viram uma coluna por moeda, e cada coluna é
+multiplicada pela cotação da sua moeda; só o bloco atual fica em memória.
+
+Saída: uma linha NDJSON por carteira ({endereco, valor}) e, no fim, a
+exposição por moeda (saldo somado e valor convertido).
+"""
+import sys
+import json
+import argparse
+from decimal import Decimal
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+from api.persistence.db import get_connection, executar_em_streaming
+from api.persistence.unit_of_work import UnidadeDeTrabalho
+from api.persistence.repositories.carteira_repository import CarteiraRepository, CASAS_DECIMAIS
+
+SQL_SALDOS = """
+    SELECT s.endereco_carteira, s.id_moeda, s.saldo + COALESCE(f.saldo, 0) AS saldo
+      FROM saldo_carteira s
+      LEFT JOIN (
+          SELECT endereco_carteira, id_moeda, SUM(saldo) AS saldo
+            FROM saldo_carteira_fatia
+           GROUP BY endereco_carteira, id_moeda
+      ) f ON f.endereco_carteira = s.endereco_carteira AND f.id_moeda = s.id_moeda
+     ORDER BY s.endereco_carteira, s.id_moeda
+"""
+
+
+class Bloco:
+    """Saldos de até `tamanho` carteiras, uma coluna (lista alinhada com `enderecos`) por moeda."""
+
+    def __init__(self, moedas: List[int]):
+        self.moedas = moedas
+        self.enderecos: List[str] = []
+        self.colunas: Dict[int, List[Decimal]] = {m: [] for m in moedas}
+
+    def adicionar(self, endereco: str, saldos: Dict[int, Decimal]):
+        self.enderecos.append(endereco)
+        for moeda, coluna in self.colunas.items():
+            coluna.append(saldos.get(moeda, Decimal("0")))
+
+    def __len__(self):
+        return len(self.enderecos)
+
+
+def carteiras(linhas: Iterator[Dict]) -> Iterator[Tuple[str, Dict[int, Decimal]]]:
+    """Agrupa as linhas (já em ordem de carteira) em {id_moeda: saldo} por carteira."""
+    atual: Optional[str] = None
+    saldos: Dict[int, Decimal] = {}
+    for r in linhas:
+        if r["endereco_carteira"] != atual:
+            if atual is not None:
+                yield atual, saldos
+            atual, saldos = r["endereco_carteira"], {}
+        saldos[r["id_moeda"]] = r["saldo"]
+    if atual is not None:
+        yield atual, saldos
+
+
+def blocos(linhas: Iterator[Dict], moedas: List[int], tamanho: int) -> Iterator[Bloco]:
+    bloco = Bloco(moedas)
+    for endereco, saldos in carteiras(linhas):
+        bloco.adicionar(endereco, saldos)
+        if len(bloco) == tamanho:
+            yield bloco
+            bloco = Bloco(moedas)
+    if len(bloco):
+        yield bloco
+
+
+class Avaliacao:
+    def __init__(self, moeda: str, cotacoes: Dict[int, Decimal], codigos: Dict[int, str]):
+        self.moeda = moeda
+        self.cotacoes = cotacoes
+        self.codigos = codigos
+        self.carteiras = 0
+        self.exposicao: Dict[int, Decimal] = {m: Decimal("0") for m in codigos}
+
+    def avaliar(self, bloco: Bloco) -> List[Decimal]:
+        """Valor de cada carteira do bloco: soma, coluna a coluna, de saldo × cotação."""
+        totais = [Decimal("0")] * len(bloco)
+        for moeda, coluna in bloco.colunas.items():
+            self.exposicao[moeda] += sum(coluna, Decimal("0"))
+            cotacao = self.cotacoes.get(moeda)
+            if cotacao is None:
+                if any(coluna):
+                    raise ValueError(f"Cotação {self.codigos[moeda]}/{self.moeda} indisponível")
+                continue
+            totais = [total + saldo * cotacao for total, saldo in zip(totais, coluna)]
+        self.carteiras += len(bloco)
+        return totais
+
+    def resumo(self) -> Dict:
+        exposicao = {
+            self.codigos[m]: {
+                "saldo": str(saldo),
+                "valor": str((saldo * self.cotacoes.get(m, Decimal("0"))).quantize(CASAS_DECIMAIS)),
+            }
+            for m, saldo in sorted(self.exposicao.items())
+        }
+        total = sum((saldo * self.cotacoes.get(m, Decimal("0")) for m, saldo in self.exposicao.items()), Decimal("0"))
+        return {
+            "moeda": self.moeda,
+            "carteiras": self.carteiras,
+            "valor_total": str(total.quantize(CASAS_DECIMAIS)),
+            "exposicao": exposicao,
+            "cotacoes": {self.codigos[m]: str(c) for m, c in sorted(self.cotacoes.items())},
+        }
+
+
+def avaliar_carteiras(moeda: str, saida: TextIO, tamanho_bloco: int = 1000) -> Dict:
+    # um snapshot de cotações para o job inteiro
+    with UnidadeDeTrabalho() as uow:
+        repo = CarteiraRepository(uow)
+        cotacoes = repo.vetor_cotacoes(moeda)
+        codigos = repo.listar_moedas()
+    avaliacao = Avaliacao(moeda, cotacoes, codigos)
+    inicio = datetime.now(timezone.utc)
+
+    with get_connection() as conn:
+        linhas = executar_em_streaming(conn, SQL_SALDOS, {}, tamanho_lote=tamanho_bloco)
+        for bloco in blocos(linhas, sorted(codigos), tamanho_bloco):
+            for endereco, valor in zip(bloco.enderecos, avaliacao.avaliar(bloco)):
+                saida.write(json.dumps({"endereco": endereco, "valor": str(valor.quantize(CASAS_DECIMAIS))}) + "\n")
+
+    resumo = avaliacao.resumo()
+    resumo["avaliado_em"] = inicio.isoformat(timespec="seconds")
+    return resumo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--moeda", default="USD")
+    parser.add_argument("--bloco", type=int, default=1000, help="carteiras por bloco (limita a memória)")
+    parser.add_argument("--saida", help="arquivo NDJSON por carteira (padrão: stdout)")
+    parser.add_argument("--resumo", help="arquivo JSON com a exposição por moeda (padrão: stderr)")
+    args = parser.parse_args()
+
+    saida = open(args.saida, "w", encoding="utf-8") if args.saida else sys.stdout
+    try:
+        resumo = avaliar_carteiras(args.moeda.upper(), saida, args.bloco)
+    finally:
+        if args.saida:
+            saida.close()
+
+    texto = json.dumps(resumo, indent=2, ensure_ascii=False)
+    if args.resumo:
+        with open(args.resumo, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    else:
+        print(texto, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Marca ou desmarca carteiras quentes (saldo em fatias).
+
+    python -m api.jobs.carteiras_quentes marcar <endereco> --fatias 16
+    python -m api.jobs.carteiras_quentes desmarcar <endereco>
+
+Os workers da API percebem a mudança em até CARTEIRAS_QUENTES_TTL_SEGUNDOS.
+"""
+import sys
+import argparse
+
+from api.persistence.unit_of_work import UnidadeDeTrabalho
+from api.persistence.repositories.carteira_repository import CarteiraRepository
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    marcar = comandos.add_parser("marcar", help="espalha os créditos da carteira em N fatias")
+    marcar.add_argument("endereco")
+    marcar.add_argument("--fatias", type=int, default=16)
+
+    desmarcar = comandos.add_parser("desmarcar", help="volta a carteira para uma linha de saldo")
+    desmarcar.add_argument("endereco")
+    args = parser.parse_args()
+
+    fatias = args.fatias if args.comando == "marcar" else 0
+    if args.comando == "marcar" and fatias < 2:
+        parser.error("--fatias precisa ser pelo menos 2")
+
+    with UnidadeDeTrabalho() as uow:
+        repo = CarteiraRepository(uow)
+        encontrada = uow.executar(lambda: repo.definir_fatias(args.endereco, fatias))
+    if not encontrada:
+        sys.exit(f"Carteira {args.endereco} não encontrada")
+    print(f"{args.endereco}: fatias_saldo = {fatias}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Manutenção das partições mensais das tabelas de movimentação.
+
+    python -m api.jobs.particoes manter --meses-a-frente 3
+    python -m api.jobs.particoes arquivar --meses-quentes 12
+    python -m api.jobs.particoes indexar
+
+`manter` quebra p_futuras em partições mensais até N meses à frente.
+`arquivar` exporta cada partição fechada há mais de `--meses-quentes` meses
+para ARQUIVO_DIR (NDJSON + gzip), registra no manifesto, confere a contagem
+e só então faz DROP PARTITION. Reexecutar depois de uma falha é seguro: uma
+partição já registrada no manifesto só é removida do banco.
+
+Junto de cada arquivo vai o índice dos endereços de carteira que têm linhas
+nele: o extrato só abre os arquivos da carteira pedida. `indexar` cria o
+índice das partições arquivadas antes dele existir.
+
+Precisa de um usuário com ALTER (o usuário da API só tem DML).
+"""
+import argparse
+import dataclasses
+from pathlib import Path
+from datetime import date, datetime, timezone
+from typing import List, NamedTuple, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from api.persistence.db import get_connection, executar_em_streaming
+from api.persistence.arquivo import (
+    COLUNAS_ENDERECO,
+    TABELAS_MOVIMENTACAO,
+    LeitorArquivo,
+    ParticaoArquivada,
+    caminho_enderecos,
+    escrever_enderecos,
+    escrever_particao,
+    ler_particao,
+)
+
+PARTICAO_FUTURAS = "p_futuras"
+
+
+class Particao(NamedTuple):
+    nome: str
+    ate: Optional[datetime]     # None = MAXVALUE
+    linhas_estimadas: int
+
+
+def _inicio_do_mes(d: date, meses: int = 0) -> date:
+    indice = d.year * 12 + d.month - 1 + meses
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def listar_particoes(conn: Connection, tabela: str) -> List[Particao]:
+    rows = conn.execute(
+        text("""
+            SELECT partition_name, partition_description, table_rows
+              FROM information_schema.partitions
+             WHERE table_schema = DATABASE()
+               AND LOWER(table_name) = :tabela
+               AND partition_name IS NOT NULL
+             ORDER BY partition_ordinal_position
+        """),
+        {"tabela": tabela}
+    ).all()
+
+    particoes = []
+    for nome, descricao, linhas in rows:
+        ate = None if descricao == "MAXVALUE" else datetime.fromisoformat(descricao.strip("'"))
+        particoes.append(Particao(nome, ate, linhas or 0))
+    return particoes
+
+
+def manter_particoes(meses_a_frente: int = 3, hoje: Optional[date] = None) -> List[str]:
+    """Cria as partições mensais que faltam até `meses_a_frente` meses depois do atual."""
+    hoje = hoje or date.today()
+    limite = _inicio_do_mes(hoje, meses_a_frente + 1)
+    criadas = []
+
+    for tabela in TABELAS_MOVIMENTACAO:
+        with get_connection() as conn:
+            particoes = listar_particoes(conn, tabela)
+            if not particoes:
+                raise RuntimeError(
+                    f"{tabela} não é particionada: aplique sql/migracoes/004_particionamento_mensal.sql"
+                )
+            fechadas = [p.ate.date() for p in particoes if p.ate is not None]
+            inicio = max(fechadas) if fechadas else _inicio_do_mes(hoje)
+
+            novas = []
+            while inicio < limite:
+                proximo = _inicio_do_mes(inicio, 1)
+                novas.append(f"PARTITION p{inicio:%Y%m} VALUES LESS THAN ('{proximo.isoformat()}')")
+                criadas.append(f"{tabela}.p{inicio:%Y%m}")
+                inicio = proximo
+            if not novas:
+                continue
+
+            # p_futuras normalmente está vazia: o REORGANIZE só move as linhas dela
+            conn.execute(text(f"""
+                ALTER TABLE {tabela}
+                REORGANIZE PARTITION {PARTICAO_FUTURAS} INTO (
+                    {", ".join(novas)},
+                    PARTITION {PARTICAO_FUTURAS} VALUES LESS THAN (MAXVALUE)
+                )
+            """))
+    return criadas
+
+
+def arquivar_particoes(
+    meses_quentes: int = 12,
+    leitor: Optional[LeitorArquivo] = None,
+    hoje: Optional[date] = None,
+    simular: bool = False,
+) -> List[ParticaoArquivada]:
+    """Exporta e remove as partições que terminam antes de `meses_quentes` meses atrás."""
+    leitor = leitor or LeitorArquivo()
+    corte = datetime.combine(_inicio_do_mes(hoje or date.today(), -meses_quentes), datetime.min.time())
+    arquivadas = []
+
+    for tabela, coluna_id in TABELAS_MOVIMENTACAO.items():
+        with get_connection() as conn:
+            candidatas = [p for p in listar_particoes(conn, tabela) if p.ate is not None and p.ate <= corte]
+
+        for particao in candidatas:
+            if simular:
+                print(f"{tabela}.{particao.nome}: ~{particao.linhas_estimadas} linhas até {particao.ate}")
+                continue
+
+            registro = leitor.manifesto.buscar(tabela, particao.nome)
+            if registro is None:
+                registro = _exportar(leitor, tabela, coluna_id, particao)
+                arquivadas.append(registro)
+
+            with get_connection() as conn:
+                conn.execute(text(f"ALTER TABLE {tabela} DROP PARTITION {particao.nome}"))
+    return arquivadas
+
+
+def _exportar(leitor: LeitorArquivo, tabela: str, coluna_id: str, particao: Particao) -> ParticaoArquivada:
+    # mesma ordem do extrato (decrescente), para o leitor intercalar sem ordenar
+    relativo = Path(tabela) / f"{particao.nome}_{particao.ate:%Y%m%d}.ndjson.gz"
+    enderecos: Set[str] = set()
+    with get_connection() as conn:
+        linhas, sha256 = escrever_particao(
+            leitor.diretorio / relativo,
+            executar_em_streaming(
+                conn,
+                f"SELECT * FROM {tabela} PARTITION ({particao.nome}) ORDER BY data_hora DESC, {coluna_id} DESC",
+                {},
+            ),
+            enderecos,
+        )
+    indice = caminho_enderecos(relativo.as_posix())
+    escrever_enderecos(leitor.diretorio / indice, enderecos)
+
+    with get_connection() as conn:
+        no_banco = conn.execute(text(f"SELECT COUNT(*) FROM {tabela} PARTITION ({particao.nome})")).scalar()
+    if no_banco != linhas:
+        raise RuntimeError(
+            f"{tabela}.{particao.nome}: {linhas} linhas exportadas, {no_banco} no banco; partição mantida"
+        )
+
+    registro = ParticaoArquivada(
+        tabela=tabela,
+        particao=particao.nome,
+        ate=particao.ate.isoformat(),
+        arquivo=relativo.as_posix(),
+        linhas=linhas,
+        sha256=sha256,
+        arquivada_em=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        enderecos=indice,
+    )
+    leitor.manifesto.registrar(registro)
+    return registro
+
+
+def indexar_arquivo(leitor: Optional[LeitorArquivo] = None) -> List[ParticaoArquivada]:
+    """Cria o índice de endereços das partições arquivadas que ainda não têm."""
+    leitor = leitor or LeitorArquivo()
+    indexadas = []
+    for registro in leitor.manifesto.carregar():
+        if registro.enderecos is not None:
+            continue
+        enderecos = {
+            linha[c]
+            for linha in ler_particao(leitor.diretorio / registro.arquivo)
+            for c in COLUNAS_ENDERECO
+            if linha.get(c) is not None
+        }
+        indice = caminho_enderecos(registro.arquivo)
+        escrever_enderecos(leitor.diretorio / indice, enderecos)
+        registro = dataclasses.replace(registro, enderecos=indice)
+        leitor.manifesto.registrar(registro)
+        indexadas.append(registro)
+    return indexadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    manter = comandos.add_parser("manter", help="cria as partições mensais dos próximos meses")
+    manter.add_argument("--meses-a-frente", type=int, default=3)
+
+    arquivar = comandos.add_parser("arquivar", help="exporta e remove partições antigas")
+    arquivar.add_argument("--meses-quentes", type=int, default=12)
+    arquivar.add_argument("--simular", action="store_true", help="só lista o que seria arquivado")
+
+    comandos.add_parser("indexar", help="cria o índice de endereços das partições já arquivadas")
+    args = parser.parse_args()
+
+    if args.comando == "manter":
+        for nome in manter_particoes(args.meses_a_frente):
+            print(f"criada {nome}")
+    elif args.comando == "indexar":
+        for registro in indexar_arquivo():
+            print(f"indexada {registro.tabela}.{registro.particao} -> {registro.enderecos}")
+    else:
+        for registro in arquivar_particoes(args.meses_quentes, simular=args.simular):
+            print(f"arquivada {registro.tabela}.{registro.particao}: {registro.linhas} linhas -> {registro.arquivo}")
+
+
+if __name__ == "__main__":
+    main()
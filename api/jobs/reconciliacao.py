@@ -0,0 +1,354 @@
+"""
+Reconciliação dos saldos com as tabelas de movimentação.
+
+    python -m api.jobs.reconciliacao --faixas 16 --processos 4
+    python -m api.jobs.reconciliacao --incremental --reparar
+
+Para cada (carteira, moeda), a soma das movimentações (depósitos, saques e
+suas taxas, conversões, transferências enviadas e recebidas, inclusive as
+das partições arquivadas) tem de ser igual a SALDO_CARTEIRA.saldo mais as
+fatias. Os endereços são divididos em faixas, processadas em paralelo num
+pool de processos; cada faixa lê saldos e movimentações no mesmo snapshot.
+
+As somas ficam no banco (RECONCILIACAO_SALDO) até o checkpoint de cada faixa:
+`--incremental` só lê as movimentações novas desde a última execução.
+`--reparar` corrige a linha principal de SALDO_CARTEIRA com a carteira
+travada. Sai com código 1 se sobrar divergência.
+"""
+import sys
+import json
+import argparse
+from decimal import Decimal
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from api.persistence.db import get_engine, get_connection, executar_em_streaming
+from api.persistence.arquivo import LeitorArquivo, ler_particao
+
+# efeito de cada tabela no saldo: (tabela, coluna do endereço, coluna da moeda, valor com sinal)
+RAMOS_RAZAO = [
+    ("deposito_saque", "endereco_carteira", "id_moeda",
+     "CASE tipo WHEN 'DEPOSITO' THEN valor ELSE -(valor + taxa_valor) END"),
+    ("conversao", "endereco_carteira", "id_moeda_origem", "-valor_origem"),
+    ("conversao", "endereco_carteira", "id_moeda_destino", "valor_destino"),
+    ("transferencia", "endereco_origem", "id_moeda", "-(valor + taxa_valor)"),
+    ("transferencia", "endereco_destino", "id_moeda", "valor"),
+]
+
+Par = Tuple[str, int]
+
+
+class Faixa(NamedTuple):
+    inicio: Optional[str]       # None = sem limite inferior
+    fim: Optional[str]          # None = sem limite superior (exclusivo)
+
+    def contem(self, endereco: str) -> bool:
+        return (self.inicio is None or endereco >= self.inicio) and (self.fim is None or endereco < self.fim)
+
+
+class Divergencia(NamedTuple):
+    endereco: str
+    id_moeda: int
+    saldo: Optional[Decimal]    # None = movimentação sem linha em SALDO_CARTEIRA
+    esperado: Decimal
+    reparada: bool = False
+
+
+class ResultadoFaixa(NamedTuple):
+    faixa: Faixa
+    pares: int
+    divergencias: List[Divergencia]
+
+
+def dividir_faixas(quantidade: int) -> List[Faixa]:
+    """Faixas contíguas do espaço de endereços (hex), pelos 4 primeiros dígitos."""
+    limites: List[Optional[str]] = [format(i * 16 ** 4 // quantidade, "04x") for i in range(1, quantidade)]
+    limites = [None, *limites, None]
+    return [Faixa(limites[i], limites[i + 1]) for i in range(quantidade)]
+
+
+def _condicoes(coluna: str, faixa: Faixa, de: Optional[datetime], ate: Optional[datetime],
+               endereco: Optional[str] = None) -> str:
+    condicoes = []
+    if endereco is not None:
+        condicoes.append(f"{coluna} = :endereco")
+    if faixa.inicio is not None:
+        condicoes.append(f"{coluna} >= :inicio")
+    if faixa.fim is not None:
+        condicoes.append(f"{coluna} < :fim")
+    if de is not None:
+        condicoes.append("data_hora >= :de")
+    if ate is not None:
+        condicoes.append("data_hora < :ate")
+    return f" WHERE {' AND '.join(condicoes)}" if condicoes else ""
+
+
+def sql_movimentacoes(faixa: Faixa, de: Optional[datetime], ate: Optional[datetime],
+                      endereco: Optional[str] = None) -> str:
+    """
+    Soma com sinal por (endereco, id_moeda) no intervalo [de, ate) de data_hora.
+    A soma é feita no MySQL, em DECIMAL exato, e só os totais por par
+    trafegam; o filtro de data_hora descarta as partições fora do intervalo.
+    """
+    ramos = [
+        f"SELECT {coluna_endereco} AS endereco, {coluna_moeda} AS id_moeda, {efeito} AS valor "
+        f"FROM {tabela}{_condicoes(coluna_endereco, faixa, de, ate, endereco)}"
+        for tabela, coluna_endereco, coluna_moeda, efeito in RAMOS_RAZAO
+    ]
+    return f"""
+        SELECT endereco, id_moeda, SUM(valor) AS valor
+          FROM ({" UNION ALL ".join(ramos)}) m
+         GROUP BY endereco, id_moeda
+    """
+
+
+def _somar(totais: Dict[Par, Decimal], linhas: Iterator[Dict[str, Any]]):
+    for r in linhas:
+        par = (r["endereco"], r["id_moeda"])
+        totais[par] = totais.get(par, Decimal("0")) + r["valor"]
+
+
+def _efeitos_arquivados(tabela: str, r: Dict[str, Any]) -> Iterator[Tuple[str, int, Decimal]]:
+    # mesmas regras de RAMOS_RAZAO, sobre as linhas dos arquivos
+    if tabela == "deposito_saque":
+        valor = r["valor"] if r["tipo"] == "DEPOSITO" else -(r["valor"] + r["taxa_valor"])
+        yield r["endereco_carteira"], r["id_moeda"], valor
+    elif tabela == "conversao":
+        yield r["endereco_carteira"], r["id_moeda_origem"], -r["valor_origem"]
+        yield r["endereco_carteira"], r["id_moeda_destino"], r["valor_destino"]
+    elif tabela == "transferencia":
+        yield r["endereco_origem"], r["id_moeda"], -(r["valor"] + r["taxa_valor"])
+        yield r["endereco_destino"], r["id_moeda"], r["valor"]
+
+
+def somar_arquivo(leitor: LeitorArquivo, faixa: Faixa) -> Dict[Par, Decimal]:
+    totais: Dict[Par, Decimal] = {}
+    for particao in leitor.manifesto.carregar():
+        for linha in ler_particao(leitor.diretorio / particao.arquivo):
+            for endereco, moeda, valor in _efeitos_arquivados(particao.tabela, linha):
+                if faixa.contem(endereco):
+                    totais[(endereco, moeda)] = totais.get((endereco, moeda), Decimal("0")) + valor
+    return totais
+
+
+def _parametros(faixa: Faixa, **extras) -> Dict[str, Any]:
+    return {"inicio": faixa.inicio, "fim": faixa.fim, **extras}
+
+
+def _saldos(conn: Connection, faixa: Faixa) -> Dict[Par, Decimal]:
+    sql = f"""
+        SELECT s.endereco_carteira AS endereco, s.id_moeda, s.saldo + COALESCE(SUM(f.saldo), 0) AS valor
+          FROM saldo_carteira s
+          LEFT JOIN saldo_carteira_fatia f
+            ON f.endereco_carteira = s.endereco_carteira
+           AND f.id_moeda = s.id_moeda
+         {_condicoes("s.endereco_carteira", faixa, None, None)}
+         GROUP BY s.endereco_carteira, s.id_moeda, s.saldo
+    """
+    saldos: Dict[Par, Decimal] = {}
+    _somar(saldos, executar_em_streaming(conn, sql, _parametros(faixa)))
+    return saldos
+
+
+def _checkpoint(conn: Connection, faixa: Faixa) -> Optional[datetime]:
+    row = conn.execute(
+        text("SELECT fim, processado_ate FROM reconciliacao_faixa WHERE inicio = :inicio FOR UPDATE"),
+        {"inicio": faixa.inicio or ""}
+    ).first()
+    if row is None or row.fim != faixa.fim:
+        return None
+    return row.processado_ate
+
+
+def _gravar_totais(conn: Connection, faixa: Faixa, totais: Dict[Par, Decimal], substituir: bool):
+    if substituir:
+        conn.execute(
+            text(f"DELETE FROM reconciliacao_saldo{_condicoes('endereco_carteira', faixa, None, None)}"),
+            _parametros(faixa)
+        )
+    linhas = [{"endereco": e, "moeda": m, "total": t} for (e, m), t in totais.items()]
+    for i in range(0, len(linhas), 1000):
+        conn.execute(
+            text("""
+                INSERT INTO reconciliacao_saldo (endereco_carteira, id_moeda, total)
+                VALUES (:endereco, :moeda, :total)
+                ON DUPLICATE KEY UPDATE total = total + VALUES(total)
+            """),
+            linhas[i:i + 1000]
+        )
+
+
+def _gravar_checkpoint(conn: Connection, faixa: Faixa, corte: datetime):
+    conn.execute(
+        text("""
+            INSERT INTO reconciliacao_faixa (inicio, fim, processado_ate)
+            VALUES (:inicio, :fim, :corte)
+            ON DUPLICATE KEY UPDATE fim = VALUES(fim), processado_ate = VALUES(processado_ate)
+        """),
+        {"inicio": faixa.inicio or "", "fim": faixa.fim, "corte": corte}
+    )
+
+
+def reconciliar_faixa(faixa: Faixa, corte: datetime, incremental: bool, reparar: bool,
+                      tolerancia: Decimal) -> ResultadoFaixa:
+    """
+    Roda num processo do pool. Na mesma transação (um snapshot só): lê o
+    checkpoint e as somas gravadas, soma as movimentações até `corte` (que
+    passam a fazer parte do checkpoint) e as posteriores, e lê os saldos.
+    """
+    leitor = LeitorArquivo()
+    with get_connection() as conn:
+        processado_ate = _checkpoint(conn, faixa) if incremental else None
+        if incremental and processado_ate is None:
+            raise RuntimeError(f"Faixa {faixa} sem checkpoint: rode uma vez sem --incremental")
+        if processado_ate is not None and any(
+            datetime.fromisoformat(p.ate) > processado_ate for p in leitor.manifesto.carregar()
+        ):
+            raise RuntimeError("Partição arquivada depois do checkpoint: rode sem --incremental")
+
+        if processado_ate is None:
+            novos = somar_arquivo(leitor, faixa)
+        else:
+            novos = {}
+        _somar(novos, executar_em_streaming(
+            conn, sql_movimentacoes(faixa, processado_ate, corte), _parametros(faixa, de=processado_ate, ate=corte)
+        ))
+
+        esperados: Dict[Par, Decimal] = {}
+        if processado_ate is not None:
+            _somar(esperados, executar_em_streaming(
+                conn,
+                f"SELECT endereco_carteira AS endereco, id_moeda, total AS valor FROM reconciliacao_saldo"
+                f"{_condicoes('endereco_carteira', faixa, None, None)}",
+                _parametros(faixa),
+            ))
+        for par, valor in novos.items():
+            esperados[par] = esperados.get(par, Decimal("0")) + valor
+        _somar(esperados, executar_em_streaming(
+            conn, sql_movimentacoes(faixa, corte, None), _parametros(faixa, de=corte)
+        ))
+        saldos = _saldos(conn, faixa)
+
+        _gravar_totais(conn, faixa, novos, substituir=processado_ate is None)
+        _gravar_checkpoint(conn, faixa, corte)
+
+    divergencias = []
+    for par in sorted(esperados.keys() | saldos.keys()):
+        esperado = esperados.get(par, Decimal("0"))
+        saldo = saldos.get(par)
+        if abs((Decimal("0") if saldo is None else saldo) - esperado) <= tolerancia:
+            continue
+        divergencia = Divergencia(par[0], par[1], saldo, esperado)
+        if reparar and saldo is not None:
+            divergencia = reparar_saldo(par, corte, tolerancia)
+        if divergencia is not None:
+            divergencias.append(divergencia)
+    return ResultadoFaixa(faixa, len(esperados.keys() | saldos.keys()), divergencias)
+
+
+def reparar_saldo(par: Par, corte: datetime, tolerancia: Decimal) -> Optional[Divergencia]:
+    """
+    Trava a linha de saldo (e as fatias), recalcula o esperado com o que foi
+    commitado até agora e acerta a linha principal. Quem movimenta o par
+    precisa da mesma trava, então nada muda no meio do cálculo.
+    None se, com a trava, a diferença já não existe.
+    """
+    endereco, moeda = par
+    params = {"endereco": endereco, "moeda": moeda}
+    with get_engine().connect().execution_options(isolation_level="READ COMMITTED") as conn:
+        with conn.begin():
+            saldo = conn.execute(
+                text("""
+                    SELECT saldo FROM saldo_carteira
+                    WHERE endereco_carteira = :endereco AND id_moeda = :moeda
+                    FOR UPDATE
+                """),
+                params
+            ).scalar()
+            fatias = conn.execute(
+                text("""
+                    SELECT COALESCE(SUM(saldo), 0) FROM saldo_carteira_fatia
+                    WHERE endereco_carteira = :endereco AND id_moeda = :moeda
+                    FOR UPDATE
+                """),
+                params
+            ).scalar()
+            esperado = conn.execute(
+                text("SELECT total FROM reconciliacao_saldo WHERE endereco_carteira = :endereco AND id_moeda = :moeda"),
+                params
+            ).scalar() or Decimal("0")
+            for r in conn.execute(
+                text(sql_movimentacoes(Faixa(None, None), corte, None, endereco)),
+                {**params, "de": corte}
+            ).mappings():
+                if r["id_moeda"] == moeda:
+                    esperado += r["valor"]
+
+            atual = saldo + fatias
+            if abs(atual - esperado) <= tolerancia:
+                return None
+            conn.execute(
+                text("""
+                    UPDATE saldo_carteira
+                    SET saldo = :saldo, versao = versao + 1, data_atualizacao = NOW()
+                    WHERE endereco_carteira = :endereco AND id_moeda = :moeda
+                """),
+                {**params, "saldo": esperado - fatias}
+            )
+    return Divergencia(endereco, moeda, atual, esperado, reparada=True)
+
+
+def reconciliar(faixas: int = 16, processos: int = 4, incremental: bool = False, reparar: bool = False,
+                tolerancia: Decimal = Decimal("0"), margem_segundos: int = 300) -> Iterator[ResultadoFaixa]:
+    # movimentações com menos de `margem_segundos` podem ser de transações
+    # ainda abertas (data_hora é o NOW() do INSERT, não do commit): ficam
+    # fora do checkpoint e são somadas de novo na próxima execução
+    with get_connection() as conn:
+        corte = conn.execute(
+            text("SELECT NOW() - INTERVAL :margem SECOND"), {"margem": margem_segundos}
+        ).scalar()
+
+    # o pool de conexões herdado no fork é descartado pelo próprio db.py
+    with ProcessPoolExecutor(max_workers=processos) as pool:
+        futuros = [
+            pool.submit(reconciliar_faixa, faixa, corte, incremental, reparar, tolerancia)
+            for faixa in dividir_faixas(faixas)
+        ]
+        for futuro in futuros:
+            yield futuro.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--faixas", type=int, default=16, help="faixas de endereço (mesmo número entre execuções)")
+    parser.add_argument("--processos", type=int, default=4)
+    parser.add_argument("--incremental", action="store_true", help="só lê movimentações desde o checkpoint")
+    parser.add_argument("--reparar", action="store_true", help="corrige SALDO_CARTEIRA pelas movimentações")
+    parser.add_argument("--tolerancia", type=Decimal, default=Decimal("0"))
+    parser.add_argument("--margem-segundos", type=int, default=300)
+    args = parser.parse_args()
+
+    pares = pendentes = 0
+    for resultado in reconciliar(args.faixas, args.processos, args.incremental, args.reparar,
+                                 args.tolerancia, args.margem_segundos):
+        pares += resultado.pares
+        for d in resultado.divergencias:
+            pendentes += not d.reparada
+            print(json.dumps({
+                "endereco": d.endereco,
+                "id_moeda": d.id_moeda,
+                "saldo": None if d.saldo is None else str(d.saldo),
+                "esperado": str(d.esperado),
+                "reparada": d.reparada,
+            }))
+    print(f"{pares} pares verificados, {pendentes} divergências pendentes", file=sys.stderr)
+    if pendentes:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Volume e taxas por dia, moeda e tipo de operação (VOLUME_DIARIO).
+
+    python -m api.jobs.volume_diario --recalcular
+    python -m api.jobs.volume_diario
+
+Alimenta GET /relatorios/volume, que lê só VOLUME_DIARIO: o relatório custa
+O(dias), não O(movimentações). As movimentações são somadas em blocos de
+`--bloco-horas` de data_hora, cada bloco na sua transação junto com o
+checkpoint (VOLUME_DIARIO_CHECKPOINT). Cada execução continua de onde a
+anterior parou, até `--margem-segundos` atrás; rode-a periodicamente (cron).
+
+`--recalcular` refaz tudo: zera a tabela, soma as partições arquivadas e
+percorre o histórico do banco em blocos. É a carga inicial, e o caminho
+quando uma partição é arquivada antes de ser somada.
+
+Não é atualizado na transação de cada movimentação de propósito: todas as
+operações do dia numa moeda disputariam a trava da mesma linha.
+"""
+import sys
+import json
+import argparse
+from decimal import Decimal
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from api.persistence.db import get_connection
+from api.persistence.arquivo import LeitorArquivo, ler_particao
+
+# (tabela, coluna da moeda, tipo, volume, taxa, quantidade): a conversão conta
+# na moeda de origem e a taxa dela, cobrada na moeda de destino, vai para lá
+RAMOS_VOLUME = [
+    ("deposito_saque", "id_moeda", "tipo", "valor", "taxa_valor", "1"),
+    ("conversao", "id_moeda_origem", "'CONVERSAO'", "valor_origem", "0", "1"),
+    ("conversao", "id_moeda_destino", "'CONVERSAO'", "0", "taxa_valor", "0"),
+    ("transferencia", "id_moeda", "'TRANSFERENCIA'", "valor", "taxa_valor", "1"),
+]
+
+Chave = Tuple[date, int, str]
+
+
+class Totais(NamedTuple):
+    quantidade: int
+    volume: Decimal
+    taxas: Decimal
+
+    def __add__(self, outro: "Totais") -> "Totais":
+        return Totais(self.quantidade + outro.quantidade, self.volume + outro.volume, self.taxas + outro.taxas)
+
+
+ZERO = Totais(0, Decimal("0"), Decimal("0"))
+
+
+class BlocoProcessado(NamedTuple):
+    de: datetime
+    ate: datetime
+    linhas: int
+
+
+def sql_volume() -> str:
+    """
+    Totais por (dia, id_moeda, tipo) no intervalo [de, ate) de data_hora,
+    somados no MySQL; o filtro de data_hora descarta as partições fora dele
+    e usa os índices por data_hora.
+    """
+    ramos = [
+        f"SELECT DATE(data_hora) AS dia, {moeda} AS id_moeda, {tipo} AS tipo, "
+        f"{quantidade} AS quantidade, {volume} AS volume, {taxa} AS taxas "
+        f"FROM {tabela} WHERE data_hora >= :de AND data_hora < :ate"
+        for tabela, moeda, tipo, volume, taxa, quantidade in RAMOS_VOLUME
+    ]
+    return f"""
+        SELECT dia, id_moeda, tipo, SUM(quantidade) AS quantidade, SUM(volume) AS volume, SUM(taxas) AS taxas
+          FROM ({" UNION ALL ".join(ramos)}) m
+         GROUP BY dia, id_moeda, tipo
+    """
+
+
+def _volume_arquivado(tabela: str, r: Dict[str, Any]) -> Iterator[Tuple[Chave, Totais]]:
+    # mesmas regras de RAMOS_VOLUME, sobre as linhas dos arquivos
+    dia = r["data_hora"].date()
+    if tabela == "deposito_saque":
+        yield (dia, r["id_moeda"], r["tipo"]), Totais(1, r["valor"], r["taxa_valor"])
+    elif tabela == "conversao":
+        yield (dia, r["id_moeda_origem"], "CONVERSAO"), Totais(1, r["valor_origem"], Decimal("0"))
+        yield (dia, r["id_moeda_destino"], "CONVERSAO"), Totais(0, Decimal("0"), r["taxa_valor"])
+    elif tabela == "transferencia":
+        yield (dia, r["id_moeda"], "TRANSFERENCIA"), Totais(1, r["valor"], r["taxa_valor"])
+
+
+def somar_arquivo(leitor: LeitorArquivo) -> Dict[Chave, Totais]:
+    totais: Dict[Chave, Totais] = {}
+    for particao in leitor.manifesto.carregar():
+        for linha in ler_particao(leitor.diretorio / particao.arquivo):
+            for chave, valores in _volume_arquivado(particao.tabela, linha):
+                totais[chave] = totais.get(chave, ZERO) + valores
+    return totais
+
+
+def _gravar_totais(conn: Connection, totais: Dict[Chave, Totais]):
+    linhas = [
+        {"dia": dia, "moeda": moeda, "tipo": tipo, "quantidade": t.quantidade, "volume": t.volume, "taxas": t.taxas}
+        for (dia, moeda, tipo), t in totais.items()
+    ]
+    for i in range(0, len(linhas), 1000):
+        conn.execute(
+            text("""
+                INSERT INTO volume_diario (dia, id_moeda, tipo, quantidade, volume, taxas)
+                VALUES (:dia, :moeda, :tipo, :quantidade, :volume, :taxas)
+                ON DUPLICATE KEY UPDATE quantidade = quantidade + VALUES(quantidade),
+                                        volume = volume + VALUES(volume),
+                                        taxas = taxas + VALUES(taxas)
+            """),
+            linhas[i:i + 1000]
+        )
+
+
+def _checkpoint(conn: Connection) -> Optional[datetime]:
+    # a trava da linha serializa execuções simultâneas do job
+    return conn.execute(
+        text("SELECT processado_ate FROM volume_diario_checkpoint WHERE id = 1 FOR UPDATE")
+    ).scalar()
+
+
+def _gravar_checkpoint(conn: Connection, processado_ate: datetime):
+    conn.execute(
+        text("""
+            INSERT INTO volume_diario_checkpoint (id, processado_ate)
+            VALUES (1, :processado_ate)
+            ON DUPLICATE KEY UPDATE processado_ate = VALUES(processado_ate)
+        """),
+        {"processado_ate": processado_ate}
+    )
+
+
+def _corte(margem_segundos: int) -> datetime:
+    # movimentações com menos de `margem_segundos` podem ser de transações
+    # ainda abertas (data_hora é o NOW() do INSERT, não do commit)
+    with get_connection() as conn:
+        return conn.execute(
+            text("SELECT NOW() - INTERVAL :margem SECOND"), {"margem": margem_segundos}
+        ).scalar()
+
+
+def recomecar(corte: datetime):
+    """
+    Zera VOLUME_DIARIO, soma as partições arquivadas e põe o checkpoint na
+    movimentação mais antiga ainda no banco; `atualizar` percorre o resto.
+    """
+    leitor = LeitorArquivo()
+    with get_connection() as conn:
+        # espera alguma execução em andamento terminar o bloco dela
+        _checkpoint(conn)
+        conn.execute(text("DELETE FROM volume_diario"))
+        _gravar_totais(conn, somar_arquivo(leitor))
+        inicios = [
+            conn.execute(text(f"SELECT MIN(data_hora) FROM {tabela}")).scalar()
+            for tabela in dict.fromkeys(tabela for tabela, *_ in RAMOS_VOLUME)
+        ]
+        _gravar_checkpoint(conn, min([i for i in inicios if i is not None] + [corte]))
+
+
+def atualizar(corte: datetime, bloco_horas: int = 24) -> Iterator[BlocoProcessado]:
+    """Soma as movimentações do checkpoint até `corte`, um bloco por transação."""
+    leitor = LeitorArquivo()
+    while True:
+        with get_connection() as conn:
+            de = _checkpoint(conn)
+            if de is None:
+                raise RuntimeError("VOLUME_DIARIO sem checkpoint: rode uma vez com --recalcular")
+            if any(datetime.fromisoformat(p.ate) > de for p in leitor.manifesto.carregar()):
+                raise RuntimeError("Partição arquivada depois do checkpoint: rode com --recalcular")
+            if de >= corte:
+                return
+            ate = min(de + timedelta(hours=bloco_horas), corte)
+            totais = {
+                (r["dia"], r["id_moeda"], r["tipo"]): Totais(int(r["quantidade"]), r["volume"], r["taxas"])
+                for r in conn.execute(text(sql_volume()), {"de": de, "ate": ate}).mappings()
+            }
+            _gravar_totais(conn, totais)
+            _gravar_checkpoint(conn, ate)
+        yield BlocoProcessado(de, ate, len(totais))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--recalcular", action="store_true", help="refaz a tabela desde o início do histórico")
+    parser.add_argument("--bloco-horas", type=int, default=24, help="horas de movimentações por transação")
+    parser.add_argument("--margem-segundos", type=int, default=300)
+    args = parser.parse_args()
+
+    corte = _corte(args.margem_segundos)
+    if args.recalcular:
+        recomecar(corte)
+
+    blocos = 0
+    for bloco in atualizar(corte, args.bloco_horas):
+        blocos += 1
+        print(json.dumps({"de": bloco.de.isoformat(), "ate": bloco.ate.isoformat(), "linhas": bloco.linhas}))
+    print(f"{blocos} blocos processados até {corte.isoformat()}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,102 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from api.routers.carteira_router import router as carteiras_router
+from starlette.concurrency import run_in_threadpool
+
+from api.persistence.db import get_connection, fechar_engines, replica_configurada
+from api.persistence.cache import carteiras_quentes, catalogo_moedas
+from api.services.carteira_service import expurgar_chaves_idempotencia
+from api.services.cotacao_service import get_cotacao_service, fechar_cotacao_service
+from api.services.eventos_service import expurgar_eventos, parar_despachante_eventos
+from api.services.agrupador_depositos import parar_agrupador_depositos
+from api.observabilidade.middleware import MetricasMiddleware
+from api.routers.consistencia import ConsistenciaLeituraMiddleware
+from api.routers.admissao import ControleAdmissaoMiddleware, LimiteCarteiraMiddleware
+from api.routers.metricas_router import router as metricas_router
+from api.routers.relatorio_router import router as relatorio_router
+
+
+def _carregar_catalogos():
+    with get_connection() as conn:
+        catalogo_moedas.carregar(conn)
+        # primeira carga fora das requisições: depois ela é relida em segundo plano
+        carteiras_quentes.carregar(conn)
+
+
+logger = logging.getLogger(__name__)
 
 
-def create_app() -> FastAPI:
+async def _expurgar_periodicamente(expurgar, variavel_intervalo: str, descricao: str):
+    intervalo = float(os.getenv(variavel_intervalo, "300"))
+    while True:
+        try:
+            await run_in_threadpool(expurgar)
+        except Exception:
+            logger.exception("Falha ao expurgar %s", descricao)
+        await asyncio.sleep(intervalo)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # engines e cliente de cotações nascem aqui, já no processo do worker: o
+    # master do gunicorn (preload) importa o app sem abrir nenhuma conexão.
+    # MOEDA não muda com a API no ar: carrega uma vez na subida (junto com a
+    # primeira carga das carteiras quentes)
+    await run_in_threadpool(_carregar_catalogos)
+    get_cotacao_service()
+    expurgos = [
+        asyncio.create_task(_expurgar_periodicamente(
+            expurgar_chaves_idempotencia, "IDEMPOTENCIA_EXPURGO_INTERVALO_SEGUNDOS", "chaves de idempotência"
+        )),
+        asyncio.create_task(_expurgar_periodicamente(
+            expurgar_eventos, "EVENTOS_EXPURGO_INTERVALO_SEGUNDOS", "eventos de saldo"
+        )),
+    ]
+    yield
+    for expurgo in expurgos:
+        expurgo.cancel()
+    # conexões SSE abertas são encerradas; os clientes reconectam em outro worker
+    await parar_despachante_eventos()
+    # depósitos ainda na fila são gravados antes de o processo sair
+    await run_in_threadpool(parar_agrupador_depositos)
+    await run_in_threadpool(fechar_cotacao_service)
+    await run_in_threadpool(fechar_engines)
+    if app.state.modo == "async":
+        from api.persistence.db_async import fechar_engines_async
+        await fechar_engines_async()
+
+
+def create_app(modo: str = None) -> FastAPI:
     app = FastAPI(
         title="Carteira Digital API",
         version="1.0.0",
         description="API educacional de carteira digital com SQL puro e FastAPI.",
+        lifespan=lifespan,
     )
 
+    # API_MODO=async usa rotas async sobre o engine assíncrono (aiomysql)
+    modo = (modo or os.getenv("API_MODO", "sync")).lower()
+    if modo == "async":
+        from api.routers.carteira_router_async import router as carteiras_router
+    else:
+        from api.routers.carteira_router import router as carteiras_router
+
+    app.state.modo = modo
     app.include_router(carteiras_router)
+    app.include_router(relatorio_router)
+    app.include_router(metricas_router)
+    if replica_configurada():
+        # réplica configurada (DB_REPLICA_HOST): GETs podem ler dela
+        app.add_middleware(ConsistenciaLeituraMiddleware)
+    # de fora para dentro: métricas -> limite por carteira -> admissão
+    app.add_middleware(ControleAdmissaoMiddleware)
+    app.add_middleware(LimiteCarteiraMiddleware)
+    app.add_middleware(MetricasMiddleware)
 
     return app
 
 
-app = create_app()
\ No newline at end of file
+app = create_app()
@@ -1,6 +1,10 @@
-from typing import Literal, List
+from typing import Annotated, Literal, List, Optional
+from decimal import Decimal
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+# Valores monetários: DECIMAL(18, 8) no banco, Decimal aqui e string exata no JSON
+Valor = Annotated[Decimal, Field(max_digits=18, decimal_places=8)]
 
 class Carteira(BaseModel):
     endereco_carteira: str
@@ -11,7 +15,7 @@ class CarteiraCriada(Carteira):
     chave_privada: str
 
 class Saldo(BaseModel):
-    saldo: float
+    saldo: Decimal
     moeda_codigo: str
     moeda_nome: str
 
@@ -19,23 +23,69 @@ class SaldosCarteira(BaseModel):
     endereco: str
     saldos: List[Saldo]
 
+class ValorMoeda(BaseModel):
+    moeda_codigo: str
+    saldo: Decimal
+    cotacao: Decimal
+    valor: Decimal
+
+class ValorCarteira(BaseModel):
+    endereco: str
+    moeda: str
+    valor_total: Decimal
+    itens: List[ValorMoeda]
+
 class DepositoRequest(BaseModel):
     id_moeda: int
-    valor: float
+    valor: Valor
     chave_privada: str
 
 class SaqueRequest(BaseModel):
     id_moeda: int
-    valor: float
+    valor: Valor
     chave_privada: str
 
 class ConversaoRequest(BaseModel):
     id_moeda_origem: int
     id_moeda_destino: int
-    valor_origem: float
+    valor_origem: Valor
+    id_cotacao: Optional[str] = None
+
+class CotacaoRequest(BaseModel):
+    id_moeda_origem: int
+    id_moeda_destino: int
+
+class CotacaoTravada(BaseModel):
+    id_cotacao: str
+    endereco_carteira: str
+    id_moeda_origem: int
+    id_moeda_destino: int
+    cotacao: Decimal
+    expira_em: datetime
 
 class TransferenciaRequest(BaseModel):
     endereco_destino: str
     id_moeda: int
-    valor: float
-    chave_privada: str
\ No newline at end of file
+    valor: Valor
+    chave_privada: str
+
+class ItemTransferenciaLote(BaseModel):
+    endereco_destino: str
+    id_moeda: int
+    valor: Valor
+
+class TransferenciaLoteRequest(BaseModel):
+    chave_privada: str
+    itens: List[ItemTransferenciaLote]
+
+class MovimentoExtrato(BaseModel):
+    origem: Literal["DEPOSITO_SAQUE", "CONVERSAO", "TRANSFERENCIA"]
+    id: int
+    tipo: Literal["DEPOSITO", "SAQUE", "CONVERSAO", "TRANSFERENCIA_ENVIADA", "TRANSFERENCIA_RECEBIDA"]
+    data_hora: datetime
+    id_moeda: int
+    valor: Decimal
+    taxa_valor: Decimal
+    id_moeda_destino: Optional[int] = None
+    valor_destino: Optional[Decimal] = None
+    contraparte: Optional[str] = None
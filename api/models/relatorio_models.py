@@ -0,0 +1,21 @@
+from typing import List, Literal, Optional
+from decimal import Decimal
+from datetime import date, datetime
+from pydantic import BaseModel
+
+TipoOperacao = Literal["DEPOSITO", "SAQUE", "CONVERSAO", "TRANSFERENCIA"]
+
+class VolumeDiario(BaseModel):
+    dia: date
+    moeda_codigo: str
+    tipo: TipoOperacao
+    quantidade: int
+    volume: Decimal
+    taxas: Decimal
+
+class RelatorioVolume(BaseModel):
+    de: date
+    ate: date
+    # movimentações até aqui já estão somadas; None = job ainda não rodou
+    processado_ate: Optional[datetime]
+    linhas: List[VolumeDiario]
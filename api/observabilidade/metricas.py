@@ -0,0 +1,215 @@
+import os
+import time
+import logging
+import inspect
+import functools
+import contextvars
+from typing import Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("carteira.sql")
+
+# Método do repositório em execução, para rotular o tempo de cada comando SQL
+metodo_repositorio: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "metodo_repositorio", default="fora_do_repositorio"
+)
+
+BUCKETS_SQL = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+SQL_DURACAO = Histogram(
+    "carteira_sql_duracao_segundos",
+    "Tempo de execução de cada comando SQL, por método do repositório.",
+    ["metodo"],
+    buckets=BUCKETS_SQL,
+)
+SQL_LENTAS = Counter(
+    "carteira_sql_lentas_total",
+    "Comandos SQL acima de SQL_LENTA_MS.",
+    ["metodo"],
+)
+POOL_ESPERA = Histogram(
+    "carteira_pool_espera_segundos",
+    "Tempo para obter uma conexão do pool (inclui pre-ping).",
+    buckets=BUCKETS_SQL,
+)
+# livesum: com vários workers (PROMETHEUS_MULTIPROC_DIR), soma dos processos vivos
+POOL_EM_USO = Gauge(
+    "carteira_pool_conexoes_em_uso",
+    "Conexões retiradas do pool neste momento.",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+POOL_CAPACIDADE = Gauge(
+    "carteira_pool_capacidade",
+    "Máximo de conexões do pool (pool_size + max_overflow).",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+REPLICA_ATRASO = Gauge(
+    "carteira_replica_atraso_segundos",
+    "Atraso da réplica de leitura na última verificação (-1 = indisponível).",
+)
+LEITURAS = Counter(
+    "carteira_leituras_total",
+    "Conexões de leitura abertas, por destino (replica ou primario).",
+    ["destino"],
+)
+COTACAO_BUSCA = Histogram(
+    "carteira_cotacao_busca_segundos",
+    "Duração da busca de cotações no provedor externo.",
+    ["resultado"],
+)
+DEPOSITO_LOTE = Histogram(
+    "carteira_deposito_lote_pedidos",
+    "Depósitos por transação no modo agrupado (DEPOSITO_AGRUPADO).",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+HTTP_DURACAO = Histogram(
+    "carteira_http_duracao_segundos",
+    "Latência das requisições HTTP, por rota.",
+    ["metodo", "rota", "status"],
+)
+HTTP_EM_ANDAMENTO = Gauge(
+    "carteira_http_em_andamento",
+    "Requisições HTTP em andamento.",
+    ["metodo"],
+)
+HTTP_ERROS = Counter(
+    "carteira_http_erros_total",
+    "Respostas HTTP com status >= 400 ou exceção não tratada.",
+    ["metodo", "rota", "status"],
+)
+
+ADMISSAO_EM_ANDAMENTO = Gauge(
+    "carteira_admissao_em_andamento",
+    "Requisições admitidas que ainda não terminaram (limite: capacidade do pool).",
+)
+ADMISSAO_FILA = Gauge(
+    "carteira_admissao_fila",
+    "Requisições esperando vaga na fila de admissão.",
+)
+ADMISSAO_ESPERA = Histogram(
+    "carteira_admissao_espera_segundos",
+    "Tempo na fila de admissão das requisições admitidas.",
+    buckets=BUCKETS_SQL,
+)
+REQUISICOES_DESCARTADAS = Counter(
+    "carteira_requisicoes_descartadas_total",
+    "Requisições recusadas antes de chegar ao banco, por motivo "
+    "(fila_cheia, prazo: 503; limite_carteira: 429).",
+    ["motivo"],
+)
+EVENTOS_ASSINANTES = Gauge(
+    "carteira_eventos_assinantes",
+    "Conexões SSE abertas em /carteiras/{endereco}/eventos.",
+)
+EVENTOS_ENTREGUES = Counter(
+    "carteira_eventos_entregues_total",
+    "Eventos de saldo lidos do outbox pelo despachante.",
+)
+EVENTOS_LACUNAS = Counter(
+    "carteira_eventos_lacunas_total",
+    "Ids do outbox pulados pelo despachante depois de EVENTOS_LACUNA_MAX_SEGUNDOS "
+    "(transação desfeita ou que demorou demais para fazer commit).",
+)
+
+def instrumentar_repositorio(cls):
+    """
+    Decorador de classe: cada método público do repositório passa a marcar
+    `metodo_repositorio`, e os comandos SQL que ele dispara ficam rotulados
+    com "Classe.metodo".
+    """
+    for nome, atributo in list(vars(cls).items()):
+        if nome.startswith("_") or not callable(atributo):
+            continue
+        setattr(cls, nome, _rotular(f"{cls.__name__}.{nome}", atributo))
+    return cls
+
+
+def _rotular(rotulo: str, func):
+    if inspect.isgeneratorfunction(func):
+        # geradores (streaming) rodam depois do retorno: o rótulo vale a cada passo
+        @functools.wraps(func)
+        def gerador(*args, **kwargs):
+            iterador = func(*args, **kwargs)
+            try:
+                while True:
+                    token = metodo_repositorio.set(rotulo)
+                    try:
+                        item = next(iterador)
+                    except StopIteration:
+                        return
+                    finally:
+                        metodo_repositorio.reset(token)
+                    yield item
+            finally:
+                iterador.close()
+
+        return gerador
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = metodo_repositorio.set(rotulo)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metodo_repositorio.reset(token)
+
+    return wrapper
+
+
+def instrumentar_engine(engine: Engine, nome: str = "principal"):
+    """Mede cada comando SQL do engine e publica a ocupação do pool."""
+    limite_lenta_ms = float(os.getenv("SQL_LENTA_MS", "0") or 0)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("inicio_sql", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _depois(conn, cursor, statement, parameters, context, executemany):
+        duracao = time.perf_counter() - conn.info["inicio_sql"].pop()
+        metodo = metodo_repositorio.get()
+        SQL_DURACAO.labels(metodo).observe(duracao)
+        if limite_lenta_ms and duracao * 1000 >= limite_lenta_ms:
+            SQL_LENTAS.labels(metodo).inc()
+            logger.warning(
+                "SQL lenta (%.1f ms) em %s: %s",
+                duracao * 1000, metodo, " ".join(statement.split()),
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def _erro(contexto):
+        pilha = contexto.connection.info.get("inicio_sql") if contexto.connection is not None else None
+        if pilha:
+            pilha.pop()
+
+    # atualizados pelos eventos do pool, não por set_function (que o coletor
+    # multiprocesso não exporta); ouvintes no engine passam para o pool novo
+    # depois de um dispose()
+    em_uso = POOL_EM_USO.labels(nome)
+
+    @event.listens_for(engine, "checkout")
+    def _retirada(dbapi_connection, registro, proxy):
+        em_uso.inc()
+
+    @event.listens_for(engine, "checkin")
+    def _devolucao(dbapi_connection, registro):
+        em_uso.dec()
+
+    if hasattr(engine.pool, "size") and hasattr(engine.pool, "_max_overflow"):
+        POOL_CAPACIDADE.labels(nome).set(engine.pool.size() + max(engine.pool._max_overflow, 0))
+
+
+class medir_espera_pool:
+    """Context manager em volta de engine.connect()."""
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        POOL_ESPERA.observe(time.perf_counter() - self._inicio)
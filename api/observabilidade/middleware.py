@@ -0,0 +1,44 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.observabilidade.metricas import HTTP_DURACAO, HTTP_EM_ANDAMENTO, HTTP_ERROS
+
+
+class MetricasMiddleware:
+    """
+    Latência, requisições em andamento e erros por rota.
+
+    A rota é o template (ex.: /carteiras/{endereco_carteira}/saldos), não o
+    caminho concreto, para não criar uma série por carteira.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metodo = scope["method"]
+        status = 500
+        inicio = time.perf_counter()
+
+        async def send_com_status(mensagem: Message):
+            nonlocal status
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+            await send(mensagem)
+
+        em_andamento = HTTP_EM_ANDAMENTO.labels(metodo)
+        em_andamento.inc()
+        try:
+            await self.app(scope, receive, send_com_status)
+        finally:
+            em_andamento.dec()
+            # o roteador do Starlette grava a rota encontrada no próprio scope
+            rota = getattr(scope.get("route"), "path", "desconhecida")
+            HTTP_DURACAO.labels(metodo, rota, str(status)).observe(time.perf_counter() - inicio)
+            if status >= 400:
+                HTTP_ERROS.labels(metodo, rota, str(status)).inc()
@@ -0,0 +1,278 @@
+import os
+import gzip
+import json
+import heapq
+import hashlib
+import threading
+from decimal import Decimal
+from pathlib import Path
+from datetime import datetime
+from dataclasses import dataclass, asdict
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+
+from api.persistence.db import BASE_DIR
+
+# coluna de id de cada tabela de movimentação (os arquivos saem nessa ordem, decrescente)
+TABELAS_MOVIMENTACAO = {
+    "deposito_saque": "id_movimento",
+    "conversao": "id_conversao",
+    "transferencia": "id_transferencia",
+}
+
+# colunas de carteira das tabelas de movimentação (índice de endereços de cada arquivo)
+COLUNAS_ENDERECO = ("endereco_carteira", "endereco_origem", "endereco_destino")
+
+COLUNAS_DECIMAIS = {"valor", "taxa_valor", "valor_origem", "valor_destino", "taxa_percentual", "cotacao_utilizada"}
+
+
+@dataclass(frozen=True)
+class ParticaoArquivada:
+    tabela: str
+    particao: str
+    ate: str                # limite superior (exclusivo) de data_hora, ISO
+    arquivo: str            # relativo ao diretório do arquivo
+    linhas: int
+    sha256: str
+    arquivada_em: str
+    # endereços com linhas no arquivo, um por linha (gzip); None = sem índice,
+    # o arquivo é lido inteiro (partições arquivadas antes do índice existir)
+    enderecos: Optional[str] = None
+
+
+def _para_json(valor):
+    if isinstance(valor, Decimal):
+        return str(valor)
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    raise TypeError(f"{type(valor).__name__} não serializável")
+
+
+def _de_json(linha: Dict[str, Any]) -> Dict[str, Any]:
+    for coluna, valor in linha.items():
+        if valor is None:
+            continue
+        if coluna in COLUNAS_DECIMAIS:
+            linha[coluna] = Decimal(valor)
+        elif coluna == "data_hora":
+            linha[coluna] = datetime.fromisoformat(valor)
+    return linha
+
+
+def escrever_particao(caminho: Path, linhas: Iterable[Dict[str, Any]],
+                      enderecos: Optional[Set[str]] = None) -> Tuple[int, str]:
+    """
+    Grava as linhas em NDJSON comprimido (gzip), valores decimais como texto
+    exato. Escreve num temporário e renomeia: um arquivo no caminho final
+    está sempre completo. Devolve (linhas, sha256 do arquivo); os endereços
+    de carteira das linhas vão para `enderecos`, se informado.
+    """
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    temporario = caminho.with_suffix(caminho.suffix + ".tmp")
+    total = 0
+    with gzip.open(temporario, "wt", encoding="utf-8") as f:
+        for linha in linhas:
+            linha = dict(linha)
+            f.write(json.dumps(linha, default=_para_json) + "\n")
+            if enderecos is not None:
+                enderecos.update(linha[c] for c in COLUNAS_ENDERECO if linha.get(c) is not None)
+            total += 1
+
+    sha = hashlib.sha256()
+    with open(temporario, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            sha.update(bloco)
+    os.replace(temporario, caminho)
+    return total, sha.hexdigest()
+
+
+def ler_particao(caminho: Path) -> Iterator[Dict[str, Any]]:
+    with gzip.open(caminho, "rt", encoding="utf-8") as f:
+        for linha in f:
+            yield _de_json(json.loads(linha))
+
+
+def escrever_enderecos(caminho: Path, enderecos: Iterable[str]):
+    """Índice de endereços de um arquivo de partição, ordenado (temporário + rename)."""
+    temporario = caminho.with_suffix(caminho.suffix + ".tmp")
+    with gzip.open(temporario, "wt", encoding="utf-8") as f:
+        for endereco in sorted(enderecos):
+            f.write(endereco + "\n")
+    os.replace(temporario, caminho)
+
+
+def caminho_enderecos(arquivo: str) -> str:
+    """p202401_20240201.ndjson.gz -> p202401_20240201.enderecos.gz"""
+    return arquivo.removesuffix(".ndjson.gz") + ".enderecos.gz"
+
+
+class Manifesto:
+    """
+    manifesto.json: uma entrada por partição arquivada. Regravado por
+    inteiro (temporário + rename) a cada partição nova.
+    """
+
+    def __init__(self, diretorio: Path):
+        self.diretorio = diretorio
+        self.caminho = diretorio / "manifesto.json"
+        self._lock = threading.Lock()
+        self._cache: Tuple[float, List[ParticaoArquivada]] = (-1.0, [])
+
+    def carregar(self) -> List[ParticaoArquivada]:
+        try:
+            mtime = self.caminho.stat().st_mtime
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            if self._cache[0] != mtime:
+                dados = json.loads(self.caminho.read_text(encoding="utf-8"))
+                self._cache = (mtime, [ParticaoArquivada(**p) for p in dados["particoes"]])
+            return self._cache[1]
+
+    def registrar(self, particao: ParticaoArquivada):
+        particoes = [
+            p for p in self.carregar()
+            if (p.tabela, p.particao) != (particao.tabela, particao.particao)
+        ]
+        particoes.append(particao)
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        temporario = self.caminho.with_suffix(".json.tmp")
+        temporario.write_text(
+            json.dumps({"particoes": [asdict(p) for p in particoes]}, indent=2),
+            encoding="utf-8",
+        )
+        os.replace(temporario, self.caminho)
+
+    def buscar(self, tabela: str, particao: str) -> Optional[ParticaoArquivada]:
+        for p in self.carregar():
+            if (p.tabela, p.particao) == (tabela, particao):
+                return p
+        return None
+
+
+def _movimentos(tabela: str, linhas: Iterator[Dict[str, Any]], endereco: str) -> Iterator[Dict[str, Any]]:
+    """Linhas de uma tabela arquivada no formato do extrato (ver CarteiraRepository.RAMOS_EXTRATO)."""
+    for r in linhas:
+        if tabela == "deposito_saque" and r["endereco_carteira"] == endereco:
+            yield {
+                "data_hora": r["data_hora"], "ordem": 1, "id": r["id_movimento"], "tipo": r["tipo"],
+                "id_moeda": r["id_moeda"], "valor": r["valor"], "taxa_valor": r["taxa_valor"],
+                "id_moeda_destino": None, "valor_destino": None, "contraparte": None,
+                "origem": "DEPOSITO_SAQUE",
+            }
+        elif tabela == "conversao" and r["endereco_carteira"] == endereco:
+            yield {
+                "data_hora": r["data_hora"], "ordem": 2, "id": r["id_conversao"], "tipo": "CONVERSAO",
+                "id_moeda": r["id_moeda_origem"], "valor": r["valor_origem"], "taxa_valor": r["taxa_valor"],
+                "id_moeda_destino": r["id_moeda_destino"], "valor_destino": r["valor_destino"],
+                "contraparte": None, "origem": "CONVERSAO",
+            }
+        elif tabela == "transferencia" and endereco in (r["endereco_origem"], r["endereco_destino"]):
+            enviada = r["endereco_origem"] == endereco
+            yield {
+                "data_hora": r["data_hora"], "ordem": 3, "id": r["id_transferencia"],
+                "tipo": "TRANSFERENCIA_ENVIADA" if enviada else "TRANSFERENCIA_RECEBIDA",
+                "id_moeda": r["id_moeda"], "valor": r["valor"],
+                "taxa_valor": r["taxa_valor"] if enviada else Decimal(0),
+                "id_moeda_destino": None, "valor_destino": None,
+                "contraparte": r["endereco_destino"] if enviada else r["endereco_origem"],
+                "origem": "TRANSFERENCIA",
+            }
+
+
+def _chave(movimento: Dict[str, Any]) -> Tuple[datetime, int, int]:
+    return movimento["data_hora"], movimento["ordem"], movimento["id"]
+
+
+class LeitorArquivo:
+    """
+    Leitura do histórico que já saiu do banco (partições arquivadas).
+
+    Os arquivos de cada mês são lidos do mais novo para o mais antigo e as
+    três tabelas intercaladas em ordem decrescente de (data_hora, ordem, id),
+    a mesma do extrato no banco; a leitura para quando a página enche.
+    """
+
+    def __init__(self, diretorio: Optional[Path] = None):
+        self.diretorio = Path(diretorio or os.getenv("ARQUIVO_DIR", BASE_DIR / "arquivo"))
+        self.manifesto = Manifesto(self.diretorio)
+        # índices de endereços já lidos, do menos para o mais recente
+        self._indices: "OrderedDict[str, FrozenSet[str]]" = OrderedDict()
+        self._indices_max = int(os.getenv("ARQUIVO_INDICES_CACHE", "36"))
+        self._lock = threading.Lock()
+
+    def tem_particoes(self) -> bool:
+        return bool(self.manifesto.carregar())
+
+    def _tem_linhas(self, particao: ParticaoArquivada, endereco: str) -> bool:
+        """Pelo índice de endereços; sem índice, só lendo o arquivo para saber."""
+        if particao.enderecos is None:
+            return True
+        with self._lock:
+            indice = self._indices.pop(particao.enderecos, None)
+        if indice is None:
+            with gzip.open(self.diretorio / particao.enderecos, "rt", encoding="utf-8") as f:
+                indice = frozenset(linha.rstrip("\n") for linha in f)
+        with self._lock:
+            self._indices[particao.enderecos] = indice
+            while len(self._indices) > self._indices_max:
+                self._indices.popitem(last=False)
+        return endereco in indice
+
+    def _meses(self) -> List[Tuple[datetime, List[ParticaoArquivada]]]:
+        meses: Dict[str, List[ParticaoArquivada]] = {}
+        for p in self.manifesto.carregar():
+            meses.setdefault(p.ate, []).append(p)
+        return sorted(
+            ((datetime.fromisoformat(ate), particoes) for ate, particoes in meses.items()),
+            key=lambda m: m[0], reverse=True,
+        )
+
+    def extrato(
+        self,
+        endereco: str,
+        apos: Optional[Tuple[datetime, int, int]] = None,
+        limite: int = 100,
+        id_moeda: Optional[int] = None,
+        de: Optional[datetime] = None,
+        ate: Optional[datetime] = None,
+        criada_em: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Meses que terminam antes de `criada_em` (criação da carteira) não são
+        lidos, nem os arquivos cujo índice de endereços não tem a carteira.
+        """
+        resultado: List[Dict[str, Any]] = []
+        meses = self._meses()
+        for i, (limite_superior, particoes) in enumerate(meses):
+            # o mês começa onde termina o anterior (mais antigo) no manifesto
+            limite_inferior = meses[i + 1][0] if i + 1 < len(meses) else None
+            if (de is not None and limite_superior <= de) or (criada_em is not None and limite_superior <= criada_em):
+                break
+            if limite_inferior is not None and (
+                (ate is not None and ate <= limite_inferior)
+                or (apos is not None and apos[0] < limite_inferior)
+            ):
+                continue
+
+            fontes = [
+                _movimentos(p.tabela, ler_particao(self.diretorio / p.arquivo), endereco)
+                for p in particoes
+                if self._tem_linhas(p, endereco)
+            ]
+            for movimento in heapq.merge(*fontes, key=_chave, reverse=True):
+                if apos is not None and _chave(movimento) >= apos:
+                    continue
+                if ate is not None and movimento["data_hora"] >= ate:
+                    continue
+                if de is not None and movimento["data_hora"] < de:
+                    break
+                if id_moeda is not None and id_moeda not in (movimento["id_moeda"], movimento["id_moeda_destino"]):
+                    continue
+                resultado.append(movimento)
+                if len(resultado) == limite:
+                    return resultado
+        return resultado
+
+
+leitor_arquivo = LeitorArquivo()
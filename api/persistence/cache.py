@@ -0,0 +1,174 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, ContextManager, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from api.persistence.db import get_connection
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RegistroCarteira:
+    hash_chave_privada: str
+    status: str
+
+
+class CacheCarteiras:
+    """
+    LRU limitado de (hash_chave_privada, status) por endereço.
+
+    A invalidação explícita (bloqueio) só alcança o processo atual; nos
+    outros workers a entrada some sozinha depois de `ttl` segundos. Até lá o
+    débito (SQL_DEBITO) confere o status no próprio UPDATE.
+    """
+
+    def __init__(self, tamanho_max: int = 100_000, ttl: float = 30.0):
+        self.tamanho_max = tamanho_max
+        self.ttl = ttl
+        self._itens: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, endereco: str) -> Optional[RegistroCarteira]:
+        with self._lock:
+            item = self._itens.get(endereco)
+            if item is None:
+                return None
+            registro, guardado_em = item
+            if time.monotonic() - guardado_em >= self.ttl:
+                del self._itens[endereco]
+                return None
+            self._itens.move_to_end(endereco)
+            return registro
+
+    def guardar(self, endereco: str, registro: RegistroCarteira):
+        with self._lock:
+            self._itens[endereco] = (registro, time.monotonic())
+            self._itens.move_to_end(endereco)
+            while len(self._itens) > self.tamanho_max:
+                self._itens.popitem(last=False)
+
+    def invalidar(self, endereco: str):
+        with self._lock:
+            self._itens.pop(endereco, None)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+
+@dataclass(frozen=True)
+class Moeda:
+    id_moeda: int
+    codigo: str
+    nome: str
+
+
+class CatalogoMoedas:
+    """
+    Tabela MOEDA em memória. Não muda com a API no ar: é carregada uma vez
+    na subida (ou no primeiro uso, para scripts) e consultada sem ir ao banco.
+    """
+
+    def __init__(self):
+        self._moedas: Optional[Dict[int, Moeda]] = None
+        self._lock = threading.Lock()
+
+    def carregar(self, conn: Connection) -> Dict[int, Moeda]:
+        rows = conn.execute(
+            text("SELECT id_moeda, codigo, nome FROM moeda")
+        ).mappings().all()
+        moedas = {r["id_moeda"]: Moeda(r["id_moeda"], r["codigo"], r["nome"]) for r in rows}
+        with self._lock:
+            self._moedas = moedas
+        return moedas
+
+    def obter(self, conexao: Callable[[], Connection]) -> Dict[int, Moeda]:
+        # `conexao` só é chamada se o catálogo ainda não estiver carregado
+        moedas = self._moedas
+        if moedas is None:
+            moedas = self.carregar(conexao())
+        return moedas
+
+
+class CarteirasQuentes:
+    """
+    Carteiras marcadas com saldo em fatias (CARTEIRA.fatias_saldo > 1):
+    endereço -> número de fatias. São poucas (exchange, tesouraria), então
+    vão inteiras para a memória e são relidas a cada `ttl` segundos.
+
+    A releitura é feita por uma thread só, numa conexão própria (nunca na
+    transação da requisição); enquanto isso vale o mapa anterior. Só a
+    primeira carga espera, e a API já a faz na subida.
+    """
+
+    def __init__(self, ttl: float = 30.0, conectar: Callable[[], ContextManager[Connection]] = get_connection):
+        self.ttl = ttl
+        self.conectar = conectar
+        self._fatias: Optional[Dict[str, int]] = None
+        self._carregado_em = float("-inf")
+        self._lock = threading.Lock()
+        self._recarregando = threading.Lock()
+
+    def carregar(self, conn: Connection) -> Dict[str, int]:
+        # usa idx_carteira_fatias: lê só as carteiras quentes
+        rows = conn.execute(
+            text("SELECT endereco_carteira, fatias_saldo FROM carteira WHERE fatias_saldo > 1")
+        ).all()
+        fatias = {endereco: n for endereco, n in rows}
+        with self._lock:
+            self._fatias = fatias
+            self._carregado_em = time.monotonic()
+        return fatias
+
+    def obter(self) -> Dict[str, int]:
+        fatias = self._fatias
+        if fatias is None:
+            with self._recarregando:
+                if self._fatias is None:
+                    self._recarregar()
+            return self._fatias
+        if time.monotonic() - self._carregado_em >= self.ttl:
+            self._recarregar_em_segundo_plano()
+        return fatias
+
+    def invalidar(self):
+        with self._lock:
+            self._carregado_em = float("-inf")
+
+    def _recarregar(self):
+        with self.conectar() as conn:
+            self.carregar(conn)
+
+    def _recarregar_em_segundo_plano(self):
+        if self._recarregando.acquire(blocking=False):
+            threading.Thread(target=self._recarregar_e_liberar, name="carteiras-quentes", daemon=True).start()
+
+    def _recarregar_e_liberar(self):
+        try:
+            self._recarregar()
+        except Exception:
+            # o mapa atual continua valendo por mais um `ttl`
+            logger.warning("Falha ao reler as carteiras quentes", exc_info=True)
+            with self._lock:
+                self._carregado_em = time.monotonic()
+        finally:
+            self._recarregando.release()
+
+
+cache_carteiras = CacheCarteiras(
+    tamanho_max=int(os.getenv("CACHE_CARTEIRAS_MAX", "100000")),
+    ttl=float(os.getenv("CACHE_CARTEIRAS_TTL_SEGUNDOS", "30")),
+)
+
+catalogo_moedas = CatalogoMoedas()
+
+carteiras_quentes = CarteirasQuentes(
+    ttl=float(os.getenv("CARTEIRAS_QUENTES_TTL_SEGUNDOS", "30")),
+)
@@ -1,10 +1,20 @@
 import os
+import time
+import random
+import threading
+import functools
 from pathlib import Path
 from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine, Connection
+from sqlalchemy.exc import DBAPIError
+
+from api.observabilidade.metricas import instrumentar_engine, medir_espera_pool
+
+T = TypeVar("T")
 
 
 # Carrega .env a partir da raiz do projeto
@@ -13,27 +23,95 @@ ENV_PATH = BASE_DIR / ".env"
 load_dotenv(ENV_PATH)
 
 
-def get_database_url() -> str:
+def get_database_url(driver: str = "mysqlconnector", host: Optional[str] = None, port: Optional[str] = None) -> str:
     user = os.getenv("DB_USER")
     password = os.getenv("DB_PASSWORD")
-    host = os.getenv("DB_HOST", "localhost")
-    port = os.getenv("DB_PORT", "3306")
+    host = host or os.getenv("DB_HOST", "localhost")
+    port = port or os.getenv("DB_PORT", "3306")
     db = os.getenv("DB_NAME")
 
     if not all([user, password, db]):
         raise RuntimeError("Variáveis de ambiente do banco não configuradas corretamente.")
 
-    # usamos mysql+mysqlconnector, mas continua tudo SQL puro
-    return f"mysql+mysqlconnector://{user}:{password}@{host}:{port}/{db}"
+    # usamos mysql+mysqlconnector (ou aiomysql na versão async), mas continua tudo SQL puro
+    return f"mysql+{driver}://{user}:{password}@{host}:{port}/{db}"
+
+
+def get_replica_url(driver: str = "mysqlconnector") -> Optional[str]:
+    """Réplica de leitura opcional (DB_REPLICA_HOST), com o mesmo usuário e banco do primário."""
+    host = os.getenv("DB_REPLICA_HOST")
+    if not host:
+        return None
+    return get_database_url(driver, host, os.getenv("DB_REPLICA_PORT"))
+
+
+def replica_configurada() -> bool:
+    return bool(os.getenv("DB_REPLICA_HOST"))
+
+
+def configuracao_pool() -> Dict[str, Any]:
+    """
+    Pool de cada processo: com N workers o banco recebe até
+    N * (DB_POOL_TAMANHO + DB_POOL_EXCEDENTE) conexões por engine.
+    """
+    return {
+        "pool_size": int(os.getenv("DB_POOL_TAMANHO", "5")),
+        "max_overflow": int(os.getenv("DB_POOL_EXCEDENTE", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_ESPERA_MAX_SEGUNDOS", "30")),
+        # abaixo do wait_timeout do MySQL: conexão parada é trocada antes de o servidor derrubá-la
+        "pool_recycle": int(os.getenv("DB_POOL_RECICLAR_SEGUNDOS", "3600")),
+        "pool_pre_ping": True,
+    }
+
+
+# Engines criados no primeiro uso, não na importação: importar o módulo não
+# exige as variáveis do banco nem carrega o driver, e um master com preload
+# (gunicorn) não abre conexões que os workers herdariam no fork.
+_engines: Dict[str, Engine] = {}
+_engines_lock = threading.Lock()
 
 
-DATABASE_URL = get_database_url()
+def _engine_preguicoso(nome: str, url: Callable[[], str]) -> Engine:
+    engine_ = _engines.get(nome)
+    if engine_ is None:
+        with _engines_lock:
+            engine_ = _engines.get(nome)
+            if engine_ is None:
+                engine_ = create_engine(url(), future=True, **configuracao_pool())
+                instrumentar_engine(engine_, nome=nome)
+                _engines[nome] = engine_
+    return engine_
 
-engine: Engine = create_engine(
-    DATABASE_URL,
-    future=True,
-    pool_pre_ping=True,
-)
+
+def get_engine() -> Engine:
+    return _engine_preguicoso("principal", get_database_url)
+
+
+def get_engine_leitura() -> Optional[Engine]:
+    """Engine da réplica; None sem DB_REPLICA_HOST."""
+    if not replica_configurada():
+        return None
+    return _engine_preguicoso("replica", get_replica_url)
+
+
+def fechar_engines():
+    """Fecha as conexões de todos os pools (fim do processo)."""
+    with _engines_lock:
+        engines = list(_engines.values())
+        _engines.clear()
+    for engine_ in engines:
+        engine_.dispose()
+
+
+def _descartar_pools_herdados():
+    # no processo filho de um fork (workers do gunicorn, ProcessPoolExecutor)
+    # as conexões do pool são sockets do pai: o filho troca o pool por um
+    # vazio sem fechá-las, e o pai continua usando as suas
+    for engine_ in list(_engines.values()):
+        engine_.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_descartar_pools_herdados)
 
 
 @contextmanager
@@ -42,7 +120,8 @@ def get_connection() -> Connection:
     Entrega uma conexão do SQLAlchemy já com transação aberta.
     Faz commit automático se der tudo certo, rollback se der erro.
     """
-    conn: Connection = engine.connect()
+    with medir_espera_pool():
+        conn: Connection = get_engine().connect()
     trans = conn.begin()
     try:
         yield conn
@@ -51,4 +130,88 @@ def get_connection() -> Connection:
         trans.rollback()
         raise
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+
+def executar_em_streaming(
+    conn: Connection, sql: str, params: Dict[str, Any], tamanho_lote: int = 1000
+) -> Iterator[Dict[str, Any]]:
+    """
+    Executa `sql` num cursor do lado do servidor (não bufferizado) e devolve
+    as linhas conforme chegam, sem carregar o resultado inteiro em memória.
+
+    O dialeto mysqlconnector do SQLAlchemy ignora stream_results, então o
+    cursor é aberto direto no driver.
+    """
+    compilado = text(sql).compile(dialect=conn.dialect)
+    valores = [params[nome] for nome in compilado.positiontup]
+
+    cursor = conn.connection.driver_connection.cursor(buffered=False, dictionary=True)
+    try:
+        cursor.execute(compilado.string, valores)
+        while True:
+            linhas = cursor.fetchmany(tamanho_lote)
+            if not linhas:
+                break
+            yield from linhas
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            # interrompido no meio (ex.: cliente desconectou): sobrou resultado
+            # pendente no socket, então a conexão não volta para o pool
+            conn.invalidate()
+
+
+# Erros do MySQL em que o servidor desfaz a transação e ela pode ser repetida:
+# 1213 = deadlock, 1205 = lock wait timeout
+ERROS_REPETIVEIS = {1213, 1205}
+
+
+def erro_repetivel(erro: DBAPIError) -> bool:
+    # mysql-connector expõe .errno; PyMySQL/aiomysql, o código em args[0]
+    codigo = getattr(erro.orig, "errno", None)
+    if codigo is None and getattr(erro.orig, "args", None):
+        codigo = erro.orig.args[0]
+    return codigo in ERROS_REPETIVEIS
+
+
+def tentativas_em_conflito() -> int:
+    return int(os.getenv("DB_RETENTATIVAS_CONFLITO", "5"))
+
+
+def espera_antes_de_repetir(tentativa: int) -> float:
+    """Backoff exponencial com jitter ("full jitter"), em segundos."""
+    espera_base = float(os.getenv("DB_RETENTATIVA_ESPERA_BASE", "0.02"))
+    espera_max = float(os.getenv("DB_RETENTATIVA_ESPERA_MAX", "1.0"))
+    return random.uniform(0, min(espera_max, espera_base * 2 ** tentativa))
+
+
+def executar_com_retentativa(operacao: Callable[[], T], antes_de_repetir: Optional[Callable[[], None]] = None) -> T:
+    """
+    Repete a operação inteira quando a transação cai por deadlock ou
+    lock timeout, com backoff exponencial e jitter.
+    `antes_de_repetir` deve descartar a transação que falhou (rollback).
+    """
+    tentativas = tentativas_em_conflito()
+    for tentativa in range(1, tentativas + 1):
+        try:
+            return operacao()
+        except DBAPIError as e:
+            if tentativa == tentativas or not erro_repetivel(e):
+                raise
+            if antes_de_repetir:
+                antes_de_repetir()
+            time.sleep(espera_antes_de_repetir(tentativa))
+
+
+def repetir_em_conflito(func):
+    """
+    Versão decorador de executar_com_retentativa, para funções que abrem
+    a própria transação (get_connection).
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return executar_com_retentativa(lambda: func(*args, **kwargs))
+
+    return wrapper
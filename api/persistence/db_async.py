@@ -0,0 +1,68 @@
+import os
+import threading
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Optional
+
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncConnection
+
+from api.persistence.db import configuracao_pool, get_database_url, get_replica_url, replica_configurada
+from api.observabilidade.metricas import instrumentar_engine
+
+
+# Como em db.py: criados no primeiro uso, já dentro do processo (e do event loop) que os usa
+_engines: Dict[str, AsyncEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def _engine_preguicoso(nome: str, url: Callable[[], str]) -> AsyncEngine:
+    engine_ = _engines.get(nome)
+    if engine_ is None:
+        with _engines_lock:
+            engine_ = _engines.get(nome)
+            if engine_ is None:
+                engine_ = create_async_engine(url(), **configuracao_pool())
+                instrumentar_engine(engine_.sync_engine, nome=nome)
+                _engines[nome] = engine_
+    return engine_
+
+
+def get_async_engine() -> AsyncEngine:
+    return _engine_preguicoso("async", lambda: get_database_url(driver="aiomysql"))
+
+
+def get_async_engine_leitura() -> Optional[AsyncEngine]:
+    if not replica_configurada():
+        return None
+    return _engine_preguicoso("replica_async", lambda: get_replica_url(driver="aiomysql"))
+
+
+async def fechar_engines_async():
+    with _engines_lock:
+        engines = list(_engines.values())
+        _engines.clear()
+    for engine_ in engines:
+        await engine_.dispose()
+
+
+def _descartar_pools_herdados():
+    for engine_ in list(_engines.values()):
+        engine_.sync_engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_descartar_pools_herdados)
+
+
+@asynccontextmanager
+async def get_async_connection() -> AsyncIterator[AsyncConnection]:
+    """
+    Versão assíncrona de get_connection: conexão com transação aberta,
+    commit se der tudo certo, rollback se der erro.
+    """
+    async with get_async_engine().connect() as conn:
+        trans = await conn.begin()
+        try:
+            yield conn
+            await trans.commit()
+        except Exception:
+            await trans.rollback()
+            raise
@@ -0,0 +1,157 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine, Connection
+from sqlalchemy.exc import DBAPIError
+
+from api.persistence.db import get_engine, get_engine_leitura
+from api.observabilidade.metricas import LEITURAS, REPLICA_ATRASO, medir_espera_pool
+
+logger = logging.getLogger(__name__)
+
+# Ligado pelo ConsistenciaLeituraMiddleware nas requisições que só leem e cujo
+# cliente não escreveu há pouco. Fora de requisição (jobs, scripts) fica
+# desligado: tudo vai para o primário.
+leitura_na_replica: contextvars.ContextVar[bool] = contextvars.ContextVar("leitura_na_replica", default=False)
+
+
+class MonitorReplica:
+    """
+    Saúde e atraso da réplica, verificados em segundo plano a cada
+    `intervalo` segundos; `disponivel()` nunca espera pela verificação.
+
+    O atraso é medido por um pulso (REPLICA_PULSO): a verificação grava
+    NOW(6) no primário e espera o valor aparecer na réplica por até
+    `atraso_max` segundos. Só precisa de SELECT/INSERT/UPDATE, ao contrário
+    de SHOW REPLICA STATUS, que pede privilégio de replicação.
+    """
+
+    def __init__(self, engine_: Engine, primario: Engine, atraso_max: float = 2.0, intervalo: float = 5.0,
+                 espera_pulso: float = 0.05):
+        self.engine = engine_
+        self.primario = primario
+        self.atraso_max = atraso_max
+        self.intervalo = intervalo
+        self.espera_pulso = espera_pulso
+        self._disponivel = False
+        self._verificado_em = float("-inf")
+        self._verificando = threading.Lock()
+
+    def disponivel(self) -> bool:
+        if time.monotonic() - self._verificado_em >= self.intervalo:
+            self._verificar_em_segundo_plano()
+        return self._disponivel
+
+    def marcar_falha(self):
+        self._disponivel = False
+        self._verificado_em = time.monotonic()
+        REPLICA_ATRASO.set(-1)
+
+    def _verificar_em_segundo_plano(self):
+        if self._verificando.acquire(blocking=False):
+            threading.Thread(target=self._verificar, name="monitor-replica", daemon=True).start()
+
+    def _pulsar(self):
+        with self.primario.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO replica_pulso (id, batida) VALUES (1, NOW(6))
+                ON DUPLICATE KEY UPDATE batida = VALUES(batida)
+            """))
+            return conn.execute(text("SELECT batida FROM replica_pulso WHERE id = 1")).scalar()
+
+    def _medir_atraso(self, batida) -> Optional[float]:
+        """Segundos até a réplica ver `batida`; None se nunca viu pulso algum."""
+        inicio = time.monotonic()
+        with self.engine.connect() as conn:
+            while True:
+                vista = conn.execute(text("SELECT batida FROM replica_pulso WHERE id = 1")).scalar()
+                # fecha a transação: a próxima leitura não reaproveita o snapshot
+                conn.rollback()
+                decorrido = time.monotonic() - inicio
+                # pulso mais novo de outro worker também conta
+                if vista is not None and vista >= batida:
+                    return decorrido
+                if decorrido >= self.atraso_max:
+                    return None if vista is None else (batida - vista).total_seconds()
+                time.sleep(self.espera_pulso)
+
+    def _verificar(self):
+        try:
+            atraso = self._medir_atraso(self._pulsar())
+            # atraso None = o pulso nunca chegou (replicação parada ou não configurada)
+            self._disponivel = atraso is not None and atraso <= self.atraso_max
+            REPLICA_ATRASO.set(-1 if atraso is None else atraso)
+            if not self._disponivel:
+                logger.warning("Réplica fora de uso: atraso %s s", atraso)
+        except Exception:
+            logger.warning("Réplica indisponível", exc_info=True)
+            self.marcar_falha()
+        finally:
+            self._verificado_em = time.monotonic()
+            self._verificando.release()
+
+
+_monitor_replica: Optional[MonitorReplica] = None
+_monitor_lock = threading.Lock()
+
+
+def get_monitor_replica() -> Optional[MonitorReplica]:
+    """None sem réplica configurada."""
+    global _monitor_replica
+    if _monitor_replica is None:
+        engine_leitura = get_engine_leitura()
+        if engine_leitura is None:
+            return None
+        with _monitor_lock:
+            if _monitor_replica is None:
+                _monitor_replica = MonitorReplica(
+                    engine_leitura,
+                    get_engine(),
+                    atraso_max=float(os.getenv("DB_REPLICA_ATRASO_MAX_SEGUNDOS", "2")),
+                    intervalo=float(os.getenv("DB_REPLICA_VERIFICACAO_SEGUNDOS", "5")),
+                )
+    return _monitor_replica
+
+
+def usar_replica() -> bool:
+    if not leitura_na_replica.get():
+        return False
+    monitor = get_monitor_replica()
+    return monitor is not None and monitor.disponivel()
+
+
+def conectar_leitura(engine_primario: Optional[Engine] = None) -> Connection:
+    """
+    Conexão para consultas puras: da réplica quando a requisição permite e
+    ela está saudável; senão (ou se a conexão falhar), do primário.
+    """
+    if usar_replica():
+        try:
+            with medir_espera_pool():
+                conn = get_engine_leitura().connect()
+            LEITURAS.labels("replica").inc()
+            return conn
+        except DBAPIError:
+            logger.warning("Falha ao conectar na réplica, lendo do primário", exc_info=True)
+            get_monitor_replica().marcar_falha()
+    with medir_espera_pool():
+        conn = (engine_primario or get_engine()).connect()
+    LEITURAS.labels("primario").inc()
+    return conn
+
+
+@contextmanager
+def get_connection_leitura() -> Iterator[Connection]:
+    """Versão de get_connection para consultas puras (ver conectar_leitura)."""
+    conn = conectar_leitura()
+    try:
+        with conn.begin():
+            yield conn
+    finally:
+        conn.close()
@@ -1,17 +1,116 @@
 import os
+import json
 import time
+import random
 import secrets
+import hmac
 import hashlib
-import requests
 from decimal import Decimal
-from typing import Dict, Any, Optional, List
+from datetime import datetime
+from typing import Dict, Any, Iterator, Optional, List, NamedTuple, Tuple, Union
 
-from sqlalchemy import text
+from sqlalchemy import text, bindparam
+from sqlalchemy.exc import IntegrityError
 
-from api.persistence.db import get_connection
+from api.persistence.db import executar_em_streaming
+from api.persistence.replica import get_connection_leitura
+from api.persistence.arquivo import LeitorArquivo, leitor_arquivo
+from api.persistence.cache import Moeda, RegistroCarteira, cache_carteiras, catalogo_moedas, carteiras_quentes
+from api.persistence.unit_of_work import UnidadeDeTrabalho
+from api.services.cotacao_service import CotacaoService, CotacoesFixadas, get_cotacao_service
+from api.observabilidade.metricas import instrumentar_repositorio
 
+# Toda alteração de saldo incrementa `versao` na própria linha que já está
+# sendo travada: a versão da carteira (soma das versões das suas linhas de
+# saldo e fatias) só cresce e vira o ETag de GET /carteiras/{endereco}.
+
+# Débito condicional: só altera a linha se houver saldo e a carteira estiver
+# ativa (rowcount 0 = insuficiente ou bloqueada). O status vem do banco, não do
+# cache de validar_chave, que nos outros workers pode estar até um TTL atrasado.
+SQL_DEBITO = text("""
+    UPDATE saldo_carteira
+    SET saldo = saldo - :valor, versao = versao + 1, data_atualizacao = NOW()
+    WHERE endereco_carteira = :endereco
+    AND id_moeda = :moeda
+    AND saldo >= :valor
+    AND EXISTS (
+        SELECT 1 FROM carteira
+        WHERE carteira.endereco_carteira = :endereco AND carteira.status = 'ATIVA'
+    )
+""")
+
+SQL_CREDITO = text("""
+    UPDATE saldo_carteira
+    SET saldo = saldo + :valor, versao = versao + 1, data_atualizacao = NOW()
+    WHERE endereco_carteira = :endereco
+    AND id_moeda = :moeda
+""")
+
+# Crédito em carteira quente: só a fatia sorteada é travada
+SQL_CREDITO_FATIA = text("""
+    UPDATE saldo_carteira_fatia
+    SET saldo = saldo + :valor, versao = versao + 1, data_atualizacao = NOW()
+    WHERE endereco_carteira = :endereco
+    AND id_moeda = :moeda
+    AND fatia = :fatia
+""")
+
+# Outbox: uma linha por saldo alterado, na transação da movimentação
+SQL_EVENTO = text("""
+    INSERT INTO evento_saldo (endereco_carteira, tipo, id_moeda, valor, saldo, endereco_contraparte)
+    VALUES (:endereco, :tipo, :moeda, :valor, :saldo, :contraparte)
+""")
+
+
+# escala de DECIMAL(18, 8)
+CASAS_DECIMAIS = Decimal("0.00000001")
+
+
+class Movimento(NamedTuple):
+    endereco: str
+    id_moeda: int
+    valor: Decimal          # positivo = crédito, negativo = débito
+    erro: str               # mensagem se a linha não puder ser movimentada
+
+
+class Variacao(NamedTuple):
+    """Alteração de saldo já aplicada, que vira um evento em EVENTO_SALDO."""
+    endereco: str
+    tipo: str               # DEPOSITO, SAQUE, CONVERSAO, TRANSFERENCIA
+    id_moeda: int
+    valor: Decimal          # positivo = crédito, negativo = débito
+    contraparte: Optional[str] = None
+
+
+def _para_json(valor):
+    # mesma representação da primeira resposta (RespostaJSON): decimal como string exata
+    if isinstance(valor, Decimal):
+        return str(valor)
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    raise TypeError(f"{type(valor).__name__} não serializável")
+
+
+def _em_blocos(itens: List[Any], tamanho: int):
+    for i in range(0, len(itens), tamanho):
+        yield itens[i:i + tamanho]
+
+
+@instrumentar_repositorio
 class CarteiraRepository:
-    def criar(self) -> Dict[str, Any]:
+    TAMANHO_BLOCO = 1000
+
+    def __init__(
+        self,
+        uow: UnidadeDeTrabalho,
+        cotacoes: Optional[Union[CotacaoService, CotacoesFixadas]] = None,
+        arquivo: Optional[LeitorArquivo] = None,
+    ):
+        self.uow = uow
+        self.cotacoes = cotacoes or get_cotacao_service()
+        self.arquivo = arquivo or leitor_arquivo
+
+    def _gerar_chaves(self):
         # ADIÇÃO MÍNIMA: defaults caso env não exista
         private_key_size:int = int(os.getenv("PRIVATE_KEY_SIZE", "32"))
         public_key_size:int = int(os.getenv("PUBLIC_KEY_SIZE", "16"))
@@ -19,29 +118,34 @@ class CarteiraRepository:
         chave_privada = secrets.token_hex(private_key_size)
         endereco = secrets.token_hex(public_key_size)
         hash_privada = hashlib.sha256(chave_privada.encode()).hexdigest()
+        return endereco, chave_privada, hash_privada
 
-        with get_connection() as conn:
 
-            # ADIÇÃO MÍNIMA: incluir status = 'ATIVA'
-            conn.execute(
-                text("""
-                    INSERT INTO carteira (endereco_carteira, hash_chave_privada, status)
-                    VALUES (:endereco, :hash_privada, 'ATIVA')
-                """),
-                {"endereco": endereco, "hash_privada": hash_privada},
-            )
+    def criar(self) -> Dict[str, Any]:
+        endereco, chave_privada, hash_privada = self._gerar_chaves()
 
-            row = conn.execute(
-                text("""
-                    SELECT endereco_carteira,
-                           data_criacao,
-                           status,
-                           hash_chave_privada
-                      FROM carteira
-                     WHERE endereco_carteira = :endereco
-                """),
-                {"endereco": endereco},
-            ).mappings().first()
+        conn = self.uow.conexao
+
+        # ADIÇÃO MÍNIMA: incluir status = 'ATIVA'
+        conn.execute(
+            text("""
+                INSERT INTO carteira (endereco_carteira, hash_chave_privada, status)
+                VALUES (:endereco, :hash_privada, 'ATIVA')
+            """),
+            {"endereco": endereco, "hash_privada": hash_privada},
+        )
+
+        row = conn.execute(
+            text("""
+                SELECT endereco_carteira,
+                       data_criacao,
+                       status,
+                       hash_chave_privada
+                  FROM carteira
+                 WHERE endereco_carteira = :endereco
+            """),
+            {"endereco": endereco},
+        ).mappings().first()
         self.popular_saldos(endereco)
         carteira = dict(row)
         carteira["chave_privada"] = chave_privada      
@@ -49,252 +153,1075 @@ class CarteiraRepository:
 
 
     def popular_saldos(self, endereco_carteira: str):
-        with get_connection() as conn:
-            conn.execute(
-                text("""
-                    INSERT INTO saldo_carteira (endereco_carteira, id_moeda)
-                    VALUES  (:endereco, 1), 
-                            (:endereco, 2), 
-                            (:endereco, 3),
-                            (:endereco, 4),
-                            (:endereco, 5);
-                """),
-                {"endereco": endereco_carteira},
-            )
-    
+        conn = self.uow.conexao
+        conn.execute(
+            text("""
+                INSERT INTO saldo_carteira (endereco_carteira, id_moeda)
+                SELECT :endereco, id_moeda
+                  FROM moeda
+            """),
+            {"endereco": endereco_carteira},
+        )
+
+
+    def criar_lote(self, quantidade: int) -> List[Dict[str, str]]:
+        """
+        Cria `quantidade` carteiras com dois INSERTs multi-linha: um em
+        carteira e outro em saldo_carteira (uma linha por moeda do catálogo).
+        """
+        carteiras = [self._gerar_chaves() for _ in range(quantidade)]
+        conn = self.uow.conexao
+
+        valores = ", ".join(f"(:endereco_{i}, :hash_{i}, 'ATIVA')" for i in range(len(carteiras)))
+        parametros: Dict[str, str] = {}
+        for i, (endereco, _, hash_privada) in enumerate(carteiras):
+            parametros[f"endereco_{i}"] = endereco
+            parametros[f"hash_{i}"] = hash_privada
+        conn.execute(
+            text(f"""
+                INSERT INTO carteira (endereco_carteira, hash_chave_privada, status)
+                VALUES {valores}
+            """),
+            parametros,
+        )
+
+        conn.execute(
+            text("""
+                INSERT INTO saldo_carteira (endereco_carteira, id_moeda)
+                SELECT c.endereco_carteira, m.id_moeda
+                  FROM carteira c
+                 CROSS JOIN moeda m
+                 WHERE c.endereco_carteira IN :enderecos
+            """).bindparams(bindparam("enderecos", expanding=True)),
+            {"enderecos": [endereco for endereco, _, _ in carteiras]},
+        )
+
+        return [
+            {"endereco_carteira": endereco, "chave_privada": chave_privada}
+            for endereco, chave_privada, _ in carteiras
+        ]
+
 
     def buscar_por_endereco(self, endereco_carteira: str) -> Optional[Dict[str, Any]]:
-        with get_connection() as conn:
-            row = conn.execute(
-                text("""
-                    SELECT endereco_carteira,
-                           data_criacao,
-                           status,
-                           hash_chave_privada
-                      FROM carteira
-                     WHERE endereco_carteira = :endereco
-                """),
-                {"endereco": endereco_carteira},
-            ).mappings().first()
+        conn = self.uow.conexao_leitura
+        row = conn.execute(
+            text("""
+                SELECT endereco_carteira,
+                       data_criacao,
+                       status,
+                       hash_chave_privada
+                  FROM carteira
+                 WHERE endereco_carteira = :endereco
+            """),
+            {"endereco": endereco_carteira},
+        ).mappings().first()
 
         return dict(row) if row else None
 
 
-    def listar(self) -> List[Dict[str, Any]]:
-        with get_connection() as conn:
-            rows = conn.execute(
-                text("""
-                    SELECT endereco_carteira,
-                           data_criacao,
-                           status,
-                           hash_chave_privada
-                      FROM carteira
-                """)
-            ).mappings().all()
+    def versao_carteira(self, endereco_carteira: str) -> Optional[int]:
+        """
+        Versão atual da carteira, lida só pela chave primária das linhas de
+        saldo (sem JOIN). None se a carteira não existe.
+        """
+        conn = self.uow.conexao_leitura
+        versao = conn.execute(
+            text("""
+                SELECT (SELECT SUM(versao) FROM saldo_carteira
+                         WHERE endereco_carteira = :endereco)
+                     + (SELECT COALESCE(SUM(versao), 0) FROM saldo_carteira_fatia
+                         WHERE endereco_carteira = :endereco)
+            """),
+            {"endereco": endereco_carteira},
+        ).scalar()
+        return None if versao is None else int(versao)
+
+
+    def _consulta_listagem(
+        self,
+        apos: Optional[str],
+        status: Optional[str],
+        criada_de: Optional[datetime],
+        criada_ate: Optional[datetime],
+    ) -> Tuple[str, Dict[str, Any]]:
+        condicoes = []
+        params: Dict[str, Any] = {}
+        if apos is not None:
+            condicoes.append("endereco_carteira > :apos")
+            params["apos"] = apos
+        if status is not None:
+            condicoes.append("status = :status")
+            params["status"] = status
+        if criada_de is not None:
+            condicoes.append("data_criacao >= :criada_de")
+            params["criada_de"] = criada_de
+        if criada_ate is not None:
+            condicoes.append("data_criacao < :criada_ate")
+            params["criada_ate"] = criada_ate
+
+        where = ("WHERE " + " AND ".join(condicoes)) if condicoes else ""
+        sql = f"""
+            SELECT endereco_carteira,
+                   data_criacao,
+                   status
+              FROM carteira
+              {where}
+             ORDER BY endereco_carteira
+        """
+        return sql, params
+
+
+    def listar(
+        self,
+        apos: Optional[str] = None,
+        limite: int = 100,
+        status: Optional[str] = None,
+        criada_de: Optional[datetime] = None,
+        criada_ate: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        """Uma página da listagem, paginada por chave (endereco_carteira > apos)."""
+        sql, params = self._consulta_listagem(apos, status, criada_de, criada_ate)
+        params["limite"] = limite
+
+        conn = self.uow.conexao_leitura
+        rows = conn.execute(text(sql + " LIMIT :limite"), params).mappings().all()
 
         return [dict(r) for r in rows]
 
 
-    def atualizar_status(self, endereco_carteira: str, status: str) -> Optional[Dict[str, Any]]:
-        with get_connection() as conn:
-            conn.execute(
-                text("""
-                    UPDATE carteira
-                       SET status = :status
-                     WHERE endereco_carteira = :endereco
-                """),
-                {"status": status, "endereco": endereco_carteira},
+    def listar_stream(
+        self,
+        apos: Optional[str] = None,
+        limite: Optional[int] = None,
+        status: Optional[str] = None,
+        criada_de: Optional[datetime] = None,
+        criada_ate: Optional[datetime] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Mesma consulta de listar, lida por cursor do lado do servidor.
+        Usa uma conexão própria, que fica aberta enquanto a resposta é enviada.
+        """
+        sql, params = self._consulta_listagem(apos, status, criada_de, criada_ate)
+        if limite is not None:
+            sql += " LIMIT :limite"
+            params["limite"] = limite
+
+        with get_connection_leitura() as conn:
+            yield from executar_em_streaming(conn, sql, params)
+
+
+    # Ramos do extrato: (ordem, coluna de id, SELECT, filtro de moeda).
+    # `ordem` desempata movimentos de tabelas diferentes no mesmo instante;
+    # cada ramo é lido só pelo índice de extrato da tabela, que cobre todas
+    # as colunas do SELECT (carteira, data_hora, id, moeda, valores, contraparte).
+    RAMOS_EXTRATO = (
+        (1, "id_movimento", """
+            SELECT data_hora, 1 AS ordem, id_movimento AS id, tipo,
+                   id_moeda, valor, taxa_valor,
+                   NULL AS id_moeda_destino, NULL AS valor_destino, NULL AS contraparte
+              FROM deposito_saque
+             WHERE endereco_carteira = :endereco
+        """, "id_moeda = :id_moeda"),
+        (2, "id_conversao", """
+            SELECT data_hora, 2 AS ordem, id_conversao AS id, 'CONVERSAO' AS tipo,
+                   id_moeda_origem AS id_moeda, valor_origem AS valor, taxa_valor,
+                   id_moeda_destino, valor_destino, NULL AS contraparte
+              FROM conversao
+             WHERE endereco_carteira = :endereco
+        """, "(id_moeda_origem = :id_moeda OR id_moeda_destino = :id_moeda)"),
+        (3, "id_transferencia", """
+            SELECT data_hora, 3 AS ordem, id_transferencia AS id, 'TRANSFERENCIA_ENVIADA' AS tipo,
+                   id_moeda, valor, taxa_valor,
+                   NULL AS id_moeda_destino, NULL AS valor_destino, endereco_destino AS contraparte
+              FROM transferencia
+             WHERE endereco_origem = :endereco
+        """, "id_moeda = :id_moeda"),
+        # a taxa da transferência é paga por quem envia
+        (3, "id_transferencia", """
+            SELECT data_hora, 3 AS ordem, id_transferencia AS id, 'TRANSFERENCIA_RECEBIDA' AS tipo,
+                   id_moeda, valor, 0 AS taxa_valor,
+                   NULL AS id_moeda_destino, NULL AS valor_destino, endereco_origem AS contraparte
+              FROM transferencia
+             WHERE endereco_destino = :endereco
+        """, "id_moeda = :id_moeda"),
+    )
+    ORIGENS_EXTRATO = {1: "DEPOSITO_SAQUE", 2: "CONVERSAO", 3: "TRANSFERENCIA"}
+
+    def extrato(
+        self,
+        endereco: str,
+        apos: Optional[Tuple[datetime, int, int]] = None,
+        limite: int = 100,
+        id_moeda: Optional[int] = None,
+        de: Optional[datetime] = None,
+        ate: Optional[datetime] = None,
+        conn=None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Uma página do extrato, do mais recente para o mais antigo, paginada
+        pela chave (data_hora, ordem, id) do último movimento recebido.
+
+        Cada ramo já sai ordenado e limitado pelo próprio índice, então o
+        UNION só ordena no máximo 4 × `limite` linhas. Se o banco não enche
+        a página, o restante vem das partições arquivadas, todas mais
+        antigas que qualquer linha ainda no banco.
+        """
+        params: Dict[str, Any] = {"endereco": endereco, "limite": limite}
+        filtros = []
+        if de is not None:
+            filtros.append("data_hora >= :de")
+            params["de"] = de
+        if ate is not None:
+            filtros.append("data_hora < :ate")
+            params["ate"] = ate
+        if apos is not None:
+            params["apos_data"], params["apos_ordem"], params["apos_id"] = apos
+
+        ramos = []
+        for ordem, coluna_id, select, filtro_moeda in self.RAMOS_EXTRATO:
+            condicoes = list(filtros)
+            if id_moeda is not None:
+                condicoes.append(filtro_moeda)
+            if apos is not None:
+                condicoes.append(
+                    f"data_hora <= :apos_data AND (data_hora < :apos_data"
+                    f" OR {ordem} < :apos_ordem OR ({ordem} = :apos_ordem AND {coluna_id} < :apos_id))"
+                )
+            where = "".join(f"               AND {c}\n" for c in condicoes)
+            ramos.append(f"({select}{where}             ORDER BY data_hora DESC, {coluna_id} DESC LIMIT :limite)")
+        if id_moeda is not None:
+            params["id_moeda"] = id_moeda
+
+        sql = f"""
+            SELECT * FROM ({" UNION ALL ".join(ramos)}) AS extrato
+             ORDER BY data_hora DESC, ordem DESC, id DESC
+             LIMIT :limite
+        """
+        rows = (conn or self.uow.conexao_leitura).execute(text(sql), params).mappings().all()
+        movimentos = [{**r, "origem": self.ORIGENS_EXTRATO[r["ordem"]]} for r in rows]
+
+        if len(movimentos) < limite and self.arquivo.tem_particoes():
+            ultimo = movimentos[-1] if movimentos else None
+            cursor = (ultimo["data_hora"], ultimo["ordem"], ultimo["id"]) if ultimo else apos
+            # meses anteriores à criação da carteira não têm nada dela
+            criada_em = (conn or self.uow.conexao_leitura).execute(
+                text("SELECT data_criacao FROM carteira WHERE endereco_carteira = :endereco"),
+                {"endereco": endereco},
+            ).scalar()
+            movimentos += self.arquivo.extrato(
+                endereco, cursor, limite - len(movimentos), id_moeda, de, ate, criada_em
             )
+        return movimentos
 
-            row = conn.execute(
-                text("""
-                    SELECT endereco_carteira,
-                           data_criacao,
-                           status,
-                           hash_chave_privada
-                      FROM carteira
-                     WHERE endereco_carteira = :endereco
-                """),
-                {"endereco": endereco_carteira},
-            ).mappings().first()
+
+    def extrato_stream(
+        self,
+        endereco: str,
+        apos: Optional[Tuple[datetime, int, int]] = None,
+        limite: Optional[int] = None,
+        id_moeda: Optional[int] = None,
+        de: Optional[datetime] = None,
+        ate: Optional[datetime] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Extrato completo (ou até `limite`) para exportação, em páginas de
+        TAMANHO_BLOCO pela mesma chave: memória constante e cada página
+        servida pelos índices, sem ordenar o histórico inteiro de uma vez.
+        """
+        enviados = 0
+        with get_connection_leitura() as conn:
+            while limite is None or enviados < limite:
+                tamanho = self.TAMANHO_BLOCO if limite is None else min(self.TAMANHO_BLOCO, limite - enviados)
+                pagina = self.extrato(endereco, apos, tamanho, id_moeda, de, ate, conn=conn)
+                yield from pagina
+                enviados += len(pagina)
+                if len(pagina) < tamanho:
+                    return
+                ultimo = pagina[-1]
+                apos = (ultimo["data_hora"], ultimo["ordem"], ultimo["id"])
+
+
+    def atualizar_status(self, endereco_carteira: str, status: str) -> Optional[Dict[str, Any]]:
+        conn = self.uow.conexao
+        conn.execute(
+            text("""
+                UPDATE carteira
+                   SET status = :status
+                 WHERE endereco_carteira = :endereco
+            """),
+            {"status": status, "endereco": endereco_carteira},
+        )
+        # o status também está na representação: muda a versão da carteira
+        conn.execute(
+            text("UPDATE saldo_carteira SET versao = versao + 1 WHERE endereco_carteira = :endereco"),
+            {"endereco": endereco_carteira},
+        )
+        # some já deste processo e de novo após o commit, caso outra requisição
+        # tenha recolocado no cache o status antigo nesse meio tempo
+        cache_carteiras.invalidar(endereco_carteira)
+        self.uow.apos_commit(lambda: cache_carteiras.invalidar(endereco_carteira))
+
+        row = conn.execute(
+            text("""
+                SELECT endereco_carteira,
+                       data_criacao,
+                       status,
+                       hash_chave_privada
+                  FROM carteira
+                 WHERE endereco_carteira = :endereco
+            """),
+            {"endereco": endereco_carteira},
+        ).mappings().first()
 
         return dict(row) if row else None
 
 
     def listar_saldos(self, endereco: str):
-            with get_connection() as conn:
-                rows = conn.execute(
-                    text("""
-                        SELECT 
-                            s.saldo,
-                            m.codigo AS moeda_codigo,
-                            m.nome AS moeda_nome
-                        FROM saldo_carteira s
-                        JOIN moeda m ON m.id_moeda = s.id_moeda
-                        WHERE s.endereco_carteira = :endereco
-                    """),
-                    {"endereco": endereco},
-                ).mappings().all()
-
-            return [dict(r) for r in rows]
+        conn = self.uow.conexao_leitura
+        rows = conn.execute(
+            text("""
+                SELECT 
+                    s.id_moeda,
+                    s.saldo + COALESCE(f.saldo, 0) AS saldo
+                FROM saldo_carteira s
+                LEFT JOIN (
+                    SELECT id_moeda, SUM(saldo) AS saldo
+                    FROM saldo_carteira_fatia
+                    WHERE endereco_carteira = :endereco
+                    GROUP BY id_moeda
+                ) f ON f.id_moeda = s.id_moeda
+                WHERE s.endereco_carteira = :endereco
+            """),
+            {"endereco": endereco},
+        ).mappings().all()
+
+        moedas = self._moedas()
+        return [
+            {
+                "saldo": r["saldo"],
+                "moeda_codigo": moedas[r["id_moeda"]].codigo,
+                "moeda_nome": moedas[r["id_moeda"]].nome,
+            }
+            for r in rows
+        ]
+
+
+    def _moedas(self) -> Dict[int, Moeda]:
+        return catalogo_moedas.obter(lambda: self.uow.conexao)
 
 
     def validar_chave(self, endereco, chave_privada):
         hash_input = hashlib.sha256(chave_privada.encode()).hexdigest()
 
-        with get_connection() as conn:
+        registro = cache_carteiras.obter(endereco)
+        if registro is None:
+            conn = self.uow.conexao
             row = conn.execute(
                 text("""
-                    SELECT 1 
+                    SELECT hash_chave_privada, status
                     FROM carteira 
                     WHERE endereco_carteira = :endereco
-                    AND hash_chave_privada = :hash
                 """),
-                {"endereco": endereco, "hash": hash_input}
-            ).fetchone()
+                {"endereco": endereco}
+            ).mappings().first()
+            if not row:
+                return False
+            registro = RegistroCarteira(row["hash_chave_privada"], row["status"])
+            cache_carteiras.guardar(endereco, registro)
 
-        return row is not None
+        # comparação em tempo constante, e só depois o status: sem a chave
+        # certa não dá para descobrir se a carteira está bloqueada
+        if not hmac.compare_digest(hash_input, registro.hash_chave_privada):
+            return False
+        if registro.status == "BLOQUEADA":
+            raise ValueError("Carteira bloqueada")
+        return True
 
     
-    def depositar(self, endereco, moeda, valor, chave_privada):
+    def depositar(self, endereco, moeda, valor, chave_privada, chave_idempotencia=None):
+        if chave_idempotencia:
+            return self._idempotente(
+                endereco, chave_idempotencia, "DEPOSITO", [moeda, valor, chave_privada],
+                lambda: self.depositar(endereco, moeda, valor, chave_privada),
+            )
+
         if not self.validar_chave(endereco, chave_privada):
             raise ValueError("Chave privada inválida")
 
-        with get_connection() as conn:
-            conn.execute(
-                text("""
-                    UPDATE saldo_carteira
-                    SET saldo = saldo + :valor
-                    WHERE endereco_carteira = :endereco 
-                    AND id_moeda = :moeda
-                """),
-                {"valor": valor, "endereco": endereco, "moeda": moeda}
-            )
+        valor = Decimal(valor)
+        if valor <= 0:
+            raise ValueError("Valor deve ser positivo")
+
+        conn = self.uow.conexao
+        self._movimentar_saldos(conn, [
+            Movimento(endereco, moeda, valor, "Moeda não encontrada na carteira"),
+        ])
+
+        conn.execute(
+            text("""
+                INSERT INTO deposito_saque 
+                (endereco_carteira, id_moeda, tipo, valor, taxa_valor, data_hora)
+                VALUES (:endereco, :moeda, 'DEPOSITO', :valor, 0, NOW())
+            """),
+            {"endereco": endereco, "valor": valor, "moeda": moeda}
+        )
+
+        evento, = self._registrar_eventos(conn, [Variacao(endereco, "DEPOSITO", moeda, valor)])
+        return {"status": "OK", "novo_saldo": evento["saldo"]}
+
 
+    def depositar_agrupado(self, pedidos) -> List[Any]:
+        """
+        Vários depósitos numa transação só (ver AgrupadorDepositos): um crédito
+        somado por (carteira, moeda) e um INSERT multi-linha em deposito_saque.
+
+        Devolve, na ordem dos pedidos, o resultado de cada um ou o ValueError
+        que ele receberia sozinho; um pedido inválido não afeta os demais.
+        O novo_saldo de cada pedido (e o saldo do seu evento) é o que ele veria
+        se os depósitos do lote tivessem rodado um a um, na ordem de chegada.
+        """
+        conn = self.uow.conexao
+        resultados: List[Any] = [None] * len(pedidos)
+
+        aceitos = []
+        for indice, pedido in enumerate(pedidos):
+            try:
+                if not self.validar_chave(pedido.endereco, pedido.chave_privada):
+                    raise ValueError("Chave privada inválida")
+                valor = Decimal(pedido.valor)
+                if valor <= 0:
+                    raise ValueError("Valor deve ser positivo")
+            except ValueError as e:
+                resultados[indice] = e
+                continue
+            aceitos.append((indice, pedido.endereco, pedido.id_moeda, valor))
+
+        # linhas de saldo nunca são apagadas: a leitura sem trava basta para
+        # rejeitar a moeda que a carteira não tem
+        consulta_saldos = text("""
+            SELECT endereco_carteira, id_moeda
+              FROM saldo_carteira
+             WHERE endereco_carteira IN :enderecos
+        """).bindparams(bindparam("enderecos", expanding=True))
+        existentes = set()
+        for bloco in _em_blocos(sorted({a[1] for a in aceitos}), self.TAMANHO_BLOCO):
+            existentes.update(tuple(r) for r in conn.execute(consulta_saldos, {"enderecos": bloco}))
+
+        creditos: Dict[Tuple[str, int], Decimal] = {}
+        validos = []
+        for indice, endereco, moeda, valor in aceitos:
+            if (endereco, moeda) not in existentes:
+                resultados[indice] = ValueError("Moeda não encontrada na carteira")
+                continue
+            creditos[(endereco, moeda)] = creditos.get((endereco, moeda), Decimal("0")) + valor
+            validos.append((indice, endereco, moeda, valor))
+        if not validos:
+            return resultados
+
+        # mesma ordem de trava de _movimentar_saldos: (endereco, id_moeda)
+        parametros_credito = []
+        for (endereco, moeda), valor in sorted(creditos.items()):
+            if self._fatias(endereco) > 1:
+                self._creditar(conn, endereco, moeda, valor)
+            else:
+                parametros_credito.append({"endereco": endereco, "moeda": moeda, "valor": valor})
+        for bloco in _em_blocos(parametros_credito, self.TAMANHO_BLOCO):
+            conn.execute(SQL_CREDITO, bloco)
+
+        for bloco in _em_blocos(validos, self.TAMANHO_BLOCO):
             conn.execute(
                 text("""
-                    INSERT INTO deposito_saque 
+                    INSERT INTO deposito_saque
                     (endereco_carteira, id_moeda, tipo, valor, taxa_valor, data_hora)
                     VALUES (:endereco, :moeda, 'DEPOSITO', :valor, 0, NOW())
                 """),
-                {"endereco": endereco, "valor": valor, "moeda": moeda}
+                [{"endereco": e, "moeda": m, "valor": v} for _, e, m, v in bloco]
             )
 
-        return {"status": "OK", "novo_saldo": self.obter_saldo(endereco, moeda)}
-    
+        eventos = self._registrar_eventos(
+            conn, [Variacao(endereco, "DEPOSITO", moeda, valor) for _, endereco, moeda, valor in validos]
+        )
+        for (indice, _, _, _), evento in zip(validos, eventos):
+            resultados[indice] = {"status": "OK", "novo_saldo": evento["saldo"]}
+        return resultados
+
+
+    def sacar(self, endereco, moeda, valor, chave_privada, chave_idempotencia=None):
+        if chave_idempotencia:
+            return self._idempotente(
+                endereco, chave_idempotencia, "SAQUE", [moeda, valor, chave_privada],
+                lambda: self.sacar(endereco, moeda, valor, chave_privada),
+            )
 
-    def sacar(self, endereco, moeda, valor, chave_privada):
         if not self.validar_chave(endereco, chave_privada):
             raise ValueError("Chave privada inválida")
 
         valor = Decimal(valor)
+        if valor <= 0:
+            raise ValueError("Valor deve ser positivo")
         taxa_valor = valor * Decimal("0.02")
         total = valor + taxa_valor
 
-        saldo_atual = self.obter_saldo(endereco, moeda)
-        if saldo_atual < total:
-            raise ValueError("Saldo insuficiente")
+        conn = self.uow.conexao
+        self._movimentar_saldos(conn, [
+            Movimento(endereco, moeda, -total, "Saldo insuficiente"),
+        ])
+
+        conn.execute(
+            text("""
+                INSERT INTO deposito_saque 
+                (endereco_carteira, id_moeda, tipo, valor, taxa_valor, data_hora)
+                VALUES (:endereco, :moeda, 'SAQUE', :valor, :taxa_valor, NOW())
+            """),
+            {"endereco": endereco, "valor": valor, "taxa_valor": taxa_valor, "moeda": moeda}
+        )
+
+        evento, = self._registrar_eventos(conn, [Variacao(endereco, "SAQUE", moeda, -total)])
+        return {"status": "OK", "novo_saldo": evento["saldo"]}
+
+
+    def _idempotente(self, endereco, chave, operacao, requisicao, executar):
+        """
+        Executa `executar` uma única vez por (carteira, Idempotency-Key).
 
-        with get_connection() as conn:
+        A chave entra na transação da operação antes de tocar nos saldos:
+        uma repetição concorrente fica presa no INSERT até a primeira
+        terminar; se ela fez commit, devolve a resposta gravada, se fez
+        rollback (erro), a repetição segue e executa a operação.
+        """
+        conn = self.uow.conexao
+        hash_requisicao = hashlib.sha256(
+            json.dumps([operacao, *requisicao], default=str).encode()
+        ).hexdigest()
+        chaves = {"endereco": endereco, "chave": chave}
+
+        try:
             conn.execute(
                 text("""
-                    UPDATE saldo_carteira
-                    SET saldo = saldo - :total
-                    WHERE endereco_carteira = :endereco 
-                    AND id_moeda = :moeda
+                    INSERT INTO idempotencia (endereco_carteira, chave, operacao, hash_requisicao)
+                    VALUES (:endereco, :chave, :operacao, :hash)
                 """),
-                {"total": total, "endereco": endereco, "moeda": moeda}
+                {**chaves, "operacao": operacao, "hash": hash_requisicao}
             )
-
-            conn.execute(
+        except IntegrityError:
+            # leitura com trava: enxerga o commit da primeira mesmo com snapshot antigo
+            row = conn.execute(
                 text("""
-                    INSERT INTO deposito_saque 
-                    (endereco_carteira, id_moeda, tipo, valor, taxa_valor, data_hora)
-                    VALUES (:endereco, :moeda, 'SAQUE', :valor, :taxa_valor, NOW())
+                    SELECT operacao, hash_requisicao, resposta
+                    FROM idempotencia
+                    WHERE endereco_carteira = :endereco
+                    AND chave = :chave
+                    LOCK IN SHARE MODE
                 """),
-                {"endereco": endereco, "valor": valor, "taxa_valor": taxa_valor, "moeda": moeda}
-            )
+                chaves
+            ).mappings().first()
+            if row is None or row["resposta"] is None:
+                raise ValueError("Requisição com esta Idempotency-Key em andamento, tente novamente")
+            if row["operacao"] != operacao or row["hash_requisicao"] != hash_requisicao:
+                raise ValueError("Idempotency-Key já usada em outra requisição")
+            return json.loads(row["resposta"])
 
-        return {"status": "OK", "novo_saldo": saldo_atual - total}
+        resultado = executar()
+        conn.execute(
+            text("""
+                UPDATE idempotencia
+                SET resposta = :resposta
+                WHERE endereco_carteira = :endereco
+                AND chave = :chave
+            """),
+            {**chaves, "resposta": json.dumps(resultado, default=_para_json)}
+        )
+        return resultado
 
 
-    def obter_saldo(self, endereco, moeda):
-        with get_connection() as conn:
-            row = conn.execute(
+    def expurgar_idempotencia(self, retencao_horas: int, limite: int) -> int:
+        result = self.uow.conexao.execute(
+            text("""
+                DELETE FROM idempotencia
+                WHERE criada_em < NOW() - INTERVAL :horas HOUR
+                LIMIT :limite
+            """),
+            {"horas": retencao_horas, "limite": limite}
+        )
+        return result.rowcount
+
+
+    def _movimentar_saldos(self, conn, movimentos: List[Movimento]):
+        """
+        Aplica créditos e débitos na transação de `conn`.
+
+        As linhas de saldo_carteira são sempre travadas na mesma ordem
+        (endereco, id_moeda), então operações em sentidos opostos não se
+        bloqueiam mutuamente. O débito é um UPDATE condicional ao saldo:
+        a checagem e a escrita acontecem numa única ida ao banco, sem janela
+        para outra transação sacar o mesmo dinheiro.
+        """
+        for mov in sorted(movimentos, key=lambda m: (m.endereco, m.id_moeda)):
+            if mov.valor < 0:
+                ok = self._debitar(conn, mov.endereco, mov.id_moeda, -mov.valor)
+            else:
+                ok = self._creditar(conn, mov.endereco, mov.id_moeda, mov.valor)
+            if not ok:
+                raise ValueError(mov.erro)
+
+
+    def _debitar(self, conn, endereco, moeda, valor) -> bool:
+        params = {"valor": valor, "endereco": endereco, "moeda": moeda}
+        if conn.execute(SQL_DEBITO, params).rowcount > 0:
+            return True
+        status = conn.execute(
+            text("SELECT status FROM carteira WHERE endereco_carteira = :endereco"),
+            {"endereco": endereco},
+        ).scalar()
+        if status == "BLOQUEADA":
+            # bloqueada em outro worker depois que este guardou o status no cache
+            cache_carteiras.invalidar(endereco)
+            raise ValueError("Carteira bloqueada")
+        # a linha principal sozinha não cobre: traz as fatias (se houver) e tenta de novo
+        if self._consolidar_fatias(conn, endereco, moeda):
+            return conn.execute(SQL_DEBITO, params).rowcount > 0
+        return False
+
+
+    def _consolidar_fatias(self, conn, endereco, moeda) -> bool:
+        """
+        Move a soma das fatias para a linha principal de saldo_carteira.
+        Roda depois do débito condicional que falhou, então a linha principal
+        já está travada por esta transação; as fatias são travadas aqui.
+        """
+        params = {"endereco": endereco, "moeda": moeda}
+        soma = conn.execute(
+            text("""
+                SELECT COALESCE(SUM(saldo), 0)
+                FROM saldo_carteira_fatia
+                WHERE endereco_carteira = :endereco
+                AND id_moeda = :moeda
+                FOR UPDATE
+            """),
+            params
+        ).scalar()
+        if not soma:
+            return False
+
+        conn.execute(
+            text("""
+                UPDATE saldo_carteira_fatia
+                SET saldo = 0, versao = versao + 1, data_atualizacao = NOW()
+                WHERE endereco_carteira = :endereco
+                AND id_moeda = :moeda
+            """),
+            params
+        )
+        conn.execute(SQL_CREDITO, {**params, "valor": soma})
+        return True
+
+
+    def _creditar(self, conn, endereco, moeda, valor) -> bool:
+        params = {"valor": valor, "endereco": endereco, "moeda": moeda}
+        fatias = self._fatias(endereco)
+        if fatias > 1 and moeda in self._moedas():
+            params["fatia"] = random.randrange(fatias)
+            if conn.execute(SQL_CREDITO_FATIA, params).rowcount > 0:
+                return True
+        return conn.execute(SQL_CREDITO, params).rowcount > 0
+
+
+    def _fatias(self, endereco) -> int:
+        return carteiras_quentes.obter().get(endereco, 0)
+
+
+    def definir_fatias(self, endereco: str, fatias: int) -> bool:
+        """
+        Marca (fatias > 1) ou desmarca a carteira como quente. As fatias que
+        faltam são criadas zeradas; ao desmarcar, o que está nas fatias volta
+        para a linha principal. Ao reduzir o número, as fatias que sobram
+        continuam somando no saldo até o próximo débito consolidá-las.
+        """
+        conn = self.uow.conexao
+        result = conn.execute(
+            text("UPDATE carteira SET fatias_saldo = :fatias WHERE endereco_carteira = :endereco"),
+            {"fatias": fatias, "endereco": endereco}
+        )
+        if result.rowcount == 0:
+            return False
+
+        if fatias > 1:
+            conn.execute(
                 text("""
-                    SELECT saldo 
+                    INSERT IGNORE INTO saldo_carteira_fatia (endereco_carteira, id_moeda, fatia, saldo)
+                    SELECT endereco_carteira, id_moeda, :fatia, 0
                     FROM saldo_carteira
                     WHERE endereco_carteira = :endereco
-                    AND id_moeda = :moeda
                 """),
-                {"endereco": endereco, "moeda": moeda}
-            ).mappings().first()
+                [{"endereco": endereco, "fatia": f} for f in range(fatias)]
+            )
+        else:
+            moedas = conn.execute(
+                text("""
+                    SELECT id_moeda
+                    FROM saldo_carteira
+                    WHERE endereco_carteira = :endereco
+                    ORDER BY id_moeda
+                    FOR UPDATE
+                """),
+                {"endereco": endereco}
+            ).scalars().all()
+            for moeda in moedas:
+                self._consolidar_fatias(conn, endereco, moeda)
+        self.uow.apos_commit(carteiras_quentes.invalidar)
+        return True
+
+
+    def _saldo(self, conn, endereco, moeda):
+        row = conn.execute(
+            text("""
+                SELECT s.saldo + COALESCE((
+                    SELECT SUM(f.saldo)
+                    FROM saldo_carteira_fatia f
+                    WHERE f.endereco_carteira = s.endereco_carteira
+                    AND f.id_moeda = s.id_moeda
+                ), 0) AS saldo
+                FROM saldo_carteira s
+                WHERE s.endereco_carteira = :endereco
+                AND s.id_moeda = :moeda
+            """),
+            {"endereco": endereco, "moeda": moeda}
+        ).mappings().first()
 
         return row["saldo"]
-    
 
-    def converter(self, endereco, id_moeda_origem, id_moeda_destino, valor_origem):
+
+    def _saldos(self, conn, enderecos: List[str]) -> Dict[Tuple[str, int], Decimal]:
+        consulta = text("""
+            SELECT s.endereco_carteira, s.id_moeda, s.saldo + COALESCE((
+                SELECT SUM(f.saldo)
+                FROM saldo_carteira_fatia f
+                WHERE f.endereco_carteira = s.endereco_carteira
+                AND f.id_moeda = s.id_moeda
+            ), 0) AS saldo
+            FROM saldo_carteira s
+            WHERE s.endereco_carteira IN :enderecos
+        """).bindparams(bindparam("enderecos", expanding=True))
+        saldos = {}
+        for bloco in _em_blocos(enderecos, self.TAMANHO_BLOCO):
+            for r in conn.execute(consulta, {"enderecos": bloco}):
+                saldos[(r.endereco_carteira, r.id_moeda)] = r.saldo
+        return saldos
+
+
+    def _registrar_eventos(self, conn, variacoes: List[Variacao]) -> List[Dict[str, Any]]:
+        """
+        Grava no outbox (EVENTO_SALDO) um evento por variação, já aplicada
+        nesta transação: o evento só existe se a movimentação fizer commit.
+        O saldo de cada evento é o que a variação deixou, como se as da lista
+        tivessem rodado uma a uma, na ordem da lista.
+        """
+        if not variacoes:
+            return []
+        saldos = self._saldos(conn, sorted({v.endereco for v in variacoes}))
+        corrente = dict(saldos)
+        for v in variacoes:
+            corrente[(v.endereco, v.id_moeda)] -= v.valor
+
+        eventos = []
+        for v in variacoes:
+            corrente[(v.endereco, v.id_moeda)] += v.valor
+            eventos.append({
+                "endereco": v.endereco,
+                "tipo": v.tipo,
+                "moeda": v.id_moeda,
+                "valor": v.valor,
+                "saldo": corrente[(v.endereco, v.id_moeda)],
+                "contraparte": v.contraparte,
+            })
+        for bloco in _em_blocos(eventos, self.TAMANHO_BLOCO):
+            conn.execute(SQL_EVENTO, bloco)
+        return eventos
+
+
+    def _formatar_evento(self, row) -> Dict[str, Any]:
+        moeda = self._moedas().get(row["id_moeda"])
+        return {
+            "id_evento": row["id_evento"],
+            "endereco_carteira": row["endereco_carteira"],
+            "tipo": row["tipo"],
+            "moeda_codigo": moeda.codigo if moeda else None,
+            "valor": row["valor"],
+            "saldo": row["saldo"],
+            "endereco_contraparte": row["endereco_contraparte"],
+            "data_hora": row["data_hora"],
+        }
+
+
+    def ultimo_evento(self) -> int:
+        return self.uow.conexao.execute(text("SELECT COALESCE(MAX(id_evento), 0) FROM evento_saldo")).scalar()
+
+
+    def ids_eventos(self, apos: int, ate: int) -> List[int]:
+        """Ids presentes em (`apos`, `ate`]; os que faltam são lacunas ou desfeitos."""
+        rows = self.uow.conexao.execute(
+            text("SELECT id_evento FROM evento_saldo WHERE id_evento > :apos AND id_evento <= :ate ORDER BY id_evento"),
+            {"apos": apos, "ate": ate}
+        )
+        return [r[0] for r in rows]
+
+
+    def eventos_desde(self, apos: int, limite: int) -> List[Dict[str, Any]]:
+        """Eventos de todas as carteiras com id > `apos`, em ordem de id (cauda do outbox)."""
+        rows = self.uow.conexao.execute(
+            text("""
+                SELECT id_evento, endereco_carteira, tipo, id_moeda, valor, saldo,
+                       endereco_contraparte, data_hora
+                  FROM evento_saldo
+                 WHERE id_evento > :apos
+                 ORDER BY id_evento
+                 LIMIT :limite
+            """),
+            {"apos": apos, "limite": limite}
+        ).mappings()
+        return [self._formatar_evento(r) for r in rows]
+
+
+    def eventos_carteira(self, endereco: str, apos: int, ate: int, limite: int) -> List[Dict[str, Any]]:
+        """Eventos de uma carteira com id em (`apos`, `ate`], em ordem de id (retomada do SSE)."""
+        rows = self.uow.conexao.execute(
+            text("""
+                SELECT id_evento, endereco_carteira, tipo, id_moeda, valor, saldo,
+                       endereco_contraparte, data_hora
+                  FROM evento_saldo
+                 WHERE endereco_carteira = :endereco
+                   AND id_evento > :apos
+                   AND id_evento <= :ate
+                 ORDER BY id_evento
+                 LIMIT :limite
+            """),
+            {"endereco": endereco, "apos": apos, "ate": ate, "limite": limite}
+        ).mappings()
+        return [self._formatar_evento(r) for r in rows]
+
+
+    def expurgar_eventos(self, retencao_horas: int, limite: int) -> int:
+        # em ordem de id: os mais velhos estão no começo da chave primária
+        result = self.uow.conexao.execute(
+            text("""
+                DELETE FROM evento_saldo
+                WHERE data_hora < NOW() - INTERVAL :horas HOUR
+                ORDER BY id_evento
+                LIMIT :limite
+            """),
+            {"horas": retencao_horas, "limite": limite}
+        )
+        return result.rowcount
+
+
+    def obter_saldo(self, endereco, moeda):
+        conn = self.uow.conexao
+        return self._saldo(conn, endereco, moeda)
+
+
+    def converter(self, endereco, id_moeda_origem, id_moeda_destino, valor_origem, id_cotacao=None,
+                  chave_idempotencia=None):
+        if chave_idempotencia:
+            return self._idempotente(
+                endereco, chave_idempotencia, "CONVERSAO",
+                [id_moeda_origem, id_moeda_destino, valor_origem, id_cotacao],
+                lambda: self.converter(endereco, id_moeda_origem, id_moeda_destino, valor_origem, id_cotacao),
+            )
+
         valor_origem = Decimal(valor_origem)
+        if valor_origem <= 0:
+            raise ValueError("Valor deve ser positivo")
 
-        saldo_origem = self.obter_saldo(endereco, id_moeda_origem)
-        if saldo_origem < valor_origem:
-            raise ValueError("Saldo insuficiente para conversão")
+        if id_moeda_origem == id_moeda_destino:
+            raise ValueError("Moedas de origem e destino não podem ser iguais")
 
-        codigo_origem = self.get_codigo_moeda(id_moeda_origem)
-        codigo_destino = self.get_codigo_moeda(id_moeda_destino)
+        if id_cotacao is None:
+            cotacao = self.cotacao_de_mercado(id_moeda_origem, id_moeda_destino)
 
-        resp = requests.get(f"https://api.coinbase.com/v2/exchange-rates?currency={codigo_origem}")
-        if resp.status_code != 200:
-            raise ValueError("Erro ao consultar cotação na Coinbase")
-        data = resp.json()
-        cotacao = Decimal(data["data"]["rates"][codigo_destino])
+        conn = self.uow.conexao
+        if id_cotacao is not None:
+            # cotação travada: nada de rede aqui, só o que foi gravado em criar_cotacao
+            cotacao = self._consumir_cotacao(conn, id_cotacao, endereco, id_moeda_origem, id_moeda_destino)
 
         valor_destino = valor_origem * cotacao
         taxa_percentual = Decimal("0.02")
         taxa_valor = valor_destino * taxa_percentual
         valor_destino_final = valor_destino - taxa_valor
 
-        with get_connection() as conn:
-            conn.execute(
-                text("UPDATE saldo_carteira SET saldo = saldo - :valor WHERE endereco_carteira=:endereco AND id_moeda=:moeda"),
-                {"valor": valor_origem, "endereco": endereco, "moeda": id_moeda_origem}
-            )
-            conn.execute(
-                text("UPDATE saldo_carteira SET saldo = saldo + :valor WHERE endereco_carteira=:endereco AND id_moeda=:moeda"),
-                {"valor": valor_destino_final, "endereco": endereco, "moeda": id_moeda_destino}
-            )
+        self._movimentar_saldos(conn, [
+            Movimento(endereco, id_moeda_origem, -valor_origem, "Saldo insuficiente para conversão"),
+            Movimento(endereco, id_moeda_destino, valor_destino_final, "Moeda de destino não encontrada na carteira"),
+        ])
+        conn.execute(
+            text("""
+                INSERT INTO conversao (endereco_carteira, id_moeda_origem, id_moeda_destino,
+                                        valor_origem, valor_destino, taxa_percentual, taxa_valor, cotacao_utilizada)
+                VALUES (:endereco, :moeda_origem, :moeda_destino, :valor_origem, :valor_destino, :taxa_percentual, :taxa_valor, :cotacao)
+            """),
+            {
+                "endereco": endereco,
+                "moeda_origem": id_moeda_origem,
+                "moeda_destino": id_moeda_destino,
+                "valor_origem": valor_origem,
+                "valor_destino": valor_destino_final,
+                "taxa_percentual": taxa_percentual,
+                "taxa_valor": taxa_valor,
+                "cotacao": cotacao
+            }
+        )
+        self._registrar_eventos(conn, [
+            Variacao(endereco, "CONVERSAO", id_moeda_origem, -valor_origem),
+            Variacao(endereco, "CONVERSAO", id_moeda_destino, valor_destino_final),
+        ])
+
+        return {"status": "OK", "valor_convertido": str(valor_destino_final)}
+
+
+    def listar_moedas(self) -> Dict[int, str]:
+        return {id_moeda: moeda.codigo for id_moeda, moeda in self._moedas().items()}
+
+
+    def cotacao_de_mercado(self, id_moeda_origem: int, id_moeda_destino: int) -> Decimal:
+        moedas = self.listar_moedas()
+        for id_moeda in (id_moeda_origem, id_moeda_destino):
+            if id_moeda not in moedas:
+                raise ValueError(f"Moeda com id {id_moeda} não encontrada")
+
+        matriz = self.cotacoes.obter_matriz(moedas.values())
+        return matriz.taxa(moedas[id_moeda_origem], moedas[id_moeda_destino])
+
+
+    def vetor_cotacoes(self, codigo_destino: str) -> Dict[int, Decimal]:
+        """
+        Cotação de cada moeda do catálogo para `codigo_destino`, por id_moeda,
+        todas do mesmo snapshot. Moedas sem cotação ficam de fora.
+        """
+        moedas = self._moedas()
+        if codigo_destino not in {m.codigo for m in moedas.values()}:
+            raise ValueError(f"Moeda {codigo_destino} não encontrada")
+        vetor = self.cotacoes.obter_matriz(m.codigo for m in moedas.values()).para(codigo_destino)
+        return {id_moeda: vetor[m.codigo] for id_moeda, m in moedas.items() if m.codigo in vetor}
+
+
+    def valor_carteira(self, endereco: str, codigo_destino: str) -> Dict[str, Any]:
+        cotacoes = self.vetor_cotacoes(codigo_destino)
+        codigos = {m.codigo: id_moeda for id_moeda, m in self._moedas().items()}
+
+        itens = []
+        total = Decimal("0")
+        for s in self.listar_saldos(endereco):
+            cotacao = cotacoes.get(codigos[s["moeda_codigo"]])
+            if cotacao is None:
+                if s["saldo"]:
+                    raise ValueError(f"Cotação {s['moeda_codigo']}/{codigo_destino} indisponível")
+                continue
+            valor = s["saldo"] * cotacao
+            total += valor
+            itens.append({
+                "moeda_codigo": s["moeda_codigo"],
+                "saldo": s["saldo"],
+                "cotacao": cotacao.quantize(CASAS_DECIMAIS),
+                "valor": valor.quantize(CASAS_DECIMAIS),
+            })
+
+        return {
+            "endereco": endereco,
+            "moeda": codigo_destino,
+            "valor_total": total.quantize(CASAS_DECIMAIS),
+            "itens": itens,
+        }
+
+
+    def criar_cotacao(self, endereco, id_moeda_origem, id_moeda_destino) -> Dict[str, Any]:
+        validade = int(os.getenv("COTACAO_VALIDADE_SEGUNDOS", "30"))
+        cotacao = self.cotacao_de_mercado(id_moeda_origem, id_moeda_destino).quantize(CASAS_DECIMAIS)
+        id_cotacao = secrets.token_hex(16)
+
+        conn = self.uow.conexao
+        try:
             conn.execute(
                 text("""
-                    INSERT INTO conversao (endereco_carteira, id_moeda_origem, id_moeda_destino,
-                                            valor_origem, valor_destino, taxa_percentual, taxa_valor, cotacao_utilizada)
-                    VALUES (:endereco, :moeda_origem, :moeda_destino, :valor_origem, :valor_destino, :taxa_percentual, :taxa_valor, :cotacao)
+                    INSERT INTO cotacao (id_cotacao, endereco_carteira, id_moeda_origem,
+                                         id_moeda_destino, cotacao, expira_em)
+                    VALUES (:id, :endereco, :moeda_origem, :moeda_destino, :cotacao,
+                            DATE_ADD(NOW(), INTERVAL :validade SECOND))
                 """),
                 {
+                    "id": id_cotacao,
                     "endereco": endereco,
                     "moeda_origem": id_moeda_origem,
                     "moeda_destino": id_moeda_destino,
-                    "valor_origem": valor_origem,
-                    "valor_destino": valor_destino_final,
-                    "taxa_percentual": taxa_percentual,
-                    "taxa_valor": taxa_valor,
-                    "cotacao": cotacao
+                    "cotacao": cotacao,
+                    "validade": validade,
                 }
             )
+        except IntegrityError:
+            raise ValueError("Carteira não encontrada")
 
-        return {"status": "OK", "valor_convertido": str(valor_destino_final)}
+        row = conn.execute(
+            text("""
+                SELECT id_cotacao,
+                       endereco_carteira,
+                       id_moeda_origem,
+                       id_moeda_destino,
+                       cotacao,
+                       expira_em
+                  FROM cotacao
+                 WHERE id_cotacao = :id
+            """),
+            {"id": id_cotacao},
+        ).mappings().first()
+
+        return dict(row)
+
+
+    def _consumir_cotacao(self, conn, id_cotacao, endereco, id_moeda_origem, id_moeda_destino) -> Decimal:
+        row = conn.execute(
+            text("""
+                SELECT cotacao,
+                       endereco_carteira,
+                       id_moeda_origem,
+                       id_moeda_destino,
+                       utilizada_em,
+                       expira_em > NOW() AS valida
+                  FROM cotacao
+                 WHERE id_cotacao = :id
+                   FOR UPDATE
+            """),
+            {"id": id_cotacao}
+        ).mappings().first()
+
+        if not row or row["endereco_carteira"] != endereco:
+            raise ValueError("Cotação não encontrada")
+        if (row["id_moeda_origem"], row["id_moeda_destino"]) != (id_moeda_origem, id_moeda_destino):
+            raise ValueError("Cotação emitida para outro par de moedas")
+        if row["utilizada_em"] is not None:
+            raise ValueError("Cotação já utilizada")
+        if not row["valida"]:
+            raise ValueError("Cotação expirada")
+
+        conn.execute(
+            text("UPDATE cotacao SET utilizada_em = NOW() WHERE id_cotacao = :id"),
+            {"id": id_cotacao}
+        )
+        return row["cotacao"]
 
 
     def get_codigo_moeda(self, id_moeda: int) -> str:
-        with get_connection() as conn:
-            row = conn.execute(
-                text("SELECT codigo FROM moeda WHERE id_moeda = :id"),
-                {"id": id_moeda}
-            ).mappings().first()
-        if not row:
+        moeda = self._moedas().get(id_moeda)
+        if not moeda:
             raise ValueError(f"Moeda com id {id_moeda} não encontrada")
-        return row["codigo"]
+        return moeda.codigo
+
+    def transferir(self, endereco_origem, endereco_destino, id_moeda, valor, chave_privada,
+                   chave_idempotencia=None):
+        if chave_idempotencia:
+            return self._idempotente(
+                endereco_origem, chave_idempotencia, "TRANSFERENCIA",
+                [endereco_destino, id_moeda, valor, chave_privada],
+                lambda: self.transferir(endereco_origem, endereco_destino, id_moeda, valor, chave_privada),
+            )
 
-    def transferir(self, endereco_origem, endereco_destino, id_moeda, valor, chave_privada):
         if not self.validar_chave(endereco_origem, chave_privada):
             raise ValueError("Chave privada inválida")
         
@@ -302,45 +1229,189 @@ class CarteiraRepository:
             raise ValueError("Endereço de origem e destino não podem ser iguais")
 
         valor = Decimal(valor)
+        if valor <= 0:
+            raise ValueError("Valor deve ser positivo")
         taxa_percentual = Decimal("0.02")
         taxa_valor = valor * taxa_percentual
         total = valor + taxa_valor
 
-        saldo_origem = self.obter_saldo(endereco_origem, id_moeda)
-        if saldo_origem < total:
-            raise ValueError("Saldo insuficiente na origem")
+        conn = self.uow.conexao
+        self._movimentar_saldos(conn, [
+            Movimento(endereco_origem, id_moeda, -total, "Saldo insuficiente na origem"),
+            Movimento(endereco_destino, id_moeda, valor, "Carteira de destino não encontrada"),
+        ])
 
-        with get_connection() as conn:
-            conn.execute(
-                text("""
-                    UPDATE saldo_carteira
-                    SET saldo = saldo - :total
-                    WHERE endereco_carteira = :endereco AND id_moeda = :moeda
-                """),
-                {"total": total, "endereco": endereco_origem, "moeda": id_moeda}
-            )
+        conn.execute(
+            text("""
+                INSERT INTO transferencia (endereco_origem, endereco_destino, id_moeda, valor, taxa_valor, data_hora)
+                VALUES (:origem, :destino, :moeda, :valor, :taxa, NOW())
+            """),
+            {
+                "origem": endereco_origem,
+                "destino": endereco_destino,
+                "moeda": id_moeda,
+                "valor": valor,
+                "taxa": taxa_valor
+            }
+        )
+        self._registrar_eventos(conn, [
+            Variacao(endereco_origem, "TRANSFERENCIA", id_moeda, -total, endereco_destino),
+            Variacao(endereco_destino, "TRANSFERENCIA", id_moeda, valor, endereco_origem),
+        ])
 
-            conn.execute(
-                text("""
-                    UPDATE saldo_carteira
-                    SET saldo = saldo + :valor
-                    WHERE endereco_carteira = :endereco AND id_moeda = :moeda
-                """),
-                {"valor": valor, "endereco": endereco_destino, "moeda": id_moeda}
-            )
+        return {"status": "OK", "debito_origem": str(total), "credito_destino": str(valor)}
+
+
+    def _travar_saldos(self, conn, enderecos: List[str], moedas: List[int], sem_trava=frozenset()) -> set:
+        """
+        SELECT ... FOR UPDATE das linhas de saldo_carteira de `enderecos` nas
+        `moedas`, em ordem de (endereco, id_moeda) e em blocos também em
+        ordem. As de `sem_trava` só são lidas. Devolve os pares
+        (endereco, id_moeda) existentes.
+        """
+        if not moedas:
+            return set()
+        sem_trava = set(enderecos) & set(sem_trava)
+        pares = set()
+        for travar, grupo in ((True, sorted(set(enderecos) - sem_trava)), (False, sorted(sem_trava))):
+            consulta = text(f"""
+                SELECT endereco_carteira, id_moeda
+                  FROM saldo_carteira
+                 WHERE endereco_carteira IN :enderecos
+                   AND id_moeda IN :moedas
+                 ORDER BY endereco_carteira, id_moeda
+                {"FOR UPDATE" if travar else ""}
+            """).bindparams(bindparam("enderecos", expanding=True), bindparam("moedas", expanding=True))
+            for bloco in _em_blocos(grupo, self.TAMANHO_BLOCO):
+                pares.update(tuple(r) for r in conn.execute(consulta, {"enderecos": bloco, "moedas": moedas}))
+        return pares
+
+
+    def transferir_lote(self, endereco_origem, itens, chave_privada) -> Dict[str, Any]:
+        """
+        Paga vários destinos a partir de uma origem numa única transação.
+
+        Itens inválidos (destino inexistente ou sem saldo na moeda, igual à
+        origem, moeda desconhecida, valor não positivo) são rejeitados
+        individualmente. Se a origem não cobre o total de uma moeda, todos os
+        itens daquela moeda são rejeitados; os das outras moedas seguem
+        normalmente.
+
+        Antes de qualquer escrita, as linhas de saldo da origem e dos destinos
+        são travadas juntas na ordem (endereco, id_moeda) de
+        _movimentar_saldos, em vez de contar com a repetição após deadlock.
+        """
+        if not self.validar_chave(endereco_origem, chave_privada):
+            raise ValueError("Chave privada inválida")
 
+        conn = self.uow.conexao
+        moedas = self.listar_moedas()
+        taxa_percentual = Decimal("0.02")
+        rejeitados: List[Dict[str, Any]] = []
+
+        destinos = sorted({item.endereco_destino for item in itens})
+        existentes = set()
+        consulta_destinos = text("""
+            SELECT endereco_carteira
+              FROM carteira
+             WHERE endereco_carteira IN :enderecos
+        """).bindparams(bindparam("enderecos", expanding=True))
+        for bloco in _em_blocos(destinos, self.TAMANHO_BLOCO):
+            existentes.update(conn.execute(consulta_destinos, {"enderecos": bloco}).scalars())
+
+        candidatos = [
+            item for item in itens
+            if item.id_moeda in moedas and item.endereco_destino in existentes
+        ]
+        # destinos quentes recebem numa fatia: a linha principal não é travada
+        quentes = {
+            item.endereco_destino for item in candidatos
+            if item.endereco_destino != endereco_origem and self._fatias(item.endereco_destino) > 1
+        }
+        pares = self._travar_saldos(
+            conn,
+            [endereco_origem] + [item.endereco_destino for item in candidatos],
+            sorted({item.id_moeda for item in candidatos}),
+            quentes,
+        )
+
+        validos: Dict[int, List[Dict[str, Any]]] = {}
+        for indice, item in enumerate(itens):
+            valor = Decimal(item.valor)
+            if valor <= 0:
+                motivo = "Valor deve ser positivo"
+            elif item.id_moeda not in moedas:
+                motivo = f"Moeda com id {item.id_moeda} não encontrada"
+            elif item.endereco_destino == endereco_origem:
+                motivo = "Endereço de origem e destino não podem ser iguais"
+            elif item.endereco_destino not in existentes:
+                motivo = "Carteira de destino não encontrada"
+            elif (item.endereco_destino, item.id_moeda) not in pares:
+                motivo = "Moeda de destino não encontrada na carteira"
+            else:
+                taxa_valor = valor * taxa_percentual
+                validos.setdefault(item.id_moeda, []).append({
+                    "indice": indice,
+                    "origem": endereco_origem,
+                    "destino": item.endereco_destino,
+                    "moeda": item.id_moeda,
+                    "valor": valor,
+                    "taxa": taxa_valor,
+                    "total": valor + taxa_valor,
+                })
+                continue
+            rejeitados.append({"indice": indice, "motivo": motivo})
+
+        # um débito condicional por moeda, em ordem de id_moeda
+        debitos: Dict[int, str] = {}
+        aceitos: List[Dict[str, Any]] = []
+        for id_moeda in sorted(validos):
+            total = sum((t["total"] for t in validos[id_moeda]), Decimal("0"))
+            if not self._debitar(conn, endereco_origem, id_moeda, total):
+                rejeitados.extend(
+                    {"indice": t["indice"], "motivo": "Saldo insuficiente na origem"}
+                    for t in validos[id_moeda]
+                )
+                continue
+            debitos[id_moeda] = str(total)
+            aceitos.extend(validos[id_moeda])
+
+        # créditos somados por (destino, moeda), em ordem de chave, via executemany
+        creditos: Dict[tuple, Decimal] = {}
+        for t in aceitos:
+            chave = (t["destino"], t["moeda"])
+            creditos[chave] = creditos.get(chave, Decimal("0")) + t["valor"]
+        parametros_credito = []
+        for (endereco, moeda), valor in sorted(creditos.items()):
+            if self._fatias(endereco) > 1:
+                self._creditar(conn, endereco, moeda, valor)
+            else:
+                parametros_credito.append({"endereco": endereco, "moeda": moeda, "valor": valor})
+        for bloco in _em_blocos(parametros_credito, self.TAMANHO_BLOCO):
+            if conn.execute(SQL_CREDITO, bloco).rowcount != len(bloco):
+                # as linhas foram conferidas e travadas acima: não deveria acontecer
+                raise RuntimeError("Crédito da transferência em lote não encontrou a linha de saldo")
+
+        for bloco in _em_blocos(aceitos, self.TAMANHO_BLOCO):
             conn.execute(
                 text("""
                     INSERT INTO transferencia (endereco_origem, endereco_destino, id_moeda, valor, taxa_valor, data_hora)
                     VALUES (:origem, :destino, :moeda, :valor, :taxa, NOW())
                 """),
-                {
-                    "origem": endereco_origem,
-                    "destino": endereco_destino,
-                    "moeda": id_moeda,
-                    "valor": valor,
-                    "taxa": taxa_valor
-                }
+                [
+                    {k: t[k] for k in ("origem", "destino", "moeda", "valor", "taxa")}
+                    for t in bloco
+                ]
             )
+        variacoes = []
+        for t in sorted(aceitos, key=lambda t: t["indice"]):
+            variacoes.append(Variacao(endereco_origem, "TRANSFERENCIA", t["moeda"], -t["total"], t["destino"]))
+            variacoes.append(Variacao(t["destino"], "TRANSFERENCIA", t["moeda"], t["valor"], endereco_origem))
+        self._registrar_eventos(conn, variacoes)
 
-        return {"status": "OK", "debito_origem": str(total), "credito_destino": str(valor)}
+        return {
+            "status": "OK",
+            "aceitos": len(aceitos),
+            "rejeitados": sorted(rejeitados, key=lambda r: r["indice"]),
+            "debito_origem": debitos,
+        }
@@ -0,0 +1,102 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Tuple
+
+from api.persistence.repositories.carteira_repository import CarteiraRepository
+from api.persistence.unit_of_work_async import UnidadeDeTrabalhoAsync
+from api.services.cotacao_service import CotacaoService, CotacoesFixadas, get_cotacao_service
+
+
+class CarteiraRepositoryAsync:
+    """
+    Versão assíncrona do CarteiraRepository.
+
+    Cada método executa o método síncrono de mesmo nome sobre a conexão
+    assíncrona da unidade de trabalho (ver UnidadeDeTrabalhoAsync.executar),
+    então SQL, travas e validações são exatamente os mesmos nas duas versões.
+    """
+
+    def __init__(self, uow: UnidadeDeTrabalhoAsync, cotacoes: Optional[CotacaoService] = None):
+        self.uow = uow
+        self.cotacoes = cotacoes or get_cotacao_service()
+
+    async def _rodar(self, metodo: str, *args, leitura: bool = False, cotacoes: Optional[CotacoesFixadas] = None):
+        return await self.uow.executar(
+            lambda uow: getattr(CarteiraRepository(uow, cotacoes or self.cotacoes), metodo)(*args),
+            leitura=leitura,
+        )
+
+    async def _fixar_cotacoes(self) -> CotacoesFixadas:
+        # a busca HTTP do provedor é síncrona: roda numa thread, antes de
+        # pegar a conexão, e o run_sync só usa o snapshot (nunca o provedor)
+        return await asyncio.to_thread(self.cotacoes.fixar)
+
+    async def criar(self) -> Dict[str, Any]:
+        return await self._rodar("criar")
+
+    async def buscar_por_endereco(self, endereco_carteira: str) -> Optional[Dict[str, Any]]:
+        return await self._rodar("buscar_por_endereco", endereco_carteira, leitura=True)
+
+    async def versao_carteira(self, endereco_carteira: str) -> Optional[int]:
+        return await self._rodar("versao_carteira", endereco_carteira, leitura=True)
+
+    async def listar(
+        self,
+        apos: Optional[str] = None,
+        limite: int = 100,
+        status: Optional[str] = None,
+        criada_de: Optional[datetime] = None,
+        criada_ate: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        return await self._rodar("listar", apos, limite, status, criada_de, criada_ate, leitura=True)
+
+    async def extrato(
+        self,
+        endereco: str,
+        apos: Optional[Tuple[datetime, int, int]] = None,
+        limite: int = 100,
+        id_moeda: Optional[int] = None,
+        de: Optional[datetime] = None,
+        ate: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        return await self._rodar("extrato", endereco, apos, limite, id_moeda, de, ate, leitura=True)
+
+    async def atualizar_status(self, endereco_carteira: str, status: str) -> Optional[Dict[str, Any]]:
+        return await self._rodar("atualizar_status", endereco_carteira, status)
+
+    async def listar_saldos(self, endereco: str):
+        return await self._rodar("listar_saldos", endereco, leitura=True)
+
+    async def obter_saldo(self, endereco, moeda):
+        return await self._rodar("obter_saldo", endereco, moeda)
+
+    async def depositar(self, endereco, moeda, valor, chave_privada, chave_idempotencia=None):
+        return await self._rodar("depositar", endereco, moeda, valor, chave_privada, chave_idempotencia)
+
+    async def sacar(self, endereco, moeda, valor, chave_privada, chave_idempotencia=None):
+        return await self._rodar("sacar", endereco, moeda, valor, chave_privada, chave_idempotencia)
+
+    async def converter(self, endereco, id_moeda_origem, id_moeda_destino, valor_origem, id_cotacao=None,
+                        chave_idempotencia=None):
+        cotacoes = await self._fixar_cotacoes() if id_cotacao is None else None
+        return await self._rodar(
+            "converter", endereco, id_moeda_origem, id_moeda_destino, valor_origem, id_cotacao, chave_idempotencia,
+            cotacoes=cotacoes,
+        )
+
+    async def criar_cotacao(self, endereco, id_moeda_origem, id_moeda_destino) -> Dict[str, Any]:
+        cotacoes = await self._fixar_cotacoes()
+        return await self._rodar("criar_cotacao", endereco, id_moeda_origem, id_moeda_destino, cotacoes=cotacoes)
+
+    async def valor_carteira(self, endereco: str, codigo_destino: str) -> Dict[str, Any]:
+        cotacoes = await self._fixar_cotacoes()
+        return await self._rodar("valor_carteira", endereco, codigo_destino, leitura=True, cotacoes=cotacoes)
+
+    async def transferir(self, endereco_origem, endereco_destino, id_moeda, valor, chave_privada,
+                         chave_idempotencia=None):
+        return await self._rodar(
+            "transferir", endereco_origem, endereco_destino, id_moeda, valor, chave_privada, chave_idempotencia
+        )
+
+    async def transferir_lote(self, endereco_origem, itens, chave_privada) -> Dict[str, Any]:
+        return await self._rodar("transferir_lote", endereco_origem, itens, chave_privada)
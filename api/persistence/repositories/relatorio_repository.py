@@ -0,0 +1,60 @@
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from api.persistence.cache import Moeda, catalogo_moedas
+from api.persistence.unit_of_work import UnidadeDeTrabalho
+from api.observabilidade.metricas import instrumentar_repositorio
+
+
+@instrumentar_repositorio
+class RelatorioRepository:
+    """
+    Relatórios servidos pelas tabelas agregadas (ver api.jobs.volume_diario),
+    nunca pelas tabelas de movimentação.
+    """
+
+    def __init__(self, uow: UnidadeDeTrabalho):
+        self.uow = uow
+
+    def _moedas(self) -> Dict[int, Moeda]:
+        return catalogo_moedas.obter(lambda: self.uow.conexao)
+
+    def id_moeda(self, codigo: str) -> Optional[int]:
+        return next((id_moeda for id_moeda, m in self._moedas().items() if m.codigo == codigo), None)
+
+    def volume_diario(self, de: date, ate: date, id_moeda: Optional[int] = None,
+                      tipo: Optional[str] = None) -> List[Dict[str, Any]]:
+        # faixa da chave primária (dia, id_moeda, tipo): O(dias) linhas
+        sql = """
+            SELECT dia, id_moeda, tipo, quantidade, volume, taxas
+              FROM volume_diario
+             WHERE dia >= :de AND dia <= :ate
+        """
+        if id_moeda is not None:
+            sql += " AND id_moeda = :moeda"
+        if tipo is not None:
+            sql += " AND tipo = :tipo"
+        sql += " ORDER BY dia, id_moeda, tipo"
+
+        rows = self.uow.conexao_leitura.execute(
+            text(sql), {"de": de, "ate": ate, "moeda": id_moeda, "tipo": tipo}
+        ).mappings().all()
+        moedas = self._moedas()
+        return [
+            {
+                "dia": r["dia"],
+                "moeda_codigo": moedas[r["id_moeda"]].codigo,
+                "tipo": r["tipo"],
+                "quantidade": r["quantidade"],
+                "volume": r["volume"],
+                "taxas": r["taxas"],
+            }
+            for r in rows
+        ]
+
+    def volume_processado_ate(self) -> Optional[datetime]:
+        return self.uow.conexao_leitura.execute(
+            text("SELECT processado_ate FROM volume_diario_checkpoint WHERE id = 1")
+        ).scalar()
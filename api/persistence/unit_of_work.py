@@ -0,0 +1,135 @@
+from typing import Callable, List, Optional, TypeVar
+
+from sqlalchemy.engine import Engine, Connection, RootTransaction
+
+from api.persistence.db import get_engine, executar_com_retentativa
+from api.persistence.replica import conectar_leitura, usar_replica
+from api.observabilidade.metricas import medir_espera_pool
+
+T = TypeVar("T")
+
+
+class UnidadeDeTrabalho:
+    """
+    Uma conexão e uma transação para a requisição inteira.
+
+    A conexão só sai do pool no primeiro uso, e todos os métodos do
+    CarteiraRepository rodam nela. Quem cria a unidade decide o fim:
+    commit se der tudo certo, rollback se der erro (ver __exit__).
+    """
+
+    def __init__(self, engine_: Optional[Engine] = None):
+        # None = engine padrão (primário), resolvido só na primeira conexão
+        self._engine = engine_
+        self._conn: Optional[Connection] = None
+        self._trans: Optional[RootTransaction] = None
+        self._apos_commit: List[Callable[[], None]] = []
+        self._conn_leitura: Optional[Connection] = None
+
+    @property
+    def conexao(self) -> Connection:
+        if self._conn is None:
+            if self._conn_leitura is not None:
+                # a partir daqui as leituras também vão para o primário
+                self._conn_leitura.close()
+                self._conn_leitura = None
+            with medir_espera_pool():
+                self._conn = (self._engine or get_engine()).connect()
+        if self._trans is None:
+            self._trans = self._conn.begin()
+        return self._conn
+
+    @property
+    def conexao_leitura(self) -> Connection:
+        """
+        Conexão para as consultas puras do repositório. Vai para a réplica
+        só se a requisição permitir (ver replica.leitura_na_replica) e esta
+        unidade ainda não tiver usado o primário: depois de uma escrita, as
+        leituras da mesma unidade enxergam o que ela escreveu.
+        """
+        if self._conn_leitura is not None:
+            return self._conn_leitura
+        if self._conn is not None or self._engine is not None or not usar_replica():
+            return self.conexao
+        self._conn_leitura = conectar_leitura()
+        return self._conn_leitura
+
+    def apos_commit(self, acao: Callable[[], None]):
+        """Agenda `acao` para depois do commit (ex.: invalidar cache); descartada no rollback."""
+        self._apos_commit.append(acao)
+
+    def commit(self):
+        if self._trans is not None:
+            self._trans.commit()
+            self._trans = None
+        acoes, self._apos_commit = self._apos_commit, []
+        for acao in acoes:
+            acao()
+
+    def rollback(self):
+        if self._trans is not None:
+            self._trans.rollback()
+            self._trans = None
+        self._apos_commit = []
+
+    def fechar(self):
+        if self._conn_leitura is not None:
+            self._conn_leitura.close()
+            self._conn_leitura = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            self._trans = None
+
+    def executar(self, operacao: Callable[[], T]) -> T:
+        """
+        Executa uma operação de escrita; em deadlock ou lock timeout a
+        transação é desfeita e a operação roda de novo do início.
+        """
+        return executar_com_retentativa(operacao, antes_de_repetir=self.rollback)
+
+    def __enter__(self) -> "UnidadeDeTrabalho":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+        finally:
+            self.fechar()
+
+
+class UnidadeDeTrabalhoEmConexao(UnidadeDeTrabalho):
+    """
+    Unidade sobre uma conexão cuja transação é controlada por outra camada
+    (ex.: a versão async, que roda o repositório via AsyncConnection.run_sync).
+    Commit, rollback e retentativa ficam com o dono da conexão.
+    """
+
+    def __init__(self, conn: Connection, apos_commit: Optional[List[Callable[[], None]]] = None):
+        super().__init__()
+        self._conn = conn
+        if apos_commit is not None:
+            self._apos_commit = apos_commit
+
+    @property
+    def conexao(self) -> Connection:
+        return self._conn
+
+    @property
+    def conexao_leitura(self) -> Connection:
+        return self._conn
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def fechar(self):
+        pass
+
+    def executar(self, operacao: Callable[[], T]) -> T:
+        return operacao()
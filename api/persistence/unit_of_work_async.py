@@ -0,0 +1,109 @@
+import asyncio
+from typing import Callable, List, Optional, TypeVar
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncConnection, AsyncTransaction
+
+from api.persistence.db import erro_repetivel, espera_antes_de_repetir, tentativas_em_conflito
+from api.persistence.db_async import get_async_engine, get_async_engine_leitura
+from api.persistence.replica import get_monitor_replica, usar_replica
+from api.observabilidade.metricas import LEITURAS, medir_espera_pool
+from api.persistence.unit_of_work import UnidadeDeTrabalho, UnidadeDeTrabalhoEmConexao
+
+T = TypeVar("T")
+
+
+class UnidadeDeTrabalhoAsync:
+    """
+    Versão assíncrona da UnidadeDeTrabalho: uma AsyncConnection e uma
+    transação para a requisição inteira, abertas no primeiro uso.
+    """
+
+    def __init__(self, engine_: Optional[AsyncEngine] = None):
+        self._engine = engine_
+        self._conn: Optional[AsyncConnection] = None
+        self._trans: Optional[AsyncTransaction] = None
+        self._apos_commit: List[Callable[[], None]] = []
+        self._conn_leitura: Optional[AsyncConnection] = None
+
+    async def conexao(self) -> AsyncConnection:
+        if self._conn is None:
+            if self._conn_leitura is not None:
+                await self._conn_leitura.close()
+                self._conn_leitura = None
+            with medir_espera_pool():
+                self._conn = await (self._engine or get_async_engine()).connect()
+        if self._trans is None:
+            self._trans = await self._conn.begin()
+        return self._conn
+
+    async def conexao_leitura(self) -> AsyncConnection:
+        """Mesmas regras de UnidadeDeTrabalho.conexao_leitura, sobre o engine assíncrono da réplica."""
+        if self._conn_leitura is not None:
+            return self._conn_leitura
+        if self._conn is not None or self._engine is not None or not usar_replica():
+            return await self.conexao()
+        try:
+            with medir_espera_pool():
+                self._conn_leitura = await get_async_engine_leitura().connect()
+        except DBAPIError:
+            get_monitor_replica().marcar_falha()
+            return await self.conexao()
+        LEITURAS.labels("replica").inc()
+        return self._conn_leitura
+
+    async def commit(self):
+        if self._trans is not None:
+            await self._trans.commit()
+            self._trans = None
+        acoes, self._apos_commit = self._apos_commit, []
+        for acao in acoes:
+            acao()
+
+    async def rollback(self):
+        if self._trans is not None:
+            await self._trans.rollback()
+            self._trans = None
+        self._apos_commit = []
+
+    async def fechar(self):
+        if self._conn_leitura is not None:
+            await self._conn_leitura.close()
+            self._conn_leitura = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+            self._trans = None
+
+    async def executar(self, operacao: Callable[[UnidadeDeTrabalho], T], leitura: bool = False) -> T:
+        """
+        Roda `operacao` (código síncrono do repositório) sobre a conexão
+        assíncrona com AsyncConnection.run_sync: o SQL e as regras são os
+        mesmos da versão síncrona, mas a E/S não bloqueia o event loop.
+        Em deadlock ou lock timeout, desfaz a transação e repete.
+        Com `leitura=True` (consulta pura), pode rodar na réplica.
+        """
+        tentativas = tentativas_em_conflito()
+        for tentativa in range(1, tentativas + 1):
+            conn = await (self.conexao_leitura() if leitura else self.conexao())
+            try:
+                return await conn.run_sync(lambda sync_conn: operacao(
+                    UnidadeDeTrabalhoEmConexao(sync_conn, self._apos_commit)
+                ))
+            except DBAPIError as e:
+                if tentativa == tentativas or not erro_repetivel(e):
+                    raise
+                await self.rollback()
+                await asyncio.sleep(espera_antes_de_repetir(tentativa))
+
+    async def __aenter__(self) -> "UnidadeDeTrabalhoAsync":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                await self.commit()
+            else:
+                await self.rollback()
+        finally:
+            await self.fechar()
@@ -0,0 +1,173 @@
+import os
+import re
+import math
+import time
+import asyncio
+from collections import OrderedDict, deque
+from typing import Deque, Optional, Tuple
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from api.persistence.db import configuracao_pool
+from api.routers.consistencia import METODOS_LEITURA
+from api.observabilidade.metricas import (
+    ADMISSAO_EM_ANDAMENTO, ADMISSAO_ESPERA, ADMISSAO_FILA, REQUISICOES_DESCARTADAS,
+)
+
+# rotas que não usam o banco: nunca esperam nem são recusadas
+CAMINHOS_LIVRES = {"/metrics", "/docs", "/docs/oauth2-redirect", "/redoc", "/openapi.json"}
+
+# SSE: conexões longas que esperam eventos sem usar o banco (o despachante
+# faz uma única leitura do outbox por processo); ocupariam uma vaga cada
+ROTA_EVENTOS = re.compile(r"^/carteiras/[^/]+/eventos$")
+
+# /carteiras/{endereco}/... (POST /carteiras/lote cria carteiras, não é de uma carteira)
+ROTA_CARTEIRA = re.compile(r"^/carteiras/(?P<endereco>[^/]+)")
+
+
+def _recusa(status: int, detalhe: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        {"detail": detalhe},
+        status_code=status,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class ControleAdmissaoMiddleware:
+    """
+    Limita as requisições em andamento à capacidade do pool de conexões
+    (DB_POOL_TAMANHO + DB_POOL_EXCEDENTE, por processo). As demais esperam
+    numa fila FIFO de até `fila_max` lugares por no máximo `espera_max`
+    segundos; fila cheia ou prazo vencido viram 503 com Retry-After na hora,
+    em vez de a requisição ficar presa no threadpool e depois na espera do
+    pool até o pool_timeout.
+
+    A vaga vale até o fim da resposta (inclusive do corpo em streaming, que
+    segura a conexão enquanto envia).
+    """
+
+    def __init__(self, app: ASGIApp, max_em_andamento: int = None, fila_max: int = None,
+                 espera_max: float = None, retry_after: float = None):
+        self.app = app
+        pool = configuracao_pool()
+        self.max_em_andamento = max_em_andamento or int(
+            os.getenv("ADMISSAO_MAX_EM_ANDAMENTO") or pool["pool_size"] + pool["max_overflow"]
+        )
+        self.fila_max = fila_max if fila_max is not None else int(os.getenv("ADMISSAO_FILA_MAX", "100"))
+        self.espera_max = espera_max if espera_max is not None else float(os.getenv("ADMISSAO_ESPERA_MAX_SEGUNDOS", "2"))
+        self.retry_after = retry_after if retry_after is not None else float(os.getenv("ADMISSAO_RETRY_AFTER_SEGUNDOS", "1"))
+
+        self._em_andamento = 0
+        self._fila: Deque[asyncio.Future] = deque()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in CAMINHOS_LIVRES or ROTA_EVENTOS.match(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        motivo = await self._admitir()
+        if motivo:
+            REQUISICOES_DESCARTADAS.labels(motivo).inc()
+            resposta = _recusa(503, "Serviço sobrecarregado, tente novamente", self.retry_after)
+            await resposta(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self._liberar()
+
+    async def _admitir(self) -> Optional[str]:
+        """None quando a requisição ganhou uma vaga; senão, o motivo da recusa."""
+        if self._em_andamento < self.max_em_andamento and not self._fila:
+            self._em_andamento += 1
+            ADMISSAO_EM_ANDAMENTO.set(self._em_andamento)
+            return None
+        if len(self._fila) >= self.fila_max:
+            return "fila_cheia"
+
+        vaga = asyncio.get_running_loop().create_future()
+        self._fila.append(vaga)
+        ADMISSAO_FILA.set(len(self._fila))
+        inicio = time.perf_counter()
+        try:
+            # asyncio.wait não cancela a vaga no timeout: quem libera pode tê-la
+            # passado para cá no mesmo instante
+            await asyncio.wait((vaga,), timeout=self.espera_max)
+        except BaseException:
+            # cliente desconectou enquanto esperava
+            if vaga.done():
+                self._liberar()
+            else:
+                self._desistir(vaga)
+            raise
+        if not vaga.done():
+            self._desistir(vaga)
+            return "prazo"
+        ADMISSAO_ESPERA.observe(time.perf_counter() - inicio)
+        return None
+
+    def _desistir(self, vaga: asyncio.Future):
+        vaga.cancel()
+        self._fila.remove(vaga)
+        ADMISSAO_FILA.set(len(self._fila))
+
+    def _liberar(self):
+        # a vaga passa direto para o primeiro da fila; só sobra se a fila estiver vazia
+        while self._fila:
+            vaga = self._fila.popleft()
+            if not vaga.done():
+                vaga.set_result(None)
+                ADMISSAO_FILA.set(len(self._fila))
+                return
+        self._em_andamento -= 1
+        ADMISSAO_EM_ANDAMENTO.set(self._em_andamento)
+        ADMISSAO_FILA.set(0)
+
+
+class LimiteCarteiraMiddleware:
+    """
+    Token bucket por carteira nas requisições que escrevem em
+    /carteiras/{endereco}/...: `por_segundo` por segundo, com rajadas de até
+    `rajada`. Acima disso, 429 com Retry-After, antes de ocupar vaga na
+    admissão ou conexão do banco: uma carteira abusiva não toma o lugar das
+    outras. Transferências contam para a carteira de origem.
+
+    O limite é por processo (com N workers, até N vezes o configurado), e só
+    as `max_carteiras` carteiras usadas mais recentemente são lembradas.
+    """
+
+    def __init__(self, app: ASGIApp, por_segundo: float = None, rajada: float = None, max_carteiras: int = 10000):
+        self.app = app
+        self.por_segundo = por_segundo if por_segundo is not None else float(os.getenv("LIMITE_CARTEIRA_POR_SEGUNDO", "10"))
+        self.rajada = rajada if rajada is not None else float(os.getenv("LIMITE_CARTEIRA_RAJADA", "20"))
+        self.max_carteiras = max_carteiras
+        # endereco -> (fichas, instante da última atualização), do menos para o mais recente
+        self._baldes: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and self.por_segundo > 0 and scope["method"] not in METODOS_LEITURA:
+            rota = ROTA_CARTEIRA.match(scope["path"])
+            if rota and rota["endereco"] != "lote":
+                espera = self._consumir(rota["endereco"])
+                if espera:
+                    REQUISICOES_DESCARTADAS.labels("limite_carteira").inc()
+                    resposta = _recusa(429, "Muitas requisições para esta carteira, tente novamente", espera)
+                    await resposta(scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
+
+    def _consumir(self, endereco: str) -> float:
+        """Gasta uma ficha; devolve 0 se havia, senão os segundos até a próxima."""
+        agora = time.monotonic()
+        fichas, atualizado_em = self._baldes.pop(endereco, (self.rajada, agora))
+        fichas = min(self.rajada, fichas + (agora - atualizado_em) * self.por_segundo)
+        espera = 0.0
+        if fichas >= 1:
+            fichas -= 1
+        else:
+            espera = (1 - fichas) / self.por_segundo
+        self._baldes[endereco] = (fichas, agora)
+        if len(self._baldes) > self.max_carteiras:
+            self._baldes.popitem(last=False)
+        return espera
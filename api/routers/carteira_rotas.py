@@ -0,0 +1,302 @@
+"""
+Rotas de /carteiras, escritas uma vez para os dois modos da API (API_MODO).
+
+`criar_router` recebe a dependência que entrega o serviço da requisição.
+Os handlers são async e aguardam cada método do serviço: no modo async é o
+CarteiraServiceAsync; no sync, o CarteiraService dentro de ServicoEmThread,
+que roda cada chamada no threadpool, fora do event loop.
+"""
+from datetime import datetime
+from typing import Callable, List, Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response
+from fastapi.responses import StreamingResponse
+
+from api.routers.respostas import (
+    RespostaJSON, cabecalhos_versao, etag_versao, nao_modificado, resposta_nao_modificada,
+)
+from api.services.eventos_service import fluxo_eventos, ler_ultimo_evento
+from api.services.carteira_service import cursor_extrato
+from api.services.carteira_service_async import CarteiraServiceAsync
+from api.models.carteira_models import (
+    Carteira,
+    CarteiraCriada,
+    DepositoRequest,
+    SaqueRequest,
+    ConversaoRequest,
+    CotacaoRequest,
+    CotacaoTravada,
+    TransferenciaRequest,
+    TransferenciaLoteRequest,
+    SaldosCarteira,
+    MovimentoExtrato,
+    ValorCarteira
+)
+
+
+def _erro_consulta(e: ValueError) -> HTTPException:
+    # carteira inexistente é 404; parâmetro inválido (moeda, cursor) é 400
+    return HTTPException(status_code=404 if str(e) == "Carteira não encontrada" else 400, detail=str(e))
+
+
+def criar_router(get_servico: Callable) -> APIRouter:
+    router = APIRouter(prefix="/carteiras", tags=["carteiras"])
+
+    @router.post("", response_model=CarteiraCriada, status_code=201)
+    async def criar_carteira(service: CarteiraServiceAsync = Depends(get_servico)) -> CarteiraCriada:
+        try:
+            return await service.criar_carteira()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @router.post("/lote", status_code=201)
+    async def criar_carteiras_lote(
+        quantidade: int = Query(..., gt=0),
+        service: CarteiraServiceAsync = Depends(get_servico),
+    ):
+        """
+        Cria `quantidade` carteiras em blocos (uma transação por bloco) e devolve,
+        em NDJSON, uma linha `{endereco_carteira, chave_privada}` por carteira
+        já gravada.
+        """
+        try:
+            linhas = await service.criar_carteiras_lote(quantidade)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return StreamingResponse(linhas, status_code=201, media_type="application/x-ndjson")
+
+    @router.get("", response_model=List[Carteira])
+    async def listar_carteiras(
+        after: Optional[str] = None,
+        limit: Optional[int] = Query(None, ge=1, le=1000),
+        status: Optional[Literal["ATIVA", "BLOQUEADA"]] = None,
+        criada_de: Optional[datetime] = None,
+        criada_ate: Optional[datetime] = None,
+        formato: Literal["json", "ndjson"] = "json",
+        service: CarteiraServiceAsync = Depends(get_servico),
+    ):
+        """
+        Lista carteiras em ordem de endereço, paginando por cursor: passe em
+        `after` o último endereço recebido (ou o header `X-Proximo-Cursor`).
+
+        `formato=ndjson` devolve as linhas em streaming, lidas do banco por
+        cursor do lado do servidor; sem `limit`, percorre a tabela inteira.
+        """
+        if formato == "ndjson":
+            linhas = await service.listar_ndjson(after, limit, status, criada_de, criada_ate)
+            return StreamingResponse(linhas, media_type="application/x-ndjson")
+
+        limite = limit or 100
+        carteiras = await service.listar(after, limite, status, criada_de, criada_ate)
+        headers = {}
+        if len(carteiras) == limite:
+            headers["X-Proximo-Cursor"] = carteiras[-1]["endereco_carteira"]
+        return RespostaJSON(carteiras, headers=headers)
+
+    @router.get("/{endereco_carteira}", response_model=Carteira)
+    async def buscar_carteira(
+        endereco_carteira: str,
+        response: Response,
+        if_none_match: Optional[str] = Header(None),
+        service: CarteiraServiceAsync = Depends(get_servico),
+    ):
+        """
+        Devolve `ETag` com a versão da carteira; com `If-None-Match` igual, 304
+        sem corpo depois de ler só a versão.
+        """
+        # versão lida antes dos dados: se mudar no meio, o ETag sai velho (o
+        # próximo pedido recebe 200), nunca novo demais para um corpo antigo
+        etag = etag_versao(await service.versao_carteira(endereco_carteira))
+        if nao_modificado(if_none_match, etag):
+            return resposta_nao_modificada(etag)
+        try:
+            carteira = await service.buscar_por_endereco(endereco_carteira)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        response.headers.update(cabecalhos_versao(etag))
+        return carteira
+
+    @router.delete("/{endereco_carteira}", response_model=Carteira)
+    async def bloquear_carteira(
+        endereco_carteira: str,
+        service: CarteiraServiceAsync = Depends(get_servico),
+    ):
+        try:
+            return await service.bloquear(endereco_carteira)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    @router.get("/{endereco_carteira}/saldos", response_model=SaldosCarteira)
+    async def listar_saldos(
+        endereco_carteira: str,
+        if_none_match: Optional[str] = Header(None),
+        service: CarteiraServiceAsync = Depends(get_servico),
+    ):
+        """Mesmo ETag de GET /carteiras/{endereco_carteira}: 304 se nada mudou."""
+        etag = etag_versao(await service.versao_carteira(endereco_carteira))
+        if nao_modificado(if_none_match, etag):
+            return resposta_nao_modificada(etag)
+        try:
+            return RespostaJSON(await service.obter_saldos(endereco_carteira), headers=cabecalhos_versao(etag))
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    @router.get("/{endereco_carteira}/eventos")
+    async def eventos_carteira(
+        endereco_carteira: str,
+        last_event_id: Optional[str] = Header(None, max_length=20),
+        service: CarteiraServiceAsync = Depends(get_servico),
+    ):
+        """
+        Server-Sent Events (`text/event-stream`) com cada alteração de saldo da
+        carteira: um evento `saldo` por moeda movimentada em depósitos, saques,
+        conversões e transferências, com a variação e o saldo resultante. Ao
+        reconectar, o EventSource manda `Last-Event-ID` e recebe o que perdeu.
+        """
+        try:
+            await service.buscar_por_endereco(endereco_carteira)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        return StreamingResponse(
+            fluxo_eventos(endereco_carteira, ler_ultimo_evento(last_event_id)),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @router.get("/{endereco_carteira}/valor", response_model=ValorCarteira)
+    async def valor_carteira(
+        endereco_carteira: str,
+        moeda: str = Query("USD", min_length=1, max_length=10),
+        service: CarteiraServiceAsync = Depends(get_servico),
+    ):
+        """
+        Valor total da carteira em `moeda` (saldo de cada moeda × cotação), com
+        todas as cotações tiradas do mesmo snapshot.
+        """
+        try:
+            return await service.valor_carteira(endereco_carteira, moeda)
+        except ValueError as e:
+            raise _erro_consulta(e)
+
+    @router.get("/{endereco_carteira}/extrato", response_model=List[MovimentoExtrato])
+    async def extrato(
+        endereco_carteira: str,
+        response: Response,
+        after: Optional[str] = None,
+        limit: Optional[int] = Query(None, ge=1, le=1000),
+        id_moeda: Optional[int] = None,
+        de: Optional[datetime] = None,
+        ate: Optional[datetime] = None,
+        formato: Literal["json", "ndjson", "csv"] = "json",
+        service: CarteiraServiceAsync = Depends(get_servico),
+    ):
+        """
+        Depósitos, saques, conversões e transferências (enviadas e recebidas)
+        da carteira, do mais recente para o mais antigo. Pagina por cursor:
+        passe em `after` o header `X-Proximo-Cursor` da página anterior.
+
+        `id_moeda` filtra a moeda (numa conversão, origem ou destino); `de` e
+        `ate` limitam o período [de, ate). `formato=ndjson` ou `csv` exporta em
+        streaming; sem `limit`, o histórico inteiro.
+        """
+        try:
+            if formato != "json":
+                linhas = await service.exportar_extrato(endereco_carteira, formato, after, limit, id_moeda, de, ate)
+                media_type = "text/csv" if formato == "csv" else "application/x-ndjson"
+                return StreamingResponse(linhas, media_type=media_type)
+
+            limite = limit or 100
+            movimentos = await service.extrato(endereco_carteira, after, limite, id_moeda, de, ate)
+        except ValueError as e:
+            raise _erro_consulta(e)
+
+        if len(movimentos) == limite:
+            response.headers["X-Proximo-Cursor"] = cursor_extrato(movimentos[-1])
+        return movimentos
+
+    @router.post("/{endereco_carteira}/depositos")
+    async def depositar(
+        endereco_carteira: str,
+        req: DepositoRequest,
+        idempotency_key: Optional[str] = Header(None, max_length=255),
+        service: CarteiraServiceAsync = Depends(get_servico),
+    ):
+        try:
+            return RespostaJSON(await service.realizar_deposito(endereco_carteira, req, idempotency_key))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except TimeoutError:
+            raise HTTPException(status_code=503, detail="Depósito sem confirmação no prazo; confira o extrato antes de repetir")
+
+    @router.post("/{endereco_carteira}/saques")
+    async def sacar(
+        endereco_carteira: str,
+        req: SaqueRequest,
+        idempotency_key: Optional[str] = Header(None, max_length=255),
+        service: CarteiraServiceAsync = Depends(get_servico),
+    ):
+        try:
+            return RespostaJSON(await service.realizar_saque(endereco_carteira, req, idempotency_key))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @router.post("/{endereco_carteira}/cotacoes", response_model=CotacaoTravada, status_code=201)
+    async def criar_cotacao(
+        endereco_carteira: str,
+        req: CotacaoRequest,
+        service: CarteiraServiceAsync = Depends(get_servico),
+    ):
+        try:
+            return await service.criar_cotacao(endereco_carteira, req)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @router.post("/{endereco_carteira}/conversoes")
+    async def converter(
+        endereco_carteira: str,
+        req: ConversaoRequest,
+        idempotency_key: Optional[str] = Header(None, max_length=255),
+        service: CarteiraServiceAsync = Depends(get_servico),
+    ):
+        try:
+            return RespostaJSON(await service.realizar_conversao(endereco_carteira, req, idempotency_key))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @router.post("/{endereco_origem}/transferencias")
+    async def transferir(
+        endereco_origem: str,
+        req: TransferenciaRequest,
+        idempotency_key: Optional[str] = Header(None, max_length=255),
+        service: CarteiraServiceAsync = Depends(get_servico),
+    ):
+        try:
+            return RespostaJSON(await service.realizar_transferencia(endereco_origem, req, idempotency_key))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @router.post("/{endereco_origem}/transferencias/lote")
+    async def transferir_lote(
+        endereco_origem: str,
+        req: TransferenciaLoteRequest,
+        service: CarteiraServiceAsync = Depends(get_servico),
+    ):
+        """
+        Transferência em lote, numa única transação, com **sucesso parcial**:
+
+        - itens inválidos (destino inexistente ou igual à origem, moeda
+          desconhecida, valor não positivo) são rejeitados um a um;
+        - se a origem não cobre o total de uma moeda (valores + taxas), todos
+          os itens daquela moeda são rejeitados;
+        - os demais itens são aplicados juntos: ou todos os aceitos entram, ou
+          nenhum (erro de banco desfaz o lote inteiro).
+
+        A resposta traz `aceitos`, a lista `rejeitados` (índice no lote e motivo)
+        e o total debitado da origem por moeda.
+        """
+        try:
+            return RespostaJSON(await service.realizar_transferencia_lote(endereco_origem, req))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return router
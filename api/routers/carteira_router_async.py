@@ -0,0 +1,23 @@
+from fastapi import Depends
+
+from api.routers.carteira_rotas import criar_router
+from api.services.carteira_service_async import CarteiraServiceAsync
+from api.persistence.repositories.carteira_repository_async import CarteiraRepositoryAsync
+from api.persistence.unit_of_work_async import UnidadeDeTrabalhoAsync
+
+
+async def get_unidade_de_trabalho():
+    # uma conexão/transação por requisição; commit antes da resposta sair
+    async with UnidadeDeTrabalhoAsync() as uow:
+        yield uow
+
+
+def get_carteira_service(
+    uow: UnidadeDeTrabalhoAsync = Depends(get_unidade_de_trabalho, scope="function"),
+) -> CarteiraServiceAsync:
+    repo = CarteiraRepositoryAsync(uow)
+    return CarteiraServiceAsync(repo, uow)
+
+
+# Rotas de carteira_rotas sobre o engine assíncrono (API_MODO=async)
+router = criar_router(get_carteira_service)
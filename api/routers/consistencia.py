@@ -0,0 +1,55 @@
+import os
+import time
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.persistence.replica import leitura_na_replica
+
+CABECALHO_ESCRITA = "X-Escrita-Em"
+METODOS_LEITURA = {"GET", "HEAD"}
+
+
+class ConsistenciaLeituraMiddleware:
+    """
+    Decide, por requisição, se as consultas podem ir para a réplica.
+
+    Escritas bem-sucedidas devolvem o header X-Escrita-Em (instante, em
+    segundos desde a época, depois do commit). O cliente que o reenvia nas
+    leituras seguintes lê do primário por `janela` segundos e enxerga a
+    própria escrita mesmo com a réplica atrasada. Requisições de escrita
+    leem sempre do primário.
+    """
+
+    def __init__(self, app: ASGIApp, janela: float = None):
+        self.app = app
+        self.janela = janela if janela is not None else float(os.getenv("DB_REPLICA_JANELA_SEGUNDOS", "5"))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] in METODOS_LEITURA:
+            token = leitura_na_replica.set(not self._escreveu_ha_pouco(Headers(scope=scope)))
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                leitura_na_replica.reset(token)
+            return
+
+        async def send_com_instante(mensagem: Message):
+            if mensagem["type"] == "http.response.start" and mensagem["status"] < 400:
+                MutableHeaders(scope=mensagem).append(CABECALHO_ESCRITA, f"{time.time():.3f}")
+            await send(mensagem)
+
+        await self.app(scope, receive, send_com_instante)
+
+    def _escreveu_ha_pouco(self, headers: Headers) -> bool:
+        valor = headers.get(CABECALHO_ESCRITA)
+        if not valor:
+            return False
+        try:
+            return time.time() - float(valor) < self.janela
+        except ValueError:
+            return False
@@ -0,0 +1,23 @@
+import os
+
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+
+router = APIRouter(tags=["Métricas"])
+
+
+def _registro():
+    # com vários workers (gunicorn), cada processo grava em PROMETHEUS_MULTIPROC_DIR
+    # e a coleta junta todos
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+        return registro
+    return REGISTRY
+
+
+@router.get("/metrics", include_in_schema=False)
+def metricas():
+    return Response(generate_latest(_registro()), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,40 @@
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Depends, Query
+
+from api.routers.respostas import RespostaJSON
+from api.services.relatorio_service import RelatorioService
+from api.persistence.repositories.relatorio_repository import RelatorioRepository
+from api.persistence.unit_of_work import UnidadeDeTrabalho
+from api.models.relatorio_models import RelatorioVolume, TipoOperacao
+
+router = APIRouter(prefix="/relatorios", tags=["relatórios"])
+
+
+def get_relatorio_service():
+    # rota síncrona nos dois modos (API_MODO): poucas linhas, lidas da réplica se houver
+    with UnidadeDeTrabalho() as uow:
+        yield RelatorioService(RelatorioRepository(uow))
+
+
+@router.get("/volume", response_model=RelatorioVolume)
+def volume(
+    de: date,
+    ate: date,
+    moeda: Optional[str] = Query(None, min_length=1, max_length=10),
+    tipo: Optional[TipoOperacao] = None,
+    service: RelatorioService = Depends(get_relatorio_service, scope="function"),
+):
+    """
+    Volume, quantidade de operações e taxas cobradas por dia, moeda e tipo
+    de operação, no período [de, ate]. Conversões contam na moeda de origem;
+    a taxa delas aparece na moeda de destino.
+
+    Lido da tabela VOLUME_DIARIO, mantida por `python -m api.jobs.volume_diario`:
+    inclui as movimentações até `processado_ate`.
+    """
+    try:
+        return RespostaJSON(service.volume(de, ate, moeda, tipo))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,49 @@
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+import orjson
+from fastapi.responses import JSONResponse, Response
+
+
+def _padrao(valor):
+    # DECIMAL(18, 8) como string exata, nunca via float
+    if isinstance(valor, Decimal):
+        return str(valor)
+    raise TypeError(f"{type(valor).__name__} não serializável")
+
+
+def json_bytes(conteudo: Any) -> bytes:
+    return orjson.dumps(conteudo, default=_padrao)
+
+
+class RespostaJSON(JSONResponse):
+    """
+    Resposta serializada pelo orjson. A rota devolve as linhas do repositório
+    já prontas: sem jsonable_encoder nem nova validação pelo response_model
+    (que continua no decorador só para a documentação).
+    """
+
+    def render(self, content: Any) -> bytes:
+        return json_bytes(content)
+
+
+def etag_versao(versao: Optional[int]) -> Optional[str]:
+    return None if versao is None else f'"{versao}"'
+
+
+def nao_modificado(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """If-None-Match confere com o ETag atual (comparação fraca, RFC 9110)."""
+    if not if_none_match or etag is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(t.strip().removeprefix("W/") == etag for t in if_none_match.split(","))
+
+
+def cabecalhos_versao(etag: Optional[str]) -> Dict[str, str]:
+    # no-cache: o cliente pode guardar, mas revalida sempre com If-None-Match
+    return {"ETag": etag, "Cache-Control": "no-cache"} if etag else {}
+
+
+def resposta_nao_modificada(etag: str) -> Response:
+    return Response(status_code=304, headers=cabecalhos_versao(etag))
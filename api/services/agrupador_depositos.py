@@ -0,0 +1,210 @@
+import os
+import queue
+import logging
+import threading
+import time
+from decimal import Decimal
+from concurrent.futures import Future
+from typing import List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.exc import OperationalError
+
+from api.persistence.repositories.carteira_repository import CarteiraRepository
+from api.persistence.unit_of_work import UnidadeDeTrabalho
+from api.observabilidade.metricas import DEPOSITO_LOTE
+
+logger = logging.getLogger(__name__)
+
+FALHA_INDIVIDUAL = "individual"
+FALHA_LOTE = "lote"
+
+_PARAR = object()
+
+
+class DepositoIncerto(TimeoutError):
+    """
+    O commit do lote falhou sem dizer se gravou (ex.: conexão perdida no
+    COMMIT). Para quem chamou é o mesmo que não ter resposta no prazo: o
+    depósito pode estar gravado, e repeti-lo sem conferir pode creditar duas vezes.
+    """
+
+
+class PedidoDeposito(NamedTuple):
+    endereco: str
+    id_moeda: int
+    valor: Decimal
+    chave_privada: str
+
+
+class AgrupadorDepositos:
+    """
+    Group commit dos depósitos: os pedidos entram numa fila em memória e uma
+    thread os grava juntos, uma transação (um commit) a cada `max_itens`
+    pedidos ou `espera_ms` milissegundos depois do primeiro, o que vier antes.
+
+    Cada chamador recebe um Future que só é resolvido depois do commit do
+    lote, então a resposta continua saindo só com o depósito gravado. Enquanto
+    um lote faz commit, o próximo vai enchendo.
+
+    Se a transação do lote falhar antes do commit (depois das retentativas
+    de deadlock), nada foi gravado:
+    - "individual": cada pedido é regravado sozinho e só o culpado recebe o erro;
+    - "lote": todos os pedidos do lote recebem o erro.
+    Erro de banco (OperationalError) não é regravado um a um: só repetiria a
+    falha N vezes. Erro no próprio commit deixa o resultado desconhecido e
+    todos recebem DepositoIncerto, nunca uma regravação (que creditaria duas
+    vezes um lote já gravado).
+
+    Quem espera mais de `prazo_segundos` desiste com TimeoutError; o pedido
+    é descartado se ainda não entrou num lote (senão o commit pode ter
+    acontecido).
+    """
+
+    def __init__(self, max_itens: int = 100, espera_ms: float = 2.0, falha: str = FALHA_INDIVIDUAL,
+                 prazo_segundos: float = 30.0):
+        if falha not in (FALHA_INDIVIDUAL, FALHA_LOTE):
+            raise ValueError(f"Modo de falha inválido: {falha}")
+        self.max_itens = max_itens
+        self.espera = espera_ms / 1000
+        self.falha = falha
+        self.prazo = prazo_segundos
+
+        # sem limite: cada chamador espera o próprio resultado, então a fila
+        # nunca passa do número de requisições em andamento
+        self._fila: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def enviar(self, pedido: PedidoDeposito) -> Future:
+        futuro: Future = Future()
+        self._iniciar()
+        self._fila.put((pedido, futuro))
+        return futuro
+
+    def depositar(self, pedido: PedidoDeposito):
+        futuro = self.enviar(pedido)
+        try:
+            return futuro.result(timeout=self.prazo)
+        except TimeoutError:
+            futuro.cancel()
+            raise
+
+    def parar(self):
+        """Grava o que ainda está na fila e encerra a thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._fila.put(_PARAR)
+            thread.join()
+
+    def _iniciar(self):
+        # thread criada no primeiro uso: não atravessa o fork dos workers
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._laco, name="agrupador-depositos", daemon=True
+                    )
+                    self._thread.start()
+
+    def _laco(self):
+        while True:
+            lote: List[Tuple[PedidoDeposito, Future]] = []
+            try:
+                parar = self._juntar(lote)
+                if lote:
+                    self._gravar(lote)
+            except Exception as e:
+                # a thread não pode morrer: ninguém mais resolveria os Futures
+                logger.exception("Falha no agrupador de depósitos")
+                for _, futuro in lote:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+                parar = False
+            if parar:
+                return
+
+    def _juntar(self, lote: List[Tuple[PedidoDeposito, Future]]) -> bool:
+        """Enche `lote` com os pedidos ainda esperados; True se pediram para parar."""
+        prazo = None
+        while len(lote) < self.max_itens:
+            if prazo is None:
+                item = self._fila.get()
+                prazo = time.monotonic() + self.espera
+            else:
+                restante = prazo - time.monotonic()
+                try:
+                    item = self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait()
+                except queue.Empty:
+                    return False
+            if item is _PARAR:
+                return True
+            # False = o chamador desistiu (prazo) antes de o pedido entrar no lote
+            if item[1].set_running_or_notify_cancel():
+                lote.append(item)
+        return False
+
+    def _gravar(self, lote: List[Tuple[PedidoDeposito, Future]]):
+        DEPOSITO_LOTE.observe(len(lote))
+        pedidos = [pedido for pedido, _ in lote]
+        uow = UnidadeDeTrabalho()
+        try:
+            try:
+                repo = CarteiraRepository(uow)
+                resultados = uow.executar(lambda: repo.depositar_agrupado(pedidos))
+            except Exception as e:
+                # antes do commit: a transação é desfeita e nada foi gravado
+                uow.rollback()
+                uow.fechar()
+                if self.falha == FALHA_INDIVIDUAL and len(lote) > 1 and not isinstance(e, OperationalError):
+                    logger.warning("Lote de %d depósitos falhou, regravando um a um: %s", len(lote), e)
+                    for item in lote:
+                        self._gravar([item])
+                    return
+                for _, futuro in lote:
+                    futuro.set_exception(e)
+                return
+
+            try:
+                uow.commit()
+            except Exception as e:
+                logger.error("Commit de lote de %d depósitos com resultado desconhecido", len(lote), exc_info=True)
+                incerto = DepositoIncerto("Depósito com resultado desconhecido")
+                incerto.__cause__ = e
+                for _, futuro in lote:
+                    futuro.set_exception(incerto)
+                return
+        finally:
+            uow.fechar()
+
+        for (_, futuro), resultado in zip(lote, resultados):
+            if isinstance(resultado, Exception):
+                futuro.set_exception(resultado)
+            else:
+                futuro.set_result(resultado)
+
+
+_agrupador: Optional[AgrupadorDepositos] = None
+_agrupador_lock = threading.Lock()
+
+
+def get_agrupador_depositos() -> Optional[AgrupadorDepositos]:
+    """None quando DEPOSITO_AGRUPADO está desligado (padrão): cada depósito faz o próprio commit."""
+    global _agrupador
+    if os.getenv("DEPOSITO_AGRUPADO", "0") != "1":
+        return None
+    if _agrupador is None:
+        with _agrupador_lock:
+            if _agrupador is None:
+                _agrupador = AgrupadorDepositos(
+                    max_itens=int(os.getenv("DEPOSITO_LOTE_MAX_ITENS", "100")),
+                    espera_ms=float(os.getenv("DEPOSITO_LOTE_ESPERA_MS", "2")),
+                    falha=os.getenv("DEPOSITO_LOTE_FALHA", FALHA_INDIVIDUAL).lower(),
+                    prazo_segundos=float(os.getenv("DEPOSITO_LOTE_PRAZO_SEGUNDOS", "30")),
+                )
+    return _agrupador
+
+
+def parar_agrupador_depositos():
+    if _agrupador is not None:
+        _agrupador.parar()
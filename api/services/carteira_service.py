@@ -1,6 +1,15 @@
-from typing import List
+import io
+import os
+import csv
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import orjson
 
 from api.persistence.repositories.carteira_repository import CarteiraRepository
+from api.persistence.unit_of_work import UnidadeDeTrabalho
+from api.services.agrupador_depositos import PedidoDeposito, get_agrupador_depositos
 from api.models.carteira_models import (
     Carteira,
     CarteiraCriada,
@@ -9,13 +18,36 @@ from api.models.carteira_models import (
     DepositoRequest,
     SaqueRequest,
     ConversaoRequest,
-    TransferenciaRequest
+    CotacaoRequest,
+    CotacaoTravada,
+    TransferenciaRequest,
+    TransferenciaLoteRequest,
+    MovimentoExtrato,
+    ValorCarteira
 )
 
+CAMPOS_EXTRATO = list(MovimentoExtrato.model_fields)
+
+
+def cursor_extrato(movimento: MovimentoExtrato) -> str:
+    ordem = {"DEPOSITO_SAQUE": 1, "CONVERSAO": 2, "TRANSFERENCIA": 3}[movimento.origem]
+    return f"{movimento.data_hora.isoformat()}_{ordem}_{movimento.id}"
+
+
+def ler_cursor_extrato(cursor: Optional[str]) -> Optional[Tuple[datetime, int, int]]:
+    if cursor is None:
+        return None
+    try:
+        data_hora, ordem, id_ = cursor.split("_")
+        return datetime.fromisoformat(data_hora), int(ordem), int(id_)
+    except ValueError:
+        raise ValueError("Cursor do extrato inválido")
+
 
 class CarteiraService:
-    def __init__(self, carteira_repo: CarteiraRepository):
+    def __init__(self, carteira_repo: CarteiraRepository, uow: UnidadeDeTrabalho):
         self.carteira_repo = carteira_repo
+        self.uow = uow
 
     def criar_carteira(self) -> CarteiraCriada:
         row = self.carteira_repo.criar()
@@ -26,6 +58,28 @@ class CarteiraService:
             chave_privada=row["chave_privada"],
         )
 
+    def criar_carteiras_lote(self, quantidade: int) -> Iterator[str]:
+        max_quantidade = int(os.getenv("CARTEIRA_LOTE_MAX", "100000"))
+        tamanho_bloco = int(os.getenv("CARTEIRA_LOTE_BLOCO", "1000"))
+        if quantidade < 1 or quantidade > max_quantidade:
+            raise ValueError(f"Quantidade deve estar entre 1 e {max_quantidade}")
+
+        cotacoes = self.carteira_repo.cotacoes
+
+        def gerar():
+            # cada bloco é uma transação própria; só sai na resposta o que já foi commitado
+            restantes = quantidade
+            while restantes > 0:
+                n = min(tamanho_bloco, restantes)
+                with UnidadeDeTrabalho() as uow:
+                    repo = CarteiraRepository(uow, cotacoes)
+                    criadas = uow.executar(lambda: repo.criar_lote(n))
+                for carteira in criadas:
+                    yield json.dumps(carteira) + "\n"
+                restantes -= n
+
+        return gerar()
+
     def buscar_por_endereco(self, endereco_carteira: str) -> Carteira:
         row = self.carteira_repo.buscar_por_endereco(endereco_carteira)
         if not row:
@@ -37,16 +91,30 @@ class CarteiraService:
             status=row["status"],
         )
 
-    def listar(self) -> List[Carteira]:
-        rows = self.carteira_repo.listar()
-        return [
-            Carteira(
-                endereco_carteira=r["endereco_carteira"],
-                data_criacao=r["data_criacao"],
-                status=r["status"],
-            )
-            for r in rows
-        ]
+    def versao_carteira(self, endereco_carteira: str) -> Optional[int]:
+        return self.carteira_repo.versao_carteira(endereco_carteira)
+
+    def listar(
+        self,
+        apos: Optional[str] = None,
+        limite: int = 100,
+        status: Optional[str] = None,
+        criada_de: Optional[datetime] = None,
+        criada_ate: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        # linhas do repositório direto para a resposta (ver RespostaJSON)
+        return self.carteira_repo.listar(apos, limite, status, criada_de, criada_ate)
+
+    def listar_ndjson(
+        self,
+        apos: Optional[str] = None,
+        limite: Optional[int] = None,
+        status: Optional[str] = None,
+        criada_de: Optional[datetime] = None,
+        criada_ate: Optional[datetime] = None,
+    ) -> Iterator[bytes]:
+        for r in self.carteira_repo.listar_stream(apos, limite, status, criada_de, criada_ate):
+            yield orjson.dumps(r) + b"\n"
 
     def bloquear(self, endereco_carteira: str) -> Carteira:
         row = self.carteira_repo.atualizar_status(endereco_carteira, "BLOQUEADA")
@@ -70,43 +138,148 @@ class CarteiraService:
             "saldos": saldos
         }
 
-    def realizar_deposito(self, endereco_carteira: str, req: DepositoRequest):
-        return self.carteira_repo.depositar(
+    def valor_carteira(self, endereco: str, moeda: str) -> ValorCarteira:
+        carteira = self.carteira_repo.buscar_por_endereco(endereco)
+        if not carteira:
+            raise ValueError("Carteira não encontrada")
+
+        return ValorCarteira(**self.carteira_repo.valor_carteira(endereco, moeda.upper()))
+
+    def extrato(
+        self,
+        endereco: str,
+        apos: Optional[str] = None,
+        limite: int = 100,
+        id_moeda: Optional[int] = None,
+        de: Optional[datetime] = None,
+        ate: Optional[datetime] = None,
+    ) -> List[MovimentoExtrato]:
+        self.buscar_por_endereco(endereco)
+        rows = self.carteira_repo.extrato(endereco, ler_cursor_extrato(apos), limite, id_moeda, de, ate)
+        return [MovimentoExtrato(**r) for r in rows]
+
+    def exportar_extrato(
+        self,
+        endereco: str,
+        formato: str,
+        apos: Optional[str] = None,
+        limite: Optional[int] = None,
+        id_moeda: Optional[int] = None,
+        de: Optional[datetime] = None,
+        ate: Optional[datetime] = None,
+    ) -> Iterator[str]:
+        # valida carteira e cursor antes de abrir o stream (erro ainda vira 4xx)
+        self.buscar_por_endereco(endereco)
+        return self.linhas_extrato(formato, endereco, ler_cursor_extrato(apos), limite, id_moeda, de, ate)
+
+    def linhas_extrato(
+        self,
+        formato: str,
+        endereco: str,
+        apos: Optional[Tuple[datetime, int, int]],
+        limite: Optional[int],
+        id_moeda: Optional[int],
+        de: Optional[datetime],
+        ate: Optional[datetime],
+    ) -> Iterator[str]:
+        movimentos = (
+            MovimentoExtrato(**r)
+            for r in self.carteira_repo.extrato_stream(endereco, apos, limite, id_moeda, de, ate)
+        )
+        if formato == "csv":
+            return _linhas_csv(movimentos)
+        return (m.model_dump_json() + "\n" for m in movimentos)
+
+    def realizar_deposito(self, endereco_carteira: str, req: DepositoRequest, chave_idempotencia: Optional[str] = None):
+        # com Idempotency-Key o depósito segue isolado: a chave pode esperar
+        # por uma repetição concorrente, o que seguraria o lote inteiro
+        agrupador = get_agrupador_depositos()
+        if agrupador is not None and not chave_idempotencia:
+            return agrupador.depositar(PedidoDeposito(endereco_carteira, req.id_moeda, req.valor, req.chave_privada))
+
+        return self.uow.executar(lambda: self.carteira_repo.depositar(
             endereco_carteira,
             req.id_moeda,
             req.valor,
-            req.chave_privada
-        )
+            req.chave_privada,
+            chave_idempotencia
+        ))
 
-    def realizar_saque(self, endereco_carteira: str, req: SaqueRequest):
-        return self.carteira_repo.sacar(
+    def realizar_saque(self, endereco_carteira: str, req: SaqueRequest, chave_idempotencia: Optional[str] = None):
+        return self.uow.executar(lambda: self.carteira_repo.sacar(
             endereco_carteira,
             req.id_moeda,
             req.valor, 
-            req.chave_privada
-        )
+            req.chave_privada,
+            chave_idempotencia
+        ))
 
-    def realizar_conversao(self, endereco_carteira: str, req: ConversaoRequest):
-        return self.carteira_repo.converter(
+    def realizar_conversao(self, endereco_carteira: str, req: ConversaoRequest, chave_idempotencia: Optional[str] = None):
+        return self.uow.executar(lambda: self.carteira_repo.converter(
             endereco_carteira,
             req.id_moeda_origem,
             req.id_moeda_destino,
-            req.valor_origem
-        )
+            req.valor_origem,
+            req.id_cotacao,
+            chave_idempotencia
+        ))
 
-    def realizar_transferencia(self, endereco_origem: str, req: TransferenciaRequest):
-        return self.carteira_repo.transferir(
-            endereco_origem,
-            req.endereco_destino,
-            req.moeda,
-            req.valor
+    def criar_cotacao(self, endereco_carteira: str, req: CotacaoRequest) -> CotacaoTravada:
+        row = self.carteira_repo.criar_cotacao(
+            endereco_carteira,
+            req.id_moeda_origem,
+            req.id_moeda_destino
         )
-        
-    def realizar_transferencia(self, endereco_origem: str, req: TransferenciaRequest):
-        return self.carteira_repo.transferir(
+        return CotacaoTravada(**row)
+
+    def realizar_transferencia(self, endereco_origem: str, req: TransferenciaRequest, chave_idempotencia: Optional[str] = None):
+        return self.uow.executar(lambda: self.carteira_repo.transferir(
             endereco_origem,
             req.endereco_destino,
             req.id_moeda,
             req.valor,
+            req.chave_privada,
+            chave_idempotencia
+        ))
+
+    def realizar_transferencia_lote(self, endereco_origem: str, req: TransferenciaLoteRequest):
+        max_itens = int(os.getenv("TRANSFERENCIA_LOTE_MAX_ITENS", "10000"))
+        if not req.itens:
+            raise ValueError("Lote vazio")
+        if len(req.itens) > max_itens:
+            raise ValueError(f"Lote acima do limite de {max_itens} itens")
+
+        return self.uow.executar(lambda: self.carteira_repo.transferir_lote(
+            endereco_origem,
+            req.itens,
             req.chave_privada
-        )
+        ))
+
+
+def expurgar_chaves_idempotencia() -> int:
+    """
+    Remove as chaves de idempotência mais velhas que IDEMPOTENCIA_RETENCAO_HORAS,
+    em lotes pequenos (uma transação curta cada) para não travar a tabela.
+    """
+    retencao_horas = int(os.getenv("IDEMPOTENCIA_RETENCAO_HORAS", "24"))
+    lote = int(os.getenv("IDEMPOTENCIA_EXPURGO_LOTE", "1000"))
+
+    total = 0
+    while True:
+        with UnidadeDeTrabalho() as uow:
+            removidas = CarteiraRepository(uow).expurgar_idempotencia(retencao_horas, lote)
+        total += removidas
+        if removidas < lote:
+            return total
+
+
+def _linhas_csv(movimentos: Iterator[MovimentoExtrato]) -> Iterator[str]:
+    buffer = io.StringIO()
+    escritor = csv.DictWriter(buffer, fieldnames=CAMPOS_EXTRATO)
+    escritor.writeheader()
+    for movimento in movimentos:
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerow(movimento.model_dump(mode="json"))
+    yield buffer.getvalue()
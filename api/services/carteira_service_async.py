@@ -0,0 +1,210 @@
+import os
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from api.persistence.repositories.carteira_repository import CarteiraRepository
+from api.persistence.repositories.carteira_repository_async import CarteiraRepositoryAsync
+from api.persistence.unit_of_work import UnidadeDeTrabalho
+from api.persistence.unit_of_work_async import UnidadeDeTrabalhoAsync
+from api.services.carteira_service import CarteiraService, ler_cursor_extrato
+from api.services.agrupador_depositos import PedidoDeposito, get_agrupador_depositos
+from api.models.carteira_models import (
+    Carteira,
+    CarteiraCriada,
+    DepositoRequest,
+    SaqueRequest,
+    ConversaoRequest,
+    CotacaoRequest,
+    CotacaoTravada,
+    TransferenciaRequest,
+    TransferenciaLoteRequest,
+    MovimentoExtrato,
+    ValorCarteira
+)
+
+
+class CarteiraServiceAsync:
+    def __init__(self, carteira_repo: CarteiraRepositoryAsync, uow: UnidadeDeTrabalhoAsync):
+        self.carteira_repo = carteira_repo
+        self.uow = uow
+
+    def _servico_sincrono(self) -> CarteiraService:
+        # as rotas de streaming em lote continuam no driver síncrono: o
+        # Starlette consome o gerador no threadpool, fora do event loop
+        uow = UnidadeDeTrabalho()
+        return CarteiraService(CarteiraRepository(uow, self.carteira_repo.cotacoes), uow)
+
+    async def criar_carteira(self) -> CarteiraCriada:
+        row = await self.carteira_repo.criar()
+        return CarteiraCriada(
+            endereco_carteira=row["endereco_carteira"],
+            data_criacao=row["data_criacao"],
+            status=row["status"],
+            chave_privada=row["chave_privada"],
+        )
+
+    async def criar_carteiras_lote(self, quantidade: int) -> Iterator[str]:
+        return self._servico_sincrono().criar_carteiras_lote(quantidade)
+
+    async def buscar_por_endereco(self, endereco_carteira: str) -> Carteira:
+        row = await self.carteira_repo.buscar_por_endereco(endereco_carteira)
+        if not row:
+            raise ValueError("Carteira não encontrada")
+
+        return Carteira(
+            endereco_carteira=row["endereco_carteira"],
+            data_criacao=row["data_criacao"],
+            status=row["status"],
+        )
+
+    async def versao_carteira(self, endereco_carteira: str) -> Optional[int]:
+        return await self.carteira_repo.versao_carteira(endereco_carteira)
+
+    async def listar(
+        self,
+        apos: Optional[str] = None,
+        limite: int = 100,
+        status: Optional[str] = None,
+        criada_de: Optional[datetime] = None,
+        criada_ate: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        # linhas do repositório direto para a resposta (ver RespostaJSON)
+        return await self.carteira_repo.listar(apos, limite, status, criada_de, criada_ate)
+
+    async def listar_ndjson(
+        self,
+        apos: Optional[str] = None,
+        limite: Optional[int] = None,
+        status: Optional[str] = None,
+        criada_de: Optional[datetime] = None,
+        criada_ate: Optional[datetime] = None,
+    ) -> Iterator[bytes]:
+        return self._servico_sincrono().listar_ndjson(apos, limite, status, criada_de, criada_ate)
+
+    async def bloquear(self, endereco_carteira: str) -> Carteira:
+        row = await self.carteira_repo.atualizar_status(endereco_carteira, "BLOQUEADA")
+        if not row:
+            raise ValueError("Carteira não encontrada")
+
+        return Carteira(
+            endereco_carteira=row["endereco_carteira"],
+            data_criacao=row["data_criacao"],
+            status=row["status"],
+        )
+
+    async def obter_saldos(self, endereco: str):
+        carteira = await self.carteira_repo.buscar_por_endereco(endereco)
+        if not carteira:
+            raise ValueError("Carteira não encontrada")
+
+        saldos = await self.carteira_repo.listar_saldos(endereco)
+        return {
+            "endereco": endereco,
+            "saldos": saldos
+        }
+
+    async def valor_carteira(self, endereco: str, moeda: str) -> ValorCarteira:
+        carteira = await self.carteira_repo.buscar_por_endereco(endereco)
+        if not carteira:
+            raise ValueError("Carteira não encontrada")
+
+        return ValorCarteira(**await self.carteira_repo.valor_carteira(endereco, moeda.upper()))
+
+    async def extrato(
+        self,
+        endereco: str,
+        apos: Optional[str] = None,
+        limite: int = 100,
+        id_moeda: Optional[int] = None,
+        de: Optional[datetime] = None,
+        ate: Optional[datetime] = None,
+    ) -> List[MovimentoExtrato]:
+        await self.buscar_por_endereco(endereco)
+        rows = await self.carteira_repo.extrato(endereco, ler_cursor_extrato(apos), limite, id_moeda, de, ate)
+        return [MovimentoExtrato(**r) for r in rows]
+
+    async def exportar_extrato(
+        self,
+        endereco: str,
+        formato: str,
+        apos: Optional[str] = None,
+        limite: Optional[int] = None,
+        id_moeda: Optional[int] = None,
+        de: Optional[datetime] = None,
+        ate: Optional[datetime] = None,
+    ) -> Iterator[str]:
+        await self.buscar_por_endereco(endereco)
+        return self._servico_sincrono().linhas_extrato(
+            formato, endereco, ler_cursor_extrato(apos), limite, id_moeda, de, ate
+        )
+
+    async def realizar_deposito(self, endereco_carteira: str, req: DepositoRequest, chave_idempotencia: Optional[str] = None):
+        agrupador = get_agrupador_depositos()
+        if agrupador is not None and not chave_idempotencia:
+            # o lote grava pelo driver síncrono, na thread do agrupador; o
+            # cancelamento no prazo chega ao Future e tira o pedido da fila
+            return await asyncio.wait_for(
+                asyncio.wrap_future(agrupador.enviar(
+                    PedidoDeposito(endereco_carteira, req.id_moeda, req.valor, req.chave_privada)
+                )),
+                timeout=agrupador.prazo,
+            )
+
+        return await self.carteira_repo.depositar(
+            endereco_carteira,
+            req.id_moeda,
+            req.valor,
+            req.chave_privada,
+            chave_idempotencia
+        )
+
+    async def realizar_saque(self, endereco_carteira: str, req: SaqueRequest, chave_idempotencia: Optional[str] = None):
+        return await self.carteira_repo.sacar(
+            endereco_carteira,
+            req.id_moeda,
+            req.valor,
+            req.chave_privada,
+            chave_idempotencia
+        )
+
+    async def realizar_conversao(self, endereco_carteira: str, req: ConversaoRequest, chave_idempotencia: Optional[str] = None):
+        return await self.carteira_repo.converter(
+            endereco_carteira,
+            req.id_moeda_origem,
+            req.id_moeda_destino,
+            req.valor_origem,
+            req.id_cotacao,
+            chave_idempotencia
+        )
+
+    async def criar_cotacao(self, endereco_carteira: str, req: CotacaoRequest) -> CotacaoTravada:
+        row = await self.carteira_repo.criar_cotacao(
+            endereco_carteira,
+            req.id_moeda_origem,
+            req.id_moeda_destino
+        )
+        return CotacaoTravada(**row)
+
+    async def realizar_transferencia(self, endereco_origem: str, req: TransferenciaRequest, chave_idempotencia: Optional[str] = None):
+        return await self.carteira_repo.transferir(
+            endereco_origem,
+            req.endereco_destino,
+            req.id_moeda,
+            req.valor,
+            req.chave_privada,
+            chave_idempotencia
+        )
+
+    async def realizar_transferencia_lote(self, endereco_origem: str, req: TransferenciaLoteRequest):
+        max_itens = int(os.getenv("TRANSFERENCIA_LOTE_MAX_ITENS", "10000"))
+        if not req.itens:
+            raise ValueError("Lote vazio")
+        if len(req.itens) > max_itens:
+            raise ValueError(f"Lote acima do limite de {max_itens} itens")
+
+        return await self.carteira_repo.transferir_lote(
+            endereco_origem,
+            req.itens,
+            req.chave_privada
+        )
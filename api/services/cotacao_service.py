@@ -0,0 +1,303 @@
+import os
+import time
+import threading
+from decimal import Decimal
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Protocol, Set, Tuple
+
+from api.observabilidade.metricas import COTACAO_BUSCA
+
+
+class ProvedorCotacoes(Protocol):
+    """
+    Fonte das cotações. Devolve quanto vale 1 unidade de `moeda_base`
+    em cada uma das outras moedas (mesmo formato da Coinbase).
+    """
+
+    def buscar_taxas(self, moeda_base: str) -> Dict[str, Decimal]:
+        ...
+
+
+class CoinbaseProvedorCotacoes:
+    URL = "https://api.coinbase.com/v2/exchange-rates"
+
+    def __init__(self, timeout: float = 5.0, max_conexoes: int = 10):
+        # importado aqui: com o provedor local o httpx nem é carregado
+        import httpx
+
+        # cliente reaproveitado entre chamadas: mantém as conexões HTTP abertas (keep-alive)
+        self.client = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_conexoes,
+                max_keepalive_connections=max_conexoes,
+            ),
+        )
+
+    def buscar_taxas(self, moeda_base: str) -> Dict[str, Decimal]:
+        resp = self.client.get(self.URL, params={"currency": moeda_base})
+        if resp.status_code != 200:
+            raise ValueError("Erro ao consultar cotação na Coinbase")
+        rates = resp.json()["data"]["rates"]
+        return {codigo: Decimal(valor) for codigo, valor in rates.items()}
+
+    def fechar(self):
+        self.client.close()
+
+
+class LocalProvedorCotacoes:
+    """
+    Provedor sem rede, para testes e benchmarks.
+    Recebe as taxas em relação a uma moeda de referência e calcula as cruzadas.
+    """
+
+    TAXAS_PADRAO = {
+        "USD": "1",
+        "BRL": "5.00",
+        "BTC": "0.00001500",
+        "ETH": "0.00030000",
+        "SOL": "0.00700000",
+    }
+
+    def __init__(self, taxas_por_referencia: Optional[Dict[str, str]] = None):
+        taxas = taxas_por_referencia or self.TAXAS_PADRAO
+        self.taxas = {codigo: Decimal(valor) for codigo, valor in taxas.items()}
+
+    def buscar_taxas(self, moeda_base: str) -> Dict[str, Decimal]:
+        if moeda_base not in self.taxas:
+            raise ValueError(f"Moeda {moeda_base} sem cotação local")
+        base = self.taxas[moeda_base]
+        return {codigo: valor / base for codigo, valor in self.taxas.items()}
+
+
+class MatrizCotacoes:
+    """
+    Cotações cruzadas entre todas as moedas do catálogo, calculadas a partir
+    de um único snapshot na moeda de referência: taxa(A, B) = ref[B] / ref[A].
+    """
+
+    def __init__(self, moeda_referencia: str, taxas_referencia: Dict[str, Decimal], codigos: Iterable[str]):
+        self.moeda_referencia = moeda_referencia
+        disponiveis = [c for c in codigos if taxas_referencia.get(c)]
+        self.taxas: Dict[Tuple[str, str], Decimal] = {
+            (origem, destino): taxas_referencia[destino] / taxas_referencia[origem]
+            for origem in disponiveis
+            for destino in disponiveis
+        }
+
+    def taxa(self, moeda_origem: str, moeda_destino: str) -> Decimal:
+        try:
+            return self.taxas[(moeda_origem, moeda_destino)]
+        except KeyError:
+            raise ValueError(f"Cotação {moeda_origem}/{moeda_destino} indisponível")
+
+    def para(self, moeda_destino: str) -> Dict[str, Decimal]:
+        """Vetor de cotações de todas as moedas disponíveis para `moeda_destino`."""
+        return {origem: taxa for (origem, destino), taxa in self.taxas.items() if destino == moeda_destino}
+
+
+@dataclass
+class _TabelaCotacoes:
+    taxas: Dict[str, Decimal]
+    obtida_em: float
+
+
+@dataclass
+class _BuscaEmAndamento:
+    concluida: threading.Event = field(default_factory=threading.Event)
+    tabela: Optional[_TabelaCotacoes] = None
+    erro: Optional[BaseException] = None
+
+
+class CotacaoService:
+    """
+    Tabela de cotações em memória, uma por moeda base, com TTL.
+
+    - perto de expirar, a tabela é renovada em segundo plano;
+    - vários pedidos simultâneos pela mesma base viram uma única busca;
+    - se o provedor falhar, a tabela vencida ainda é usada por `janela_stale` segundos.
+
+    As cotações entre pares saem todas da tabela da `moeda_referencia`,
+    então os N² pares do catálogo custam uma única busca no provedor.
+    """
+
+    def __init__(
+        self,
+        provedor: ProvedorCotacoes,
+        ttl: float = 30.0,
+        antecedencia_renovacao: float = 5.0,
+        janela_stale: float = 120.0,
+        moeda_referencia: str = "USD",
+    ):
+        self.provedor = provedor
+        self.moeda_referencia = moeda_referencia
+        self.ttl = ttl
+        self.antecedencia_renovacao = antecedencia_renovacao
+        self.janela_stale = janela_stale
+
+        self._tabelas: Dict[str, _TabelaCotacoes] = {}
+        self._em_andamento: Dict[str, _BuscaEmAndamento] = {}
+        # bases com renovação na fila do executor: no máximo uma por base
+        self._renovando: Set[str] = set()
+        self._matrizes: Dict[Tuple[str, ...], Tuple[Dict[str, Decimal], MatrizCotacoes]] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cotacoes")
+
+    def obter_taxas(self, moeda_base: str) -> Dict[str, Decimal]:
+        tabela = self._tabelas.get(moeda_base)
+        if tabela:
+            idade = time.monotonic() - tabela.obtida_em
+            if idade < self.ttl:
+                if idade >= self.ttl - self.antecedencia_renovacao:
+                    self._renovar_em_segundo_plano(moeda_base)
+                return tabela.taxas
+
+        try:
+            return self._buscar(moeda_base).taxas
+        except Exception as e:
+            if tabela and time.monotonic() - tabela.obtida_em < self.ttl + self.janela_stale:
+                return tabela.taxas
+            if isinstance(e, ValueError):
+                raise
+            raise ValueError("Erro ao consultar cotação") from e
+
+    def obter_matriz(self, codigos: Iterable[str], taxas: Optional[Dict[str, Decimal]] = None) -> MatrizCotacoes:
+        chave = tuple(sorted(codigos))
+        if taxas is None:
+            taxas = self.obter_taxas(self.moeda_referencia)
+
+        # a matriz só é recalculada quando chega um snapshot novo
+        em_cache = self._matrizes.get(chave)
+        if em_cache and em_cache[0] is taxas:
+            return em_cache[1]
+        matriz = MatrizCotacoes(self.moeda_referencia, taxas, chave)
+        self._matrizes[chave] = (taxas, matriz)
+        return matriz
+
+    def obter_taxa(self, moeda_origem: str, moeda_destino: str) -> Decimal:
+        return self.obter_matriz((moeda_origem, moeda_destino)).taxa(moeda_origem, moeda_destino)
+
+    def fixar(self) -> "CotacoesFixadas":
+        """Snapshot atual da moeda de referência (pode buscar no provedor)."""
+        return CotacoesFixadas(self, self.obter_taxas(self.moeda_referencia))
+
+    def _buscar(self, moeda_base: str) -> _TabelaCotacoes:
+        with self._lock:
+            busca = self._em_andamento.get(moeda_base)
+            lider = busca is None
+            if lider:
+                busca = _BuscaEmAndamento()
+                self._em_andamento[moeda_base] = busca
+
+        if not lider:
+            busca.concluida.wait()
+            if busca.erro:
+                raise busca.erro
+            return busca.tabela
+
+        inicio = time.perf_counter()
+        try:
+            taxas = self.provedor.buscar_taxas(moeda_base)
+            COTACAO_BUSCA.labels("ok").observe(time.perf_counter() - inicio)
+            busca.tabela = _TabelaCotacoes(taxas=taxas, obtida_em=time.monotonic())
+            self._tabelas[moeda_base] = busca.tabela
+            return busca.tabela
+        except BaseException as e:
+            if busca.tabela is None:
+                COTACAO_BUSCA.labels("erro").observe(time.perf_counter() - inicio)
+            busca.erro = e
+            raise
+        finally:
+            with self._lock:
+                self._em_andamento.pop(moeda_base, None)
+            busca.concluida.set()
+
+    def _renovar_em_segundo_plano(self, moeda_base: str):
+        with self._lock:
+            if moeda_base in self._em_andamento or moeda_base in self._renovando:
+                return
+            self._renovando.add(moeda_base)
+        self._executor.submit(self._renovar, moeda_base)
+
+    def fechar(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        fechar_provedor = getattr(self.provedor, "fechar", None)
+        if fechar_provedor:
+            fechar_provedor()
+
+    def _renovar(self, moeda_base: str):
+        try:
+            # uma busca síncrona (tabela vencida) pode ter renovado antes
+            tabela = self._tabelas.get(moeda_base)
+            if tabela and time.monotonic() - tabela.obtida_em < self.ttl - self.antecedencia_renovacao:
+                return
+            self._buscar(moeda_base)
+        except Exception:
+            # a tabela atual continua valendo até o TTL (ou até a janela stale)
+            pass
+        finally:
+            with self._lock:
+                self._renovando.discard(moeda_base)
+
+
+class CotacoesFixadas:
+    """
+    Cotações de um snapshot já obtido: `obter_matriz` nunca chama o
+    provedor. É o que o repositório assíncrono usa dentro do run_sync, onde
+    uma busca HTTP travaria o event loop com a conexão do banco aberta.
+    """
+
+    def __init__(self, servico: CotacaoService, taxas: Dict[str, Decimal]):
+        self.servico = servico
+        self.moeda_referencia = servico.moeda_referencia
+        self.taxas = taxas
+
+    def obter_matriz(self, codigos: Iterable[str]) -> MatrizCotacoes:
+        return self.servico.obter_matriz(codigos, self.taxas)
+
+    def obter_taxa(self, moeda_origem: str, moeda_destino: str) -> Decimal:
+        return self.obter_matriz((moeda_origem, moeda_destino)).taxa(moeda_origem, moeda_destino)
+
+
+_cotacao_service: Optional[CotacaoService] = None
+_cotacao_service_lock = threading.Lock()
+
+
+def criar_provedor_cotacoes() -> ProvedorCotacoes:
+    provedor = os.getenv("COTACAO_PROVEDOR", "coinbase").lower()
+    if provedor == "local":
+        return LocalProvedorCotacoes()
+    return CoinbaseProvedorCotacoes(
+        timeout=float(os.getenv("COTACAO_TIMEOUT_SEGUNDOS", "5")),
+    )
+
+
+def get_cotacao_service() -> CotacaoService:
+    global _cotacao_service
+    if _cotacao_service is None:
+        with _cotacao_service_lock:
+            if _cotacao_service is None:
+                _cotacao_service = CotacaoService(
+                    criar_provedor_cotacoes(),
+                    ttl=float(os.getenv("COTACAO_TTL_SEGUNDOS", "30")),
+                    antecedencia_renovacao=float(os.getenv("COTACAO_RENOVACAO_ANTECIPADA_SEGUNDOS", "5")),
+                    janela_stale=float(os.getenv("COTACAO_STALE_MAX_SEGUNDOS", "120")),
+                    moeda_referencia=os.getenv("COTACAO_MOEDA_REFERENCIA", "USD"),
+                )
+    return _cotacao_service
+
+
+def definir_cotacao_service(service: CotacaoService):
+    """Troca o serviço global (ex.: provedor local em testes e benchmarks)."""
+    global _cotacao_service
+    _cotacao_service = service
+
+
+def fechar_cotacao_service():
+    """Fecha o cliente HTTP do provedor (fim do processo); o próximo uso cria outro serviço."""
+    global _cotacao_service
+    with _cotacao_service_lock:
+        service, _cotacao_service = _cotacao_service, None
+    if service is not None:
+        service.fechar()
@@ -0,0 +1,261 @@
+import os
+import time
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set, Tuple, TypeVar
+
+import orjson
+from starlette.concurrency import run_in_threadpool
+
+from api.persistence.repositories.carteira_repository import CarteiraRepository
+from api.persistence.unit_of_work import UnidadeDeTrabalho
+from api.observabilidade.metricas import EVENTOS_ASSINANTES, EVENTOS_ENTREGUES, EVENTOS_LACUNAS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# retomada pelo Last-Event-ID: eventos lidos do outbox por consulta
+PAGINA_RETOMADA = 500
+
+
+def _no_repositorio(operacao: Callable[[CarteiraRepository], T]) -> T:
+    with UnidadeDeTrabalho() as uow:
+        return operacao(CarteiraRepository(uow))
+
+
+class Assinatura:
+    """Uma conexão SSE: a fila recebe os eventos da carteira; None encerra."""
+
+    def __init__(self, endereco: str):
+        self.endereco = endereco
+        self.fila: "asyncio.Queue[Optional[Dict]]" = asyncio.Queue()
+        # ids acima da marca já enviados pela retomada: a entrega ao vivo os descarta
+        self.enviados: Set[int] = set()
+
+
+class DespachanteEventos:
+    """
+    Lê a cauda do outbox (EVENTO_SALDO) a cada `intervalo` segundos, numa
+    única consulta por processo, e entrega cada evento às conexões SSE da
+    carteira. Só consulta o banco enquanto houver alguém assinando.
+
+    Os ids vêm do AUTO_INCREMENT, reservado no INSERT e não no commit: uma
+    transação que commita depois de outra de id maior deixa uma lacuna
+    momentânea. A entrega é em ordem de id e para na primeira lacuna por até
+    `lacuna_max` segundos; depois disso o id é dado como desfeito e pulado.
+    Assim tudo até `marca` já foi entregue, em ordem, e a retomada pelo
+    Last-Event-ID (outbox até a marca, depois ao vivo) não perde nem repete
+    eventos.
+
+    Sem ninguém assinando não há marca. A primeira assinatura parte das
+    últimas `janela` posições do outbox: a marca fica antes da primeira
+    lacuna delas, e os ids que já estavam lá são só atravessados, sem
+    entrega (existiam antes da assinatura); o que preencher a lacuna depois
+    é entregue normalmente.
+
+    Cliente que acumula mais de `fila_max` eventos sem ler tem a conexão
+    encerrada; o EventSource reconecta e retoma pelo Last-Event-ID.
+    """
+
+    def __init__(self, intervalo: float = 0.25, lacuna_max: float = 2.0, lote: int = 500, fila_max: int = 1000,
+                 janela: int = 1000):
+        self.intervalo = intervalo
+        self.lacuna_max = lacuna_max
+        self.lote = lote
+        self.fila_max = fila_max
+        self.janela = janela
+
+        # maior id já entregue; None = ninguém assinando (recomeça do fim do outbox)
+        self.marca: Optional[int] = None
+        self._lacuna_desde: Optional[float] = None
+        # ids acima da marca que já existiam na partida: atravessados sem entrega
+        self._anteriores: Set[int] = set()
+        self._assinaturas: Dict[str, Set[Assinatura]] = {}
+        self._tarefa: Optional[asyncio.Task] = None
+
+    async def assinar(self, endereco: str) -> Tuple[Assinatura, int, int]:
+        """
+        Registra uma conexão. Devolve a assinatura, a marca e o teto: a fila
+        recebe os eventos da carteira com id maior que a marca, menos os que
+        já existiam até o teto (esses só pela retomada do outbox).
+        """
+        if self.marca is None:
+            marca, anteriores = await run_in_threadpool(_no_repositorio, self._partida)
+            if self.marca is None:
+                self.marca, self._anteriores = marca, anteriores
+        assinatura = Assinatura(endereco)
+        self._assinaturas.setdefault(endereco, set()).add(assinatura)
+        EVENTOS_ASSINANTES.inc()
+        if self._tarefa is None or self._tarefa.done():
+            self._tarefa = asyncio.create_task(self._laco())
+        return assinatura, self.marca, max(self._anteriores, default=self.marca)
+
+    def _partida(self, repo: CarteiraRepository) -> Tuple[int, Set[int]]:
+        # marca antes da primeira lacuna das últimas `janela` posições
+        ultimo = repo.ultimo_evento()
+        inicio = max(ultimo - self.janela, 0)
+        esperado = inicio + 1
+        ids = repo.ids_eventos(inicio, ultimo)
+        for i, id_evento in enumerate(ids):
+            if id_evento != esperado:
+                return esperado - 1, set(ids[i:])
+            esperado += 1
+        return ultimo, set()
+
+    def cancelar(self, assinatura: Assinatura):
+        assinaturas = self._assinaturas.get(assinatura.endereco)
+        if assinaturas is None or assinatura not in assinaturas:
+            return
+        assinaturas.discard(assinatura)
+        if not assinaturas:
+            del self._assinaturas[assinatura.endereco]
+        EVENTOS_ASSINANTES.dec()
+
+    async def parar(self):
+        for assinaturas in list(self._assinaturas.values()):
+            for assinatura in list(assinaturas):
+                self._encerrar(assinatura)
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+
+    async def _laco(self):
+        while self._assinaturas:
+            try:
+                pendente = await self._consultar()
+            except Exception:
+                logger.exception("Falha ao ler o outbox de eventos")
+                pendente = False
+            if not pendente:
+                await asyncio.sleep(self.intervalo)
+        self.marca = None
+        self._lacuna_desde = None
+        self._anteriores = set()
+
+    async def _consultar(self) -> bool:
+        """Entrega o que já pode ser entregue; True se há mais para ler agora."""
+        apos = self.marca
+        eventos = await run_in_threadpool(_no_repositorio, lambda repo: repo.eventos_desde(apos, self.lote))
+        for evento in eventos:
+            id_evento = evento["id_evento"]
+            if id_evento > self.marca + 1:
+                agora = time.monotonic()
+                if self._lacuna_desde is None:
+                    self._lacuna_desde = agora
+                if agora - self._lacuna_desde < self.lacuna_max:
+                    return False
+                EVENTOS_LACUNAS.inc(id_evento - self.marca - 1)
+                logger.warning("Outbox: ids %d a %d pulados", self.marca + 1, id_evento - 1)
+            self._lacuna_desde = None
+            self.marca = id_evento
+            if id_evento in self._anteriores:
+                self._anteriores.discard(id_evento)
+                continue
+            self._entregar(evento)
+        return len(eventos) == self.lote
+
+    def _entregar(self, evento: Dict):
+        EVENTOS_ENTREGUES.inc()
+        for assinatura in list(self._assinaturas.get(evento["endereco_carteira"], ())):
+            if assinatura.fila.qsize() >= self.fila_max:
+                self._encerrar(assinatura)
+            else:
+                assinatura.fila.put_nowait(evento)
+
+    def _encerrar(self, assinatura: Assinatura):
+        self.cancelar(assinatura)
+        assinatura.fila.put_nowait(None)
+
+
+_despachante: Optional[DespachanteEventos] = None
+
+
+def get_despachante_eventos() -> DespachanteEventos:
+    # só usado no event loop: sem disputa entre threads
+    global _despachante
+    if _despachante is None:
+        _despachante = DespachanteEventos(
+            intervalo=float(os.getenv("EVENTOS_INTERVALO_MS", "250")) / 1000,
+            lacuna_max=float(os.getenv("EVENTOS_LACUNA_MAX_SEGUNDOS", "2")),
+            fila_max=int(os.getenv("EVENTOS_FILA_MAX", "1000")),
+            janela=int(os.getenv("EVENTOS_JANELA_PARTIDA", "1000")),
+        )
+    return _despachante
+
+
+async def parar_despachante_eventos():
+    if _despachante is not None:
+        await _despachante.parar()
+
+
+def ler_ultimo_evento(valor: Optional[str]) -> Optional[int]:
+    """Last-Event-ID do EventSource; inválido = sem retomada."""
+    try:
+        return int(valor) if valor else None
+    except ValueError:
+        return None
+
+
+def _evento_sse(evento: Dict) -> bytes:
+    dados = orjson.dumps(evento, default=str)
+    return b"id: %d\nevent: saldo\ndata: %s\n\n" % (evento["id_evento"], dados)
+
+
+def _eventos_carteira(endereco: str, apos: int, ate: int) -> List[Dict]:
+    return _no_repositorio(lambda repo: repo.eventos_carteira(endereco, apos, ate, PAGINA_RETOMADA))
+
+
+async def fluxo_eventos(endereco: str, ultimo_id: Optional[int] = None) -> AsyncIterator[bytes]:
+    """
+    Corpo do text/event-stream de uma carteira. Com `ultimo_id`
+    (Last-Event-ID), começa pelo que a conexão anterior perdeu, lido do
+    outbox até o teto do despachante; depois segue ao vivo.
+    """
+    despachante = get_despachante_eventos()
+    batimento = float(os.getenv("EVENTOS_BATIMENTO_SEGUNDOS", "15"))
+    assinatura, marca, teto = await despachante.assinar(endereco)
+    try:
+        yield b"retry: %d\n\n" % int(os.getenv("EVENTOS_RECONEXAO_MS", "3000"))
+
+        apos = ultimo_id
+        while apos is not None and apos < teto:
+            eventos = await run_in_threadpool(_eventos_carteira, endereco, apos, teto)
+            for evento in eventos:
+                if evento["id_evento"] > marca:
+                    assinatura.enviados.add(evento["id_evento"])
+                yield _evento_sse(evento)
+            apos = eventos[-1]["id_evento"] if len(eventos) == PAGINA_RETOMADA else None
+
+        while True:
+            try:
+                evento = await asyncio.wait_for(assinatura.fila.get(), timeout=batimento)
+            except asyncio.TimeoutError:
+                # comentário SSE: mantém a conexão viva em proxies
+                yield b": ping\n\n"
+                continue
+            if evento is None:
+                return
+            if evento["id_evento"] in assinatura.enviados:
+                assinatura.enviados.discard(evento["id_evento"])
+                continue
+            yield _evento_sse(evento)
+    finally:
+        despachante.cancelar(assinatura)
+
+
+def expurgar_eventos() -> int:
+    """Remove do outbox os eventos mais velhos que EVENTOS_RETENCAO_HORAS, em lotes."""
+    retencao_horas = int(os.getenv("EVENTOS_RETENCAO_HORAS", "24"))
+    lote = int(os.getenv("EVENTOS_EXPURGO_LOTE", "1000"))
+
+    total = 0
+    while True:
+        removidos = _no_repositorio(lambda repo: repo.expurgar_eventos(retencao_horas, lote))
+        total += removidos
+        if removidos < lote:
+            return total
@@ -0,0 +1,30 @@
+import os
+from datetime import date
+from typing import Any, Dict, Optional
+
+from api.persistence.repositories.relatorio_repository import RelatorioRepository
+
+
+class RelatorioService:
+    def __init__(self, relatorio_repo: RelatorioRepository):
+        self.relatorio_repo = relatorio_repo
+
+    def volume(self, de: date, ate: date, moeda: Optional[str] = None, tipo: Optional[str] = None) -> Dict[str, Any]:
+        max_dias = int(os.getenv("RELATORIO_MAX_DIAS", "366"))
+        if ate < de:
+            raise ValueError("`ate` deve ser igual ou posterior a `de`")
+        if (ate - de).days + 1 > max_dias:
+            raise ValueError(f"Período máximo do relatório: {max_dias} dias")
+
+        id_moeda = None
+        if moeda is not None:
+            id_moeda = self.relatorio_repo.id_moeda(moeda.upper())
+            if id_moeda is None:
+                raise ValueError(f"Moeda {moeda} não encontrada")
+
+        return {
+            "de": de,
+            "ate": ate,
+            "processado_ate": self.relatorio_repo.volume_processado_ate(),
+            "linhas": self.relatorio_repo.volume_diario(de, ate, id_moeda, tipo),
+        }
@@ -0,0 +1,87 @@
+"""
+Compara a vazão da pilha síncrona com a assíncrona (API_MODO) sob a mesma carga.
+
+Roda o app em processo (httpx + ASGITransport) contra o banco configurado no
+.env, com o provedor de cotações local. Carga: 70% GET /saldos, 30% depósitos
+em um conjunto fixo de carteiras.
+
+    python -m benchmarks.comparar_sync_async --requisicoes 2000 --concorrencia 64
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import statistics
+
+os.environ.setdefault("COTACAO_PROVEDOR", "local")
+
+import httpx
+
+from api.main import create_app
+
+
+async def preparar(client: httpx.AsyncClient, quantidade: int):
+    carteiras = []
+    for _ in range(quantidade):
+        resp = await client.post("/carteiras")
+        resp.raise_for_status()
+        carteiras.append(resp.json())
+    return carteiras
+
+
+async def rodar(modo: str, requisicoes: int, concorrencia: int, num_carteiras: int):
+    app = create_app(modo)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        carteiras = await preparar(client, num_carteiras)
+        latencias = []
+        erros = 0
+        fila = iter(range(requisicoes))
+
+        async def trabalhador():
+            nonlocal erros
+            for _ in fila:
+                carteira = random.choice(carteiras)
+                endereco = carteira["endereco_carteira"]
+                inicio = time.perf_counter()
+                if random.random() < 0.7:
+                    resp = await client.get(f"/carteiras/{endereco}/saldos")
+                else:
+                    resp = await client.post(
+                        f"/carteiras/{endereco}/depositos",
+                        json={"id_moeda": 4, "valor": 1.0, "chave_privada": carteira["chave_privada"]},
+                    )
+                latencias.append(time.perf_counter() - inicio)
+                if resp.status_code >= 400:
+                    erros += 1
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabalhador() for _ in range(concorrencia)))
+        duracao = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        "modo": modo,
+        "req_s": requisicoes / duracao,
+        "p50_ms": statistics.median(latencias) * 1000,
+        "p95_ms": latencias[int(len(latencias) * 0.95) - 1] * 1000,
+        "erros": erros,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requisicoes", type=int, default=2000)
+    parser.add_argument("--concorrencia", type=int, default=64)
+    parser.add_argument("--carteiras", type=int, default=50)
+    args = parser.parse_args()
+
+    for modo in ("sync", "async"):
+        r = asyncio.run(rodar(modo, args.requisicoes, args.concorrencia, args.carteiras))
+        print(f"{r['modo']:>5}: {r['req_s']:8.1f} req/s  p50 {r['p50_ms']:7.2f} ms  "
+              f"p95 {r['p95_ms']:7.2f} ms  erros {r['erros']}")
+
+
+if __name__ == "__main__":
+    main()
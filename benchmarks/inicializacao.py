@@ -0,0 +1,59 @@
+"""
+Mede o custo de subir um worker: tempo de `import api.main` e memória (RSS)
+do processo logo depois, sem banco. Cada medição roda num processo novo.
+
+Também conta engines e pools de conexão já criados e quantos módulos foram
+carregados; é o que um master com preload entrega pronto aos workers no fork.
+
+    python -m benchmarks.inicializacao --repeticoes 10
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+CODIGO = """
+import gc, sys, json, time
+inicio = time.perf_counter()
+import api.main
+importacao = time.perf_counter() - inicio
+
+from sqlalchemy.engine import Engine
+rss = next(int(l.split()[1]) for l in open("/proc/self/status") if l.startswith("VmRSS:"))
+print(json.dumps({
+    "importacao_ms": importacao * 1000,
+    "rss_mb": rss / 1024,
+    "engines": sum(isinstance(o, Engine) for o in gc.get_objects()),
+    "modulos": len(sys.modules),
+    "requests": "requests" in sys.modules,
+}))
+"""
+
+
+def medir_uma_vez() -> dict:
+    saida = subprocess.run(
+        [sys.executable, "-c", CODIGO], cwd=RAIZ, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(saida.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeticoes", type=int, default=10)
+    args = parser.parse_args()
+
+    medicoes = [medir_uma_vez() for _ in range(args.repeticoes)]
+    ultima = medicoes[-1]
+    print(f"import api.main      {statistics.median(m['importacao_ms'] for m in medicoes):8.1f} ms (mediana)")
+    print(f"RSS após o import    {statistics.median(m['rss_mb'] for m in medicoes):8.1f} MB")
+    print(f"engines criados      {ultima['engines']:8d}")
+    print(f"módulos carregados   {ultima['modulos']:8d}")
+    print(f"requests importado   {'sim' if ultima['requests'] else 'não':>8}")
+
+
+if __name__ == "__main__":
+    main()
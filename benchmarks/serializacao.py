@@ -0,0 +1,93 @@
+"""
+Mede a CPU gasta para montar a resposta de GET /carteiras e /saldos, sem banco.
+
+Compara o caminho com modelos (linha -> modelo pydantic -> validação pelo
+response_model -> jsonable -> json.dumps) com RespostaJSON (linhas do
+repositório direto no orjson), sobre linhas sintéticas no formato do
+repositório.
+
+    python -m benchmarks.serializacao --linhas 100 --repeticoes 2000
+"""
+import json
+import random
+import secrets
+import argparse
+import timeit
+from decimal import Decimal
+from datetime import datetime, timedelta
+from typing import List
+
+from pydantic import TypeAdapter
+
+from api.models.carteira_models import Carteira, Saldo, SaldosCarteira
+from api.routers.respostas import RespostaJSON
+
+
+def linhas_carteiras(n: int):
+    inicio = datetime(2026, 1, 1)
+    return [
+        {
+            "endereco_carteira": secrets.token_hex(16),
+            "data_criacao": inicio + timedelta(seconds=i),
+            "status": random.choice(["ATIVA", "BLOQUEADA"]),
+        }
+        for i in range(n)
+    ]
+
+
+def linhas_saldos(n: int):
+    return {
+        "endereco": secrets.token_hex(16),
+        "saldos": [
+            {"saldo": Decimal(random.randint(0, 10 ** 12)) / Decimal(10 ** 8), "moeda_codigo": f"M{i}", "moeda_nome": f"Moeda {i}"}
+            for i in range(n)
+        ],
+    }
+
+
+def com_modelos_carteiras(linhas, adaptador):
+    modelos = [Carteira(**r) for r in linhas]
+    validados = adaptador.validate_python(modelos)
+    return json.dumps(adaptador.dump_python(validados, mode="json")).encode()
+
+
+def com_modelos_saldos(dados, adaptador):
+    modelo = SaldosCarteira(endereco=dados["endereco"], saldos=[Saldo(**s) for s in dados["saldos"]])
+    validado = adaptador.validate_python(modelo)
+    return json.dumps(adaptador.dump_python(validado, mode="json")).encode()
+
+
+def medir(nome: str, funcao, repeticoes: int) -> float:
+    segundos = min(timeit.repeat(funcao, number=repeticoes, repeat=3))
+    por_resposta = segundos / repeticoes * 1e6
+    print(f"{nome:<42} {por_resposta:9.1f} µs/resposta")
+    return por_resposta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--linhas", type=int, default=100, help="carteiras por página")
+    parser.add_argument("--moedas", type=int, default=5, help="linhas de saldo")
+    parser.add_argument("--repeticoes", type=int, default=2000)
+    args = parser.parse_args()
+
+    carteiras = linhas_carteiras(args.linhas)
+    saldos = linhas_saldos(args.moedas)
+    lista = TypeAdapter(List[Carteira])
+    saldos_carteira = TypeAdapter(SaldosCarteira)
+
+    # as duas formas têm de produzir o mesmo JSON
+    assert json.loads(com_modelos_carteiras(carteiras, lista)) == json.loads(RespostaJSON(carteiras).body)
+    assert json.loads(com_modelos_saldos(saldos, saldos_carteira)) == json.loads(RespostaJSON(saldos).body)
+
+    for rota, antes, depois in (
+        ("GET /carteiras", lambda: com_modelos_carteiras(carteiras, lista), lambda: RespostaJSON(carteiras).body),
+        ("GET /carteiras/{e}/saldos", lambda: com_modelos_saldos(saldos, saldos_carteira), lambda: RespostaJSON(saldos).body),
+    ):
+        t_antes = medir(f"{rota} (modelos)", antes, args.repeticoes)
+        t_depois = medir(f"{rota} (RespostaJSON)", depois, args.repeticoes)
+        print(f"{'':<42} {t_antes / t_depois:9.1f}x menos CPU")
+
+
+if __name__ == "__main__":
+    main()
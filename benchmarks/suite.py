@@ -0,0 +1,400 @@
+"""
+Suíte de benchmarks da API de carteiras.
+
+Sobe o app de `api.main:create_app` em processo (httpx + ASGITransport) contra
+um banco MySQL local descartável e o provedor de cotações local (sem rede).
+Para cada carga mede vazão, latência p50/p95/p99 e idas ao banco por
+requisição; grava o resultado em JSON e compara com um baseline.
+
+O banco é recriado do zero a partir de sql/DDL_Carteira_Digital.sql no schema
+BENCH_DB_NAME (padrão wallet_bench), usando as credenciais DB_* do ambiente
+(o usuário precisa poder criar bancos). Ex.:
+
+    docker run -d --name wallet-bench -e MYSQL_ROOT_PASSWORD=bench -p 3307:3306 mysql:8
+    DB_USER=root DB_PASSWORD=bench DB_PORT=3307 DB_HOST=127.0.0.1 \\
+        python -m benchmarks.suite --concorrencia 32 --saida resultados.json \\
+        --baseline benchmarks/baseline.json
+
+Sai com código 1 quando alguma carga regride além de --tolerancia.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import threading
+import asyncio
+import argparse
+import subprocess
+from abc import ABC, abstractmethod
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+import httpx
+
+RAIZ = Path(__file__).resolve().parent.parent
+DDL = RAIZ / "sql" / "DDL_Carteira_Digital.sql"
+
+ID_USD = 4
+SALDO_INICIAL = 1_000_000.0
+
+
+# --------------------------------------------------------------------------
+# banco descartável
+# --------------------------------------------------------------------------
+
+def _comandos_ddl() -> List[str]:
+    """Tabelas e carga de MOEDA do DDL (sem CREATE DATABASE/USER/GRANT/USE)."""
+    sql = DDL.read_text(encoding="utf-8")
+    sql = sql[re.search(r"^USE\s+\w+;", sql, re.M).end():]
+    sql = re.sub(r"--[^\n]*", "", sql)
+    return [c.strip() for c in sql.split(";") if c.strip()]
+
+
+def recriar_banco(nome: str):
+    from sqlalchemy import create_engine, text
+    from api.persistence.db import get_database_url
+
+    servidor = create_engine(get_database_url().rsplit("/", 1)[0] + "/")
+    with servidor.begin() as conn:
+        conn.execute(text(f"DROP DATABASE IF EXISTS `{nome}`"))
+        conn.execute(text(f"CREATE DATABASE `{nome}`"))
+        conn.execute(text(f"USE `{nome}`"))
+        for comando in _comandos_ddl():
+            conn.execute(text(comando))
+    servidor.dispose()
+
+
+# --------------------------------------------------------------------------
+# contagem de idas ao banco
+# --------------------------------------------------------------------------
+
+class ContadorIdasAoBanco:
+    """
+    Conta comandos SQL, commits, rollbacks e pings do pool (pool_pre_ping
+    faz um a cada checkout) nos engines do app.
+    """
+
+    def __init__(self, engines):
+        from sqlalchemy import event
+
+        # os eventos chegam de várias threads (threadpool do modo síncrono)
+        self._lock = threading.Lock()
+        self.total = 0
+
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._contar)
+            event.listen(engine, "commit", self._contar)
+            event.listen(engine, "rollback", self._contar)
+            event.listen(engine.pool, "checkout", self._contar)
+
+    def _contar(self, *args, **kwargs):
+        with self._lock:
+            self.total += 1
+
+
+# --------------------------------------------------------------------------
+# cargas
+# --------------------------------------------------------------------------
+
+async def _criar_carteiras(client: httpx.AsyncClient, quantidade: int, saldo: float = 0) -> List[Dict[str, Any]]:
+    carteiras = []
+    for _ in range(quantidade):
+        resp = await client.post("/carteiras")
+        resp.raise_for_status()
+        carteira = resp.json()
+        if saldo:
+            resp = await client.post(
+                f"/carteiras/{carteira['endereco_carteira']}/depositos",
+                json={"id_moeda": ID_USD, "valor": saldo, "chave_privada": carteira["chave_privada"]},
+            )
+            resp.raise_for_status()
+        carteiras.append(carteira)
+    return carteiras
+
+
+class Carga(ABC):
+    """Uma carga: `preparar` roda fora da medição; `requisicao` é o que se mede."""
+
+    nome = ""
+
+    def __init__(self, num_carteiras: int):
+        self.num_carteiras = num_carteiras
+
+    async def preparar(self, client: httpx.AsyncClient):
+        pass
+
+    @abstractmethod
+    async def requisicao(self, client: httpx.AsyncClient) -> httpx.Response:
+        ...
+
+
+class CriacaoCarteiras(Carga):
+    nome = "criacao_carteiras"
+
+    async def requisicao(self, client):
+        return await client.post("/carteiras")
+
+
+class ConsultaSaldos(Carga):
+    nome = "consulta_saldos"
+
+    async def preparar(self, client):
+        self.carteiras = await _criar_carteiras(client, self.num_carteiras, SALDO_INICIAL)
+
+    async def requisicao(self, client):
+        carteira = random.choice(self.carteiras)
+        return await client.get(f"/carteiras/{carteira['endereco_carteira']}/saldos")
+
+
+class Depositos(Carga):
+    nome = "depositos"
+
+    async def preparar(self, client):
+        self.carteiras = await _criar_carteiras(client, self.num_carteiras)
+
+    async def requisicao(self, client):
+        carteira = random.choice(self.carteiras)
+        return await client.post(
+            f"/carteiras/{carteira['endereco_carteira']}/depositos",
+            json={"id_moeda": ID_USD, "valor": 1.0, "chave_privada": carteira["chave_privada"]},
+        )
+
+
+class TransferenciasUniformes(Carga):
+    """Origem e destino sorteados entre todas as carteiras."""
+
+    nome = "transferencias_uniformes"
+
+    async def preparar(self, client):
+        self.carteiras = await _criar_carteiras(client, self.num_carteiras, SALDO_INICIAL)
+
+    def _par(self):
+        return random.sample(self.carteiras, 2)
+
+    async def requisicao(self, client):
+        origem, destino = self._par()
+        return await client.post(
+            f"/carteiras/{origem['endereco_carteira']}/transferencias",
+            json={
+                "endereco_destino": destino["endereco_carteira"],
+                "id_moeda": ID_USD,
+                "valor": 0.01,
+                "chave_privada": origem["chave_privada"],
+            },
+        )
+
+
+class TransferenciasCarteiraQuente(TransferenciasUniformes):
+    """Muitas origens pagando sempre a mesma carteira de destino."""
+
+    nome = "transferencias_carteira_quente"
+
+    async def preparar(self, client):
+        await super().preparar(client)
+        self.destino, *self.origens = self.carteiras
+
+    def _par(self):
+        return random.choice(self.origens), self.destino
+
+
+class TransferenciasCarteiraQuenteFatiada(TransferenciasCarteiraQuente):
+    """
+    Mesma carga de transferencias_carteira_quente, com o destino marcado
+    como carteira quente (saldo em FATIAS fatias): comparar as duas mostra
+    o ganho das fatias para quem recebe muito.
+    """
+
+    nome = "transferencias_carteira_quente_fatiada"
+    FATIAS = 16
+
+    async def preparar(self, client):
+        await super().preparar(client)
+        from starlette.concurrency import run_in_threadpool
+        from api.persistence.unit_of_work import UnidadeDeTrabalho
+        from api.persistence.repositories.carteira_repository import CarteiraRepository
+
+        def marcar():
+            with UnidadeDeTrabalho() as uow:
+                CarteiraRepository(uow).definir_fatias(self.destino["endereco_carteira"], self.FATIAS)
+
+        await run_in_threadpool(marcar)
+
+
+CARGAS: Dict[str, Callable[[int], Carga]] = {
+    c.nome: c
+    for c in (
+        CriacaoCarteiras,
+        ConsultaSaldos,
+        Depositos,
+        TransferenciasUniformes,
+        TransferenciasCarteiraQuente,
+        TransferenciasCarteiraQuenteFatiada,
+    )
+}
+
+
+# --------------------------------------------------------------------------
+# execução e relatório
+# --------------------------------------------------------------------------
+
+def _percentil(ordenadas: List[float], p: float) -> float:
+    if not ordenadas:
+        return 0.0
+    indice = min(len(ordenadas) - 1, max(0, int(round(p / 100 * len(ordenadas))) - 1))
+    return ordenadas[indice]
+
+
+async def medir(client: httpx.AsyncClient, carga: Carga, contador: ContadorIdasAoBanco,
+                requisicoes: int, concorrencia: int, aquecimento: int) -> Dict[str, Any]:
+    await carga.preparar(client)
+    for _ in range(aquecimento):
+        await carga.requisicao(client)
+
+    latencias: List[float] = []
+    erros = recusadas = 0
+    fila = iter(range(requisicoes))
+
+    async def trabalhador():
+        nonlocal erros, recusadas
+        for _ in fila:
+            inicio = time.perf_counter()
+            resp = await carga.requisicao(client)
+            latencias.append(time.perf_counter() - inicio)
+            if resp.status_code >= 400:
+                erros += 1
+            # recusas rápidas da admissão/limite por carteira: não mediram o banco
+            if resp.status_code in (429, 503):
+                recusadas += 1
+
+    idas_antes = contador.total
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabalhador() for _ in range(concorrencia)))
+    duracao = time.perf_counter() - inicio
+    idas = contador.total - idas_antes
+
+    latencias.sort()
+    return {
+        "requisicoes": requisicoes,
+        "erros": erros,
+        "recusadas": recusadas,
+        "req_s": round(requisicoes / duracao, 1),
+        "p50_ms": round(_percentil(latencias, 50) * 1000, 2),
+        "p95_ms": round(_percentil(latencias, 95) * 1000, 2),
+        "p99_ms": round(_percentil(latencias, 99) * 1000, 2),
+        "idas_ao_banco_por_req": round(idas / requisicoes, 2),
+    }
+
+
+async def rodar(args) -> Dict[str, Any]:
+    # só agora: o engine lê DB_NAME/COTACAO_PROVEDOR na importação
+    from api.main import create_app
+    from api.persistence.db import get_engine
+    from api.services.cotacao_service import CotacaoService, LocalProvedorCotacoes, definir_cotacao_service
+
+    definir_cotacao_service(CotacaoService(LocalProvedorCotacoes()))
+    engines = [get_engine()]
+    if args.modo == "async":
+        from api.persistence.db_async import get_async_engine
+        engines.append(get_async_engine().sync_engine)
+    contador = ContadorIdasAoBanco(engines)
+
+    app = create_app(args.modo)
+    resultados = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for nome in args.cargas:
+            carga = CARGAS[nome](args.carteiras)
+            resultados[nome] = await medir(
+                client, carga, contador, args.requisicoes, args.concorrencia, args.aquecimento,
+            )
+            r = resultados[nome]
+            print(f"{nome:>32}: {r['req_s']:8.1f} req/s  p50 {r['p50_ms']:7.2f}  p95 {r['p95_ms']:7.2f}  "
+                  f"p99 {r['p99_ms']:7.2f} ms  idas/req {r['idas_ao_banco_por_req']:5.2f}  erros {r['erros']}  "
+                  f"recusadas {r['recusadas']}")
+    return resultados
+
+
+def _commit_atual() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecido"
+
+
+def comparar(atual: Dict[str, Any], baseline: Dict[str, Any], tolerancia: float) -> List[str]:
+    """Regressões: vazão menor, p95/p99 ou idas ao banco maiores que o baseline além da tolerância."""
+    regressoes = []
+    for nome, r in atual["resultados"].items():
+        base = baseline.get("resultados", {}).get(nome)
+        if not base:
+            continue
+        if r["req_s"] < base["req_s"] * (1 - tolerancia):
+            regressoes.append(f"{nome}: vazão {r['req_s']} < {base['req_s']} req/s")
+        for campo in ("p95_ms", "p99_ms", "idas_ao_banco_por_req"):
+            if r[campo] > base[campo] * (1 + tolerancia):
+                regressoes.append(f"{nome}: {campo} {r[campo]} > {base[campo]}")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cargas", nargs="+", choices=list(CARGAS), default=list(CARGAS))
+    parser.add_argument("--modo", choices=("sync", "async"), default="sync")
+    parser.add_argument("--requisicoes", type=int, default=2000)
+    parser.add_argument("--concorrencia", type=int, default=32)
+    parser.add_argument("--carteiras", type=int, default=50)
+    parser.add_argument("--aquecimento", type=int, default=50)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--saida", type=Path, help="grava o resultado em JSON")
+    parser.add_argument("--baseline", type=Path, help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--gravar-baseline", action="store_true", help="grava o resultado em --baseline")
+    parser.add_argument("--tolerancia", type=float, default=0.10)
+    args = parser.parse_args()
+
+    random.seed(args.semente)
+    nome_banco = os.getenv("BENCH_DB_NAME", "wallet_bench")
+    os.environ["DB_NAME"] = nome_banco
+    os.environ["COTACAO_PROVEDOR"] = "local"
+    # as cargas mandam dezenas de POSTs por carteira: sem o limite por carteira
+    os.environ["LIMITE_CARTEIRA_POR_SEGUNDO"] = "0"
+    recriar_banco(nome_banco)
+
+    resultado = {
+        "commit": _commit_atual(),
+        "data": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "modo": args.modo,
+            "requisicoes": args.requisicoes,
+            "concorrencia": args.concorrencia,
+            "carteiras": args.carteiras,
+            "aquecimento": args.aquecimento,
+            "semente": args.semente,
+        },
+        "resultados": asyncio.run(rodar(args)),
+    }
+
+    recusas = {nome: r["recusadas"] for nome, r in resultado["resultados"].items() if r["recusadas"]}
+    if recusas:
+        print(f"FALHA: requisições recusadas com 429/503 (números inválidos): {recusas}")
+        sys.exit(1)
+
+    if args.saida:
+        args.saida.write_text(json.dumps(resultado, indent=2, ensure_ascii=False), encoding="utf-8")
+    if args.baseline and args.gravar_baseline:
+        args.baseline.write_text(json.dumps(resultado, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"baseline gravado em {args.baseline}")
+    elif args.baseline and args.baseline.exists():
+        regressoes = comparar(resultado, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerancia)
+        for r in regressoes:
+            print(f"REGRESSÃO {r}")
+        if regressoes:
+            sys.exit(1)
+        print(f"sem regressões em relação a {args.baseline} (tolerância {args.tolerancia:.0%})")
+
+
+if __name__ == "__main__":
+    main()
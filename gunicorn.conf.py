@@ -0,0 +1,35 @@
+"""
+Perfil de produção: vários workers uvicorn sob o gunicorn.
+
+    gunicorn -c gunicorn.conf.py api.main:app
+
+O master importa o app uma vez (preload) e os workers herdam o código já
+carregado no fork; engines, pools e o cliente de cotações só são criados no
+lifespan de cada worker. Conexões por engine no banco: até
+API_WORKERS * (DB_POOL_TAMANHO + DB_POOL_EXCEDENTE).
+"""
+import os
+import multiprocessing
+
+bind = os.getenv("API_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("API_WORKERS", multiprocessing.cpu_count()))
+worker_class = "uvicorn_worker.UvicornWorker"
+
+preload_app = True
+
+timeout = int(os.getenv("API_WORKER_TIMEOUT_SEGUNDOS", "30"))
+# tempo para o lifespan gravar os depósitos ainda na fila e fechar os pools
+graceful_timeout = int(os.getenv("API_ENCERRAMENTO_SEGUNDOS", "30"))
+keepalive = int(os.getenv("API_KEEPALIVE_SEGUNDOS", "5"))
+
+# recicla os workers de tempos em tempos (com jitter, para não reiniciarem juntos)
+max_requests = int(os.getenv("API_WORKER_MAX_REQUISICOES", "0"))
+max_requests_jitter = max_requests // 10
+
+
+def child_exit(server, worker):
+    # métricas de worker que morreu saem da soma do /metrics
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
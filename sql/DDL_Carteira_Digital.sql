@@ -34,7 +34,11 @@ CREATE TABLE CARTEIRA (
     hash_chave_privada VARCHAR(255) NOT NULL,
     data_criacao DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     status ENUM('ATIVA','BLOQUEADA') NOT NULL DEFAULT 'ATIVA',
-    PRIMARY KEY (endereco_carteira)
+    -- > 1: carteira quente, créditos espalhados em SALDO_CARTEIRA_FATIA
+    fatias_saldo SMALLINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (endereco_carteira),
+    -- a releitura das carteiras quentes (fatias_saldo > 1) não varre a tabela
+    INDEX idx_carteira_fatias (fatias_saldo)
 );
 
 CREATE TABLE MOEDA (
@@ -48,12 +52,36 @@ CREATE TABLE SALDO_CARTEIRA (
     endereco_carteira VARCHAR(255) NOT NULL,
     id_moeda SMALLINT NOT NULL,
     saldo DECIMAL(18, 8) NOT NULL default 0.0,
+    -- incrementada a cada alteração; a soma por carteira (com as fatias) é
+    -- o ETag de GET /carteiras/{endereco} e /saldos
+    versao BIGINT NOT NULL DEFAULT 0,
     data_atualizacao DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     PRIMARY KEY (endereco_carteira, id_moeda),
     FOREIGN KEY (endereco_carteira) REFERENCES CARTEIRA(endereco_carteira),
     FOREIGN KEY (id_moeda) REFERENCES MOEDA(id_moeda)
 );
 
+-- Sub-saldos de carteiras quentes: cada crédito cai numa fatia sorteada,
+-- sem disputar a trava da linha de SALDO_CARTEIRA. O saldo da carteira é
+-- SALDO_CARTEIRA.saldo + soma das fatias; débitos consolidam as fatias na
+-- linha principal quando ela sozinha não cobre o valor.
+CREATE TABLE SALDO_CARTEIRA_FATIA (
+    endereco_carteira VARCHAR(255) NOT NULL,
+    id_moeda SMALLINT NOT NULL,
+    fatia SMALLINT NOT NULL,
+    saldo DECIMAL(18, 8) NOT NULL DEFAULT 0.0,
+    versao BIGINT NOT NULL DEFAULT 0,
+    data_atualizacao DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (endereco_carteira, id_moeda, fatia),
+    FOREIGN KEY (endereco_carteira, id_moeda) REFERENCES SALDO_CARTEIRA(endereco_carteira, id_moeda)
+);
+
+-- Movimentações (DEPOSITO_SAQUE, CONVERSAO, TRANSFERENCIA): só recebem
+-- INSERT, particionadas por mês em data_hora. O MySQL exige data_hora na
+-- chave primária e não aceita FOREIGN KEY em tabela particionada: carteira
+-- e moeda já são garantidas pelo UPDATE em SALDO_CARTEIRA (que tem as FKs)
+-- na mesma transação. As partições mensais são criadas a partir de
+-- p_futuras e as antigas arquivadas por `python -m api.jobs.particoes`.
 CREATE TABLE DEPOSITO_SAQUE (
     id_movimento BIGINT NOT NULL AUTO_INCREMENT,
     endereco_carteira VARCHAR(255) NOT NULL,
@@ -62,9 +90,16 @@ CREATE TABLE DEPOSITO_SAQUE (
     valor DECIMAL(18, 8) NOT NULL,
     taxa_valor DECIMAL(18, 8) NOT NULL,
     data_hora DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    PRIMARY KEY (id_movimento),
-    FOREIGN KEY (endereco_carteira) REFERENCES CARTEIRA(endereco_carteira),
-    FOREIGN KEY (id_moeda) REFERENCES MOEDA(id_moeda)
+    PRIMARY KEY (id_movimento, data_hora),
+    -- extrato: busca por carteira em ordem de tempo, moeda filtrada no índice;
+    -- cobre todas as colunas do extrato (a página não volta à chave primária)
+    INDEX idx_deposito_saque_extrato (endereco_carteira, data_hora, id_movimento, id_moeda, tipo, valor, taxa_valor),
+    -- job do volume diário: lê só as linhas novas desde o checkpoint
+    INDEX idx_deposito_saque_data_hora (data_hora)
+)
+PARTITION BY RANGE COLUMNS (data_hora) (
+    PARTITION p_antigas VALUES LESS THAN ('2026-01-01'),
+    PARTITION p_futuras VALUES LESS THAN (MAXVALUE)
 );
 
 CREATE TABLE CONVERSAO (
@@ -78,10 +113,14 @@ CREATE TABLE CONVERSAO (
     taxa_valor DECIMAL(18, 8) NOT NULL,
     cotacao_utilizada DECIMAL(18, 8) NOT NULL,
     data_hora DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    PRIMARY KEY (id_conversao),
-    FOREIGN KEY (endereco_carteira) REFERENCES CARTEIRA(endereco_carteira),
-    FOREIGN KEY (id_moeda_origem) REFERENCES MOEDA(id_moeda),
-    FOREIGN KEY (id_moeda_destino) REFERENCES MOEDA(id_moeda)
+    PRIMARY KEY (id_conversao, data_hora),
+    INDEX idx_conversao_extrato (endereco_carteira, data_hora, id_conversao, id_moeda_origem, id_moeda_destino,
+                                 valor_origem, valor_destino, taxa_valor),
+    INDEX idx_conversao_data_hora (data_hora)
+)
+PARTITION BY RANGE COLUMNS (data_hora) (
+    PARTITION p_antigas VALUES LESS THAN ('2026-01-01'),
+    PARTITION p_futuras VALUES LESS THAN (MAXVALUE)
 );
 
 CREATE TABLE TRANSFERENCIA (
@@ -92,12 +131,81 @@ CREATE TABLE TRANSFERENCIA (
     valor DECIMAL(18, 8) NOT NULL,
     taxa_valor DECIMAL(18, 8) NOT NULL,
     data_hora DATETIME NOT NULL,
-    PRIMARY KEY (id_transferencia),
-    -- Referência à CARTEIRA de origem
-    FOREIGN KEY (endereco_origem) REFERENCES CARTEIRA(endereco_carteira),
-    -- Referência à CARTEIRA de destino
-    FOREIGN KEY (endereco_destino) REFERENCES CARTEIRA(endereco_carteira),
-    FOREIGN KEY (id_moeda) REFERENCES MOEDA(id_moeda)
+    PRIMARY KEY (id_transferencia, data_hora),
+    -- extrato: enviadas (origem) e recebidas (destino), com a contraparte no índice
+    INDEX idx_transferencia_origem_extrato (endereco_origem, data_hora, id_transferencia, id_moeda,
+                                            valor, taxa_valor, endereco_destino),
+    INDEX idx_transferencia_destino_extrato (endereco_destino, data_hora, id_transferencia, id_moeda,
+                                             valor, endereco_origem),
+    INDEX idx_transferencia_data_hora (data_hora)
+)
+PARTITION BY RANGE COLUMNS (data_hora) (
+    PARTITION p_antigas VALUES LESS THAN ('2026-01-01'),
+    PARTITION p_futuras VALUES LESS THAN (MAXVALUE)
+);
+
+CREATE TABLE COTACAO (
+    id_cotacao CHAR(32) NOT NULL,
+    endereco_carteira VARCHAR(255) NOT NULL,
+    id_moeda_origem SMALLINT NOT NULL,
+    id_moeda_destino SMALLINT NOT NULL,
+    cotacao DECIMAL(18, 8) NOT NULL,
+    criada_em DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expira_em DATETIME NOT NULL,
+    utilizada_em DATETIME NULL,
+    PRIMARY KEY (id_cotacao),
+    FOREIGN KEY (endereco_carteira) REFERENCES CARTEIRA(endereco_carteira),
+    FOREIGN KEY (id_moeda_origem) REFERENCES MOEDA(id_moeda),
+    FOREIGN KEY (id_moeda_destino) REFERENCES MOEDA(id_moeda)
+);
+
+-- Chaves de idempotência (header Idempotency-Key): gravadas na mesma
+-- transação da operação; a resposta é devolvida de novo nas repetições.
+-- Linhas mais velhas que IDEMPOTENCIA_RETENCAO_HORAS são expurgadas.
+CREATE TABLE IDEMPOTENCIA (
+    endereco_carteira VARCHAR(255) NOT NULL,
+    chave VARCHAR(255) NOT NULL,
+    operacao VARCHAR(20) NOT NULL,
+    hash_requisicao CHAR(64) NOT NULL,
+    resposta TEXT NULL,
+    criada_em DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (endereco_carteira, chave),
+    INDEX idx_idempotencia_criada_em (criada_em)
+);
+
+-- Outbox das alterações de saldo: uma linha por (carteira, moeda) movimentada,
+-- gravada na mesma transação da movimentação. O id crescente é o cursor do
+-- despachante que alimenta GET /carteiras/{endereco}/eventos (SSE). Linhas
+-- mais velhas que EVENTOS_RETENCAO_HORAS são expurgadas.
+CREATE TABLE EVENTO_SALDO (
+    id_evento BIGINT NOT NULL AUTO_INCREMENT,
+    endereco_carteira VARCHAR(255) NOT NULL,
+    tipo ENUM('DEPOSITO', 'SAQUE', 'CONVERSAO', 'TRANSFERENCIA') NOT NULL,
+    id_moeda SMALLINT NOT NULL,
+    valor DECIMAL(18, 8) NOT NULL,            -- variação do saldo (negativo = débito)
+    saldo DECIMAL(18, 8) NOT NULL,            -- saldo depois da movimentação
+    endereco_contraparte VARCHAR(255) NULL,   -- transferências
+    data_hora DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id_evento),
+    -- retomada do SSE (Last-Event-ID) por carteira
+    INDEX idx_evento_saldo_carteira (endereco_carteira, id_evento)
+);
+
+-- Reconciliação (python -m api.jobs.reconciliacao): soma das movimentações
+-- por (carteira, moeda) até o checkpoint de cada faixa de endereços, para a
+-- execução incremental só ler as linhas novas.
+CREATE TABLE RECONCILIACAO_SALDO (
+    endereco_carteira VARCHAR(255) NOT NULL,
+    id_moeda SMALLINT NOT NULL,
+    total DECIMAL(30, 8) NOT NULL,
+    PRIMARY KEY (endereco_carteira, id_moeda)
+);
+
+CREATE TABLE RECONCILIACAO_FAIXA (
+    inicio VARCHAR(255) NOT NULL,          -- '' = sem limite inferior
+    fim VARCHAR(255) NULL,                 -- NULL = sem limite superior
+    processado_ate DATETIME NOT NULL,
+    PRIMARY KEY (inicio)
 );
 
 INSERT INTO MOEDA (id_moeda, codigo, nome, tipo) VALUES
@@ -106,3 +214,30 @@ INSERT INTO MOEDA (id_moeda, codigo, nome, tipo) VALUES
 (3, 'SOL', 'Solana', 'Cripto'),
 (4, 'USD', 'Dólar Americano', 'Fiduciária'),
 (5, 'BRL', 'Real Brasileiro', 'Fiduciária');
+
+-- Volume e taxas por (dia, moeda, tipo de operação), para GET /relatorios/volume.
+-- Mantida por `python -m api.jobs.volume_diario`, que soma as movimentações
+-- novas a partir do checkpoint.
+CREATE TABLE VOLUME_DIARIO (
+    dia DATE NOT NULL,
+    id_moeda SMALLINT NOT NULL,
+    tipo ENUM('DEPOSITO', 'SAQUE', 'CONVERSAO', 'TRANSFERENCIA') NOT NULL,
+    quantidade BIGINT NOT NULL,
+    volume DECIMAL(30, 8) NOT NULL,
+    taxas DECIMAL(30, 8) NOT NULL,
+    PRIMARY KEY (dia, id_moeda, tipo)
+);
+
+CREATE TABLE VOLUME_DIARIO_CHECKPOINT (
+    id TINYINT NOT NULL,                   -- sempre 1
+    processado_ate DATETIME NOT NULL,
+    PRIMARY KEY (id)
+);
+
+-- Pulso da réplica de leitura: a API grava NOW(6) no primário e mede quanto
+-- tempo o valor leva para aparecer na réplica (ver api/persistence/replica.py).
+CREATE TABLE REPLICA_PULSO (
+    id TINYINT NOT NULL,                   -- sempre 1
+    batida DATETIME(6) NOT NULL,
+    PRIMARY KEY (id)
+);
@@ -0,0 +1,21 @@
+-- =========================================================
+--  Cotações travadas (POST /carteiras/{endereco}/cotacoes)
+--  Para bancos criados antes de COTACAO entrar no DDL.
+-- =========================================================
+
+USE wallet_homolog;
+
+CREATE TABLE COTACAO (
+    id_cotacao CHAR(32) NOT NULL,
+    endereco_carteira VARCHAR(255) NOT NULL,
+    id_moeda_origem SMALLINT NOT NULL,
+    id_moeda_destino SMALLINT NOT NULL,
+    cotacao DECIMAL(18, 8) NOT NULL,
+    criada_em DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expira_em DATETIME NOT NULL,
+    utilizada_em DATETIME NULL,
+    PRIMARY KEY (id_cotacao),
+    FOREIGN KEY (endereco_carteira) REFERENCES CARTEIRA(endereco_carteira),
+    FOREIGN KEY (id_moeda_origem) REFERENCES MOEDA(id_moeda),
+    FOREIGN KEY (id_moeda_destino) REFERENCES MOEDA(id_moeda)
+);
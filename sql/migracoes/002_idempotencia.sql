@@ -0,0 +1,17 @@
+-- =========================================================
+--  Chaves de idempotência (header Idempotency-Key)
+--  Para bancos criados antes de IDEMPOTENCIA entrar no DDL.
+-- =========================================================
+
+USE wallet_homolog;
+
+CREATE TABLE IDEMPOTENCIA (
+    endereco_carteira VARCHAR(255) NOT NULL,
+    chave VARCHAR(255) NOT NULL,
+    operacao VARCHAR(20) NOT NULL,
+    hash_requisicao CHAR(64) NOT NULL,
+    resposta TEXT NULL,
+    criada_em DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (endereco_carteira, chave),
+    INDEX idx_idempotencia_criada_em (criada_em)
+);
@@ -0,0 +1,20 @@
+-- =========================================================
+--  Índices do extrato (GET /carteiras/{endereco}/extrato)
+--  Para bancos criados antes desses índices entrarem no DDL.
+-- =========================================================
+
+USE wallet_homolog;
+
+ALTER TABLE DEPOSITO_SAQUE
+    ADD INDEX idx_deposito_saque_extrato (endereco_carteira, data_hora, id_movimento, id_moeda),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE CONVERSAO
+    ADD INDEX idx_conversao_extrato (endereco_carteira, data_hora, id_conversao, id_moeda_origem, id_moeda_destino),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+-- o índice composto por endereco_origem também atende a FK de origem
+ALTER TABLE TRANSFERENCIA
+    ADD INDEX idx_transferencia_origem_extrato (endereco_origem, data_hora, id_transferencia, id_moeda),
+    ADD INDEX idx_transferencia_destino_extrato (endereco_destino, data_hora, id_transferencia, id_moeda),
+    ALGORITHM=INPLACE, LOCK=NONE;
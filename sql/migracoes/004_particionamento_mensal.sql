@@ -0,0 +1,52 @@
+-- =========================================================
+--  Particionamento mensal das movimentações por data_hora
+--  (DEPOSITO_SAQUE, CONVERSAO, TRANSFERENCIA)
+--
+--  Para bancos criados antes do particionamento entrar no DDL.
+--  Cada ALTER ... PARTITION BY reconstrói a tabela: rode numa janela
+--  de manutenção. Depois, crie as partições mensais com
+--      python -m api.jobs.particoes manter
+-- =========================================================
+
+USE wallet_homolog;
+
+-- 1) Tabela particionada não aceita FOREIGN KEY. Os nomes abaixo são os
+--    gerados pelo MySQL para o DDL original; confira com
+--    SHOW CREATE TABLE <tabela> antes de rodar.
+ALTER TABLE DEPOSITO_SAQUE
+    DROP FOREIGN KEY DEPOSITO_SAQUE_ibfk_1,
+    DROP FOREIGN KEY DEPOSITO_SAQUE_ibfk_2;
+
+ALTER TABLE CONVERSAO
+    DROP FOREIGN KEY CONVERSAO_ibfk_1,
+    DROP FOREIGN KEY CONVERSAO_ibfk_2,
+    DROP FOREIGN KEY CONVERSAO_ibfk_3;
+
+ALTER TABLE TRANSFERENCIA
+    DROP FOREIGN KEY TRANSFERENCIA_ibfk_1,
+    DROP FOREIGN KEY TRANSFERENCIA_ibfk_2,
+    DROP FOREIGN KEY TRANSFERENCIA_ibfk_3;
+
+-- 2) A coluna de particionamento precisa estar na chave primária
+ALTER TABLE DEPOSITO_SAQUE DROP PRIMARY KEY, ADD PRIMARY KEY (id_movimento, data_hora);
+ALTER TABLE CONVERSAO DROP PRIMARY KEY, ADD PRIMARY KEY (id_conversao, data_hora);
+ALTER TABLE TRANSFERENCIA DROP PRIMARY KEY, ADD PRIMARY KEY (id_transferencia, data_hora);
+
+-- 3) Tudo o que já existe fica em p_antigas; o job cria os meses seguintes
+ALTER TABLE DEPOSITO_SAQUE
+PARTITION BY RANGE COLUMNS (data_hora) (
+    PARTITION p_antigas VALUES LESS THAN ('2026-01-01'),
+    PARTITION p_futuras VALUES LESS THAN (MAXVALUE)
+);
+
+ALTER TABLE CONVERSAO
+PARTITION BY RANGE COLUMNS (data_hora) (
+    PARTITION p_antigas VALUES LESS THAN ('2026-01-01'),
+    PARTITION p_futuras VALUES LESS THAN (MAXVALUE)
+);
+
+ALTER TABLE TRANSFERENCIA
+PARTITION BY RANGE COLUMNS (data_hora) (
+    PARTITION p_antigas VALUES LESS THAN ('2026-01-01'),
+    PARTITION p_futuras VALUES LESS THAN (MAXVALUE)
+);
@@ -0,0 +1,20 @@
+-- =========================================================
+--  Saldo em fatias para carteiras quentes
+--  Para bancos criados antes de SALDO_CARTEIRA_FATIA entrar no DDL.
+--  Marcar uma carteira: python -m api.jobs.carteiras_quentes marcar <endereco>
+-- =========================================================
+
+USE wallet_homolog;
+
+ALTER TABLE CARTEIRA
+    ADD COLUMN fatias_saldo SMALLINT NOT NULL DEFAULT 0,
+    ALGORITHM=INSTANT;
+
+CREATE TABLE SALDO_CARTEIRA_FATIA (
+    endereco_carteira VARCHAR(255) NOT NULL,
+    id_moeda SMALLINT NOT NULL,
+    fatia SMALLINT NOT NULL,
+    saldo DECIMAL(18, 8) NOT NULL DEFAULT 0.0,
+    PRIMARY KEY (endereco_carteira, id_moeda, fatia),
+    FOREIGN KEY (endereco_carteira, id_moeda) REFERENCES SALDO_CARTEIRA(endereco_carteira, id_moeda)
+);
@@ -0,0 +1,21 @@
+-- =========================================================
+--  Checkpoint da reconciliação de saldos
+--  Para bancos criados antes de RECONCILIACAO_* entrar no DDL.
+--  Executar: python -m api.jobs.reconciliacao --processos 4
+-- =========================================================
+
+USE wallet_homolog;
+
+CREATE TABLE RECONCILIACAO_SALDO (
+    endereco_carteira VARCHAR(255) NOT NULL,
+    id_moeda SMALLINT NOT NULL,
+    total DECIMAL(30, 8) NOT NULL,
+    PRIMARY KEY (endereco_carteira, id_moeda)
+);
+
+CREATE TABLE RECONCILIACAO_FAIXA (
+    inicio VARCHAR(255) NOT NULL,
+    fim VARCHAR(255) NULL,
+    processado_ate DATETIME NOT NULL,
+    PRIMARY KEY (inicio)
+);
@@ -0,0 +1,20 @@
+-- =========================================================
+--  Outbox de eventos de saldo (SSE em /carteiras/{endereco}/eventos)
+--  Para bancos criados antes de EVENTO_SALDO entrar no DDL.
+-- =========================================================
+
+USE wallet_homolog;
+
+CREATE TABLE EVENTO_SALDO (
+    id_evento BIGINT NOT NULL AUTO_INCREMENT,
+    endereco_carteira VARCHAR(255) NOT NULL,
+    tipo ENUM('DEPOSITO', 'SAQUE', 'CONVERSAO', 'TRANSFERENCIA') NOT NULL,
+    id_moeda SMALLINT NOT NULL,
+    valor DECIMAL(18, 8) NOT NULL,            -- variação do saldo (negativo = débito)
+    saldo DECIMAL(18, 8) NOT NULL,            -- saldo depois da movimentação
+    endereco_contraparte VARCHAR(255) NULL,   -- transferências
+    data_hora DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id_evento),
+    -- retomada do SSE (Last-Event-ID) por carteira
+    INDEX idx_evento_saldo_carteira (endereco_carteira, id_evento)
+);
@@ -0,0 +1,16 @@
+-- =========================================================
+--  Versão dos saldos (ETag / If-None-Match em /carteiras/{endereco})
+--  Para bancos criados antes de SALDO_CARTEIRA.versao entrar no DDL.
+--  data_atualizacao já existia em SALDO_CARTEIRA, mas nunca era atualizada.
+-- =========================================================
+
+USE wallet_homolog;
+
+ALTER TABLE SALDO_CARTEIRA
+    ADD COLUMN versao BIGINT NOT NULL DEFAULT 0,
+    ALGORITHM=INSTANT;
+
+ALTER TABLE SALDO_CARTEIRA_FATIA
+    ADD COLUMN versao BIGINT NOT NULL DEFAULT 0,
+    ADD COLUMN data_atualizacao DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    ALGORITHM=INSTANT;
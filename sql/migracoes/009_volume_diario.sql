@@ -0,0 +1,36 @@
+-- =========================================================
+--  Volume diário por moeda e tipo (GET /relatorios/volume)
+--  Para bancos criados antes de VOLUME_DIARIO entrar no DDL.
+--  Carga inicial: python -m api.jobs.volume_diario --recalcular
+-- =========================================================
+
+USE wallet_homolog;
+
+-- o job lê só as movimentações desde o checkpoint
+ALTER TABLE DEPOSITO_SAQUE
+    ADD INDEX idx_deposito_saque_data_hora (data_hora),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE CONVERSAO
+    ADD INDEX idx_conversao_data_hora (data_hora),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE TRANSFERENCIA
+    ADD INDEX idx_transferencia_data_hora (data_hora),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+CREATE TABLE VOLUME_DIARIO (
+    dia DATE NOT NULL,
+    id_moeda SMALLINT NOT NULL,
+    tipo ENUM('DEPOSITO', 'SAQUE', 'CONVERSAO', 'TRANSFERENCIA') NOT NULL,
+    quantidade BIGINT NOT NULL,
+    volume DECIMAL(30, 8) NOT NULL,
+    taxas DECIMAL(30, 8) NOT NULL,
+    PRIMARY KEY (dia, id_moeda, tipo)
+);
+
+CREATE TABLE VOLUME_DIARIO_CHECKPOINT (
+    id TINYINT NOT NULL,
+    processado_ate DATETIME NOT NULL,
+    PRIMARY KEY (id)
+);
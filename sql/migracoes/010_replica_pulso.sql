@@ -0,0 +1,14 @@
+-- =========================================================
+--  Pulso da réplica de leitura (DB_REPLICA_HOST)
+--  O atraso era lido de SHOW REPLICA STATUS, que exige privilégio de
+--  replicação que o usuário da API não tem; agora vem desta tabela.
+--  Aplique no primário: a réplica recebe pela replicação.
+-- =========================================================
+
+USE wallet_homolog;
+
+CREATE TABLE IF NOT EXISTS REPLICA_PULSO (
+    id TINYINT NOT NULL,                   -- sempre 1
+    batida DATETIME(6) NOT NULL,
+    PRIMARY KEY (id)
+);
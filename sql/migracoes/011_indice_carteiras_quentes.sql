@@ -0,0 +1,11 @@
+-- =========================================================
+--  Índice das carteiras quentes
+--  Cada worker relê CARTEIRA WHERE fatias_saldo > 1 a cada
+--  CARTEIRAS_QUENTES_TTL_SEGUNDOS; sem índice, é uma varredura da tabela.
+-- =========================================================
+
+USE wallet_homolog;
+
+ALTER TABLE CARTEIRA
+    ADD INDEX idx_carteira_fatias (fatias_saldo),
+    ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,28 @@
+-- =========================================================
+--  Índices do extrato com todas as colunas da página
+--  Os índices de 003_indices_extrato.sql param na moeda: cada linha da
+--  página ainda ia à chave primária buscar valor, taxa e contraparte.
+--  Estes cobrem o SELECT inteiro de cada ramo do extrato.
+-- =========================================================
+
+USE wallet_homolog;
+
+ALTER TABLE DEPOSITO_SAQUE
+    DROP INDEX idx_deposito_saque_extrato,
+    ADD INDEX idx_deposito_saque_extrato (endereco_carteira, data_hora, id_movimento, id_moeda, tipo, valor, taxa_valor),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE CONVERSAO
+    DROP INDEX idx_conversao_extrato,
+    ADD INDEX idx_conversao_extrato (endereco_carteira, data_hora, id_conversao, id_moeda_origem, id_moeda_destino,
+                                     valor_origem, valor_destino, taxa_valor),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE TRANSFERENCIA
+    DROP INDEX idx_transferencia_origem_extrato,
+    DROP INDEX idx_transferencia_destino_extrato,
+    ADD INDEX idx_transferencia_origem_extrato (endereco_origem, data_hora, id_transferencia, id_moeda,
+                                                valor, taxa_valor, endereco_destino),
+    ADD INDEX idx_transferencia_destino_extrato (endereco_destino, data_hora, id_transferencia, id_moeda,
+                                                 valor, endereco_origem),
+    ALGORITHM=INPLACE, LOCK=NONE;